@@ -1,6 +1,8 @@
 import numpy as np
-from scipy import sparse as sp
-import matplotlib.pyplot as plt
+from meshGeometry import loadMesh
+from parametrisedOperators import affineOperator, parameterSets
+from linearSolvers import solveLinearSystem, factorisation
+from instrumentation import timed
 
 '''
 Solving u .∇Ψ = S + D ΔΨ
@@ -249,17 +251,33 @@ def force(xe, S):
         output[i] = globalQuadrature(xe, integrand)
     return output
         
-def TwoDimStaticAdvDiffFESolver(S, u, D, resolution):
+@timed('static_solve')
+def TwoDimStaticAdvDiffFESolver(S, u, D, resolution, kernels='analytic',
+                                linear_solver='direct', solver_options=None,
+                                return_report=False):
     """
     Solves the 2D steady-state advection-diffusion equation using the finite 
     element method.
 
     Parameters:
     S (function): Source term function that takes global coordinates as input 
-                  and returns a scalar value.
+                  and returns a scalar value. It is evaluated at all quadrature
+                  points at once if written with array operations, and 
+                  otherwise point by point (see elementKernels.sourceValues).
     u (array-like): Advection velocity vector [ms^-1].
     D (float): Diffusion coefficient [m^2s^-1].
     resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'. See elementKernels.py.
+    linear_solver (string, optional): Linear solver backend, 'direct' (default),
+                                      'gmres', 'bicgstab' or 'auto'. See
+                                      linearSolvers.py.
+    solver_options (dict, optional): Extra keyword arguments for 
+                                     linearSolvers.solveLinearSystem, e.g. 
+                                     {'preconditioning': 'jacobi'}.
+    return_report (bool, optional): Also return the SolveReport (iterations,
+                                    residual, wall time) of the linear solve.
+                                    Default is False.
 
     Returns:
     tuple: A tuple containing the following elements:
@@ -269,68 +287,131 @@ def TwoDimStaticAdvDiffFESolver(S, u, D, resolution):
                                             southern border.
            - Psi_A (np.ndarray): Array of computed solution values at the nodes, 
                                  normalised.
+           - report (SolveReport): Only if return_report is True.
                                  
     Note: the advection velocity must be entered as the negative of the desired
     value due to an error with the IEN construction provided!
     """
-    # Read in data
-    nodes = np.loadtxt(f'las_grids/las_nodes_{resolution}k.txt')
-    IEN = np.loadtxt(f'las_grids/las_IEN_{resolution}k.txt', dtype=np.int64)
-    boundary_nodes = np.loadtxt(f'las_grids/las_bdry_{resolution}k.txt', dtype=np.int64)
-
-    # locate southern boarder for Dirichlet BC
-    southern_boarder = np.where(nodes[boundary_nodes,1] <= 110000)[0]
-     
-    # Set all nodes in 'southern_boarder' to be ignored by the solver
-    ID = np.zeros(len(nodes), dtype=np.int64)
-    n_eq = 0
-    for i in range(len(nodes[:, 1])):
-        if i in southern_boarder:
-            ID[i] = -1
-        else:
-            ID[i] = n_eq
-            n_eq += 1
-    
-    N_equations = np.max(ID)+1
-    N_elements = IEN.shape[0]
-    N_nodes = nodes.shape[0]
-
-    nodes = nodes.T
-    
-    # Location matrix
-    LM = np.zeros_like(IEN.T)
-    for e in range(N_elements):
-        for a in range(3):
-            LM[a,e] = ID[IEN[e,a]]
-            
-    # Global stiffness matrix and force vector. Calling sparse for memory efficiency
-    K = sp.lil_matrix((N_equations, N_equations))
-    F = np.zeros((N_equations,))
-    # Loop over elements
-    for e in range(N_elements):
-        # compute the individual contriubtions from each element
-        k_e = stiffness(nodes[:,IEN[e,:]], D, u)
-        f_e = force(nodes[:,IEN[e,:]], S)
-        for a in range(3):
-            A = LM[a, e]
-            for b in range(3):
-                B = LM[b, e]
-            # if not on a BC node, assemble full stiffness and force arrays
-                if (A >= 0) and (B >= 0):
-                    K[A, B] += k_e[a, b]
-            if (A >= 0):
-                F[A] += f_e[a]
+    # Mesh, equation numbering and element geometry are built once per grid and
+    # shared between calls (see meshGeometry.py)
+    mesh = loadMesh(resolution)
+    nodes, IEN, southern_boarder = mesh.nodes, mesh.IEN, mesh.dirichlet_nodes
     
+    # Global stiffness matrix and force vector. K is formed from the diffusion
+    # and advection matrices of the mesh, which are only assembled once (see
+    # parametrisedOperators.py)
+    operator = affineOperator(mesh, kernels)
+    K = operator.stiffness(u, D)
+    F = operator.force(S)
     
-    # Solve
-    K = sp.csr_matrix(K)
-    Psi_interior = sp.linalg.spsolve(K, F)
-    Psi_A = np.zeros(N_nodes)
-    for n in range(N_nodes):
-        if ID[n] >= 0: # Otherwise, Psi_A is homogeneous Dirichlet
-            Psi_A[n] = Psi_interior[ID[n]]
+    # Solve, with direct solves reusing the factorisation of K from any earlier
+    # call with the same grid and parameters (see linearSolvers.py)
+    solver_options = dict(solver_options or {})
+    if linear_solver == 'direct' and 'lu' not in solver_options:
+        solver_options['lu'] = factorisation(operator, u, D, 
+                                             solver_options.get('permc_spec', 'COLAMD'))
+    Psi_interior, report = solveLinearSystem(K, F, linear_solver, **solver_options)
+    Psi_A = mesh.scatter(Psi_interior)
             
     # normalising
     Psi_A = 1/max(Psi_A)*Psi_A
     
+    if return_report:
+        return nodes, IEN, southern_boarder, Psi_A, report
     return nodes, IEN, southern_boarder, Psi_A
+
+def TwoDimStaticAdvDiffFESweep(S, us, Ds, resolution, kernels='analytic',
+                               linear_solver='direct', solver_options=None):
+    """
+    Solves the 2D steady-state advection-diffusion equation for many sets of
+    parameters (wind and diffusion coefficient) on the same grid and source.
+    
+    The mesh matrices and force vector are assembled once, and the stiffness
+    matrix of each parameter set is formed as a sparse linear combination of them.
+
+    Parameters:
+    S (function): Source term function, written with array operations.
+    us (array-like): An (n, 2) array of advection velocity vectors [ms^-1], or
+                     a single one to be used with every D.
+    Ds (float or array-like): n diffusion coefficients [m^2s^-1], or a single
+                              one to be used with every u.
+    resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'.
+    linear_solver (string, optional): Linear solver backend, see
+                                      TwoDimStaticAdvDiffFESolver. Krylov 
+                                      solvers are warm-started from the previous
+                                      parameter set's solution.
+    solver_options (dict, optional): Extra keyword arguments for 
+                                     linearSolvers.solveLinearSystem.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - nodes (np.ndarray): Array of node coordinates.
+           - IEN (np.ndarray): Array of element connectivity.
+           - southern_boarder (np.ndarray): Array of indices of nodes on the 
+                                            southern border.
+           - Psis (np.ndarray): An (N_nodes, n) array whose columns are the 
+                                normalised solutions for each parameter set.
+                                 
+    Note: as for TwoDimStaticAdvDiffFESolver, the advection velocities must be
+    entered as the negative of the desired value.
+    """
+    mesh = loadMesh(resolution)
+    operator = affineOperator(mesh, kernels)
+    F = operator.force(S)
+    us, Ds = parameterSets(us, Ds)
+    
+    Psis = np.zeros((mesh.N_nodes, len(Ds)))
+    Psi_interior = None
+    for i in range(len(Ds)):
+        Psi_interior, report = solveLinearSystem(operator.stiffness(us[i], Ds[i]), F,
+                                                 linear_solver, x0=Psi_interior,
+                                                 **(solver_options or {}))
+        Psi_A = mesh.scatter(Psi_interior)
+        Psis[:,i] = 1/max(Psi_A)*Psi_A
+    
+    return mesh.nodes, mesh.IEN, mesh.dirichlet_nodes, Psis
+
+def TwoDimStaticAdvDiffFEMultiSource(Ss, u, D, resolution, kernels='analytic',
+                                     permc_spec='COLAMD'):
+    """
+    Solves the 2D steady-state advection-diffusion equation for many source 
+    terms (e.g. fire locations, strengths or widths) with the same grid, wind 
+    and diffusion coefficient.
+    
+    K is factorised once (or taken from the cache of factorisations, see 
+    linearSolvers.py) and all the force vectors are solved for at once, so each
+    extra source only costs an assembly of F and a pair of triangular solves.
+
+    Parameters:
+    Ss (list): Source term functions, written with array operations.
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'.
+    permc_spec (string, optional): SuperLU column ordering. Default is 'COLAMD'.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - nodes (np.ndarray): Array of node coordinates.
+           - IEN (np.ndarray): Array of element connectivity.
+           - southern_boarder (np.ndarray): Array of indices of nodes on the 
+                                            southern border.
+           - Psis (np.ndarray): An (N_nodes, len(Ss)) array whose columns are
+                                the normalised solutions for each source.
+                                 
+    Note: as for TwoDimStaticAdvDiffFESolver, the advection velocity must be
+    entered as the negative of the desired value.
+    """
+    mesh = loadMesh(resolution)
+    operator = affineOperator(mesh, kernels)
+    Fs = operator.forces(Ss)
+    
+    Psis = mesh.scatter(factorisation(operator, u, D, permc_spec).solve(Fs))
+    
+    # normalising each solution
+    Psis = Psis/np.max(Psis, axis=0)
+    
+    return mesh.nodes, mesh.IEN, mesh.dirichlet_nodes, Psis
@@ -1,8 +1,10 @@
 import numpy as np
-from scipy import sparse as sp
-from scipy import integrate
-from TwoDimStaticAdvDiffFESolver import (globalShapeFunctions, globalQuadrature, 
-                                         stiffness, force)
+from TwoDimStaticAdvDiffFESolver import globalShapeFunctions, globalQuadrature
+from meshGeometry import loadMesh
+from parametrisedOperators import affineOperator, parameterSets
+from timeIntegrators import implicitFrames, exponentialFrames, rk45Frames
+from outputSinks import MemorySink, ReceptorSink
+from instrumentation import phase, timed, count
 
 '''
 Solving ∂Ψ/∂t + u .∇Ψ = S + D ΔΨ
@@ -27,18 +29,40 @@ def mass(xe):
             output[i,j] = globalQuadrature(xe, phi)
     return output
 
-def TwoDimTimeEvolvedAdvDiffFESolver(S, u, D, resolution, t_max):
+@timed('time_evolved_solve')
+def TwoDimTimeEvolvedAdvDiffFESolver(S, u, D, resolution, t_max, kernels='analytic',
+                                     mass_solver='lu', integrator='RK45',
+                                     integrator_options=None, sink=None):
     """
     Solves the 2D time-dependent advection-diffusion equation using the finite 
     element method.
 
     Parameters:
     S (function): Source term function that takes global coordinates as input 
-                  and returns a scalar value.
+                  and returns a scalar value. It is evaluated at all quadrature
+                  points at once if written with array operations, and 
+                  otherwise point by point (see elementKernels.sourceValues).
     u (array-like): Advection velocity vector [ms^-1].
     D (float): Diffusion coefficient [m^2s^-1].
     resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
     t_max (float): Maximum runtime of the simulation [s].
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'. See elementKernels.py.
+    mass_solver (string, optional): How M^-1 is applied, 'lu' (default), 'cg'
+                                    or 'lumped'. See massSolvers.py.
+    integrator (string, optional): Time integrator, 'RK45' (default), one of
+                                   the implicit 'backward_euler', 
+                                   'crank_nicolson', 'theta' or 'bdf2', or
+                                   'exponential' for the closed-form solution
+                                   without timestepping. See timeIntegrators.py.
+    integrator_options (dict, optional): Extra keyword arguments for the 
+                                         implicit integrators, i.e. the largest
+                                         step 'dt' [s] (default one step per 
+                                         output time) and 'theta'.
+    sink (optional): Where the normalised solution at each output time is 
+                     written as soon as it is computed, e.g. to a file or only 
+                     at some receptors. Default is None, meaning in memory. See
+                     outputSinks.py.
 
     Returns:
     tuple: A tuple containing the following elements:
@@ -48,100 +72,219 @@ def TwoDimTimeEvolvedAdvDiffFESolver(S, u, D, resolution, t_max):
                                             southern border.
            - ts (np.ndarray): Array of timesteps at which the solution was evaluated.
            - Psi_A (np.ndarray): Array of computed solution values at the nodes, 
-                                 normalised.
+                                 normalised (or whatever the sink returns).
                                  
     Note: the advection velocity must be entered as the negative of the desired
     value due to an error with the IEN construction provided!
     
-    Note also: there is a reasonable amount of code duplicate between this and 
-    the static solver. Ideally there would be an assembly() function that removes
-    most of the copying but I didn't have time to find a way to have it deal with
-    the optional-ness of mass(). There is definitely a way to do it, but oh well...
+    Note also: the assembly itself is shared with the static solver through
+    parametrisedOperators.py, with the mass matrix assembled as just another
+    stack of element matrices.
     """
-    # Read in data
-    nodes = np.loadtxt(f'las_grids/las_nodes_{resolution}k.txt')
-    IEN = np.loadtxt(f'las_grids/las_IEN_{resolution}k.txt', dtype=np.int64)
-    boundary_nodes = np.loadtxt(f'las_grids/las_bdry_{resolution}k.txt', dtype=np.int64)
-
-    # locate southern boarder for Dirichlet BC
-    southern_boarder = np.where(nodes[boundary_nodes,1] <= 110000)[0]
-     
-    # Set all nodes in 'southern_boarder' to be ignored by the solver
-    ID = np.zeros(len(nodes), dtype=np.int64)
-    n_eq = 0
-    for i in range(len(nodes[:, 1])):
-        if i in southern_boarder:
-            ID[i] = -1
-        else:
-            ID[i] = n_eq
-            n_eq += 1
+    # Mesh, equation numbering and element geometry are built once per grid and
+    # shared between calls (see meshGeometry.py)
+    mesh = loadMesh(resolution)
     
-    N_equations = np.max(ID)+1
-    N_elements = IEN.shape[0]
-    N_nodes = nodes.shape[0]
-
-    nodes = nodes.T
+    # Global matrices and force vector. K is formed from the diffusion and 
+    # advection matrices of the mesh, which are only assembled once (see
+    # parametrisedOperators.py)
+    operator = affineOperator(mesh, kernels)
+    K = operator.stiffness(u, D)
+    F = operator.force(S)
+    # Solves with the mass matrix for timestepping. M^-1 is dense, so is never
+    # formed
+    mass_solve = operator.massSolver(mass_solver)
     
-    # Location matrix
-    LM = np.zeros_like(IEN.T)
-    for e in range(N_elements):
-        for a in range(3):
-            LM[a,e] = ID[IEN[e,a]]
-            
-    # Global matrices and force vector. Calling sparse for memory efficiency
-    M = sp.lil_matrix((N_equations, N_equations))
-    K = sp.lil_matrix((N_equations, N_equations))
-    F = np.zeros((N_equations,))
-    # Loop over elements
-    for e in range(N_elements):
-        # compute the individual contriubtions from each element
-        m_e = mass(nodes[:,IEN[e,:]])
-        k_e = stiffness(nodes[:,IEN[e,:]], D, u)
-        f_e = force(nodes[:,IEN[e,:]], S)
-        for a in range(3):
-            A = LM[a, e]
-            for b in range(3):
-                B = LM[b, e]
-            # if not on a BC node, assemble full matrices and force vector
-                if (A >= 0) and (B >= 0):
-                    M[A, B] += m_e[a, b]
-                    K[A, B] += k_e[a, b]
-            if (A >= 0):
-                F[A] += f_e[a]
+    ts, Psi = timeEvolve(mesh, mass_solve, K, F, u, resolution, t_max, integrator,
+                         integrator_options, sink)
     
-    # Store matrices for timestepping
-    K = sp.csr_matrix(K)
-    M = sp.csc_matrix(M)
-    M_inv = sp.linalg.inv(M)
+    return mesh.nodes, mesh.IEN, mesh.dirichlet_nodes, ts, Psi
+
+def TwoDimTimeEvolvedAdvDiffFEReceptors(S, u, D, resolution, t_max, receptors,
+                                        keep_final=False, kernels='analytic',
+                                        mass_solver='lu', integrator='RK45',
+                                        integrator_options=None):
+    """
+    Solves the 2D time-dependent advection-diffusion equation, keeping only the
+    normalised solution at a set of receptors (and optionally at the final time
+    everywhere), so the field history is never stored.
+
+    Parameters:
+    S (function): Source term function, written with array operations.
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    t_max (float): Maximum runtime of the simulation [s].
+    receptors (array-like): A 2xN_receptors array (or a 2-element array) of
+                            receptor coordinates.
+    keep_final (bool, optional): Also return the normalised solution at t_max
+                                 at every node. Default is False.
+    kernels, mass_solver, integrator, integrator_options (optional): As for 
+        TwoDimTimeEvolvedAdvDiffFESolver.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - ts (np.ndarray): Array of timesteps at which the solution was evaluated.
+           - values (np.ndarray): An (N_receptors, 201) array of the normalised
+                                  solution at each receptor.
+           - Psi_final (np.ndarray): Only if keep_final is True, the normalised
+                                     solution at every node at t_max.
+                                 
+    Note: as for TwoDimTimeEvolvedAdvDiffFESolver, the advection velocity must be
+    entered as the negative of the desired value.
+    """
+    R = loadMesh(resolution).pointLocator.interpolationMatrix(receptors)
+    sink = ReceptorSink(R, keep_final)
+    ts, values = TwoDimTimeEvolvedAdvDiffFESolver(S, u, D, resolution, t_max, kernels,
+                                                  mass_solver, integrator,
+                                                  integrator_options, sink)[3:]
+    if keep_final:
+        return ts, values, sink.final
+    return ts, values
+
+def numericResolution(resolution):
+    """
+    Extracts the numerical value of a string grid resolution.
+
+    Parameters:
+    resolution (string): Grid resolution, e.g. '1_25'.
+
+    Returns:
+    float: The resolution in metres, e.g. 1250.
+    """
+    return float(resolution.replace('_', '.'))*1000
+
+def timeEvolve(mesh, mass_solve, K, F, u, resolution, t_max, integrator='RK45',
+               integrator_options=None, sink=None):
+    """
+    Integrates M dpsi/dt = F - K psi from zero initial data and samples the 
+    normalised solution at 201 equally spaced times.
+
+    Parameters:
+    mesh (Mesh): The mesh the system is assembled on.
+    mass_solve (MassSolver): Solver for the mass matrix, see massSolvers.py.
+    K (sp.spmatrix): Global stiffness matrix.
+    F (np.ndarray): Global force vector.
+    u (array-like): Advection velocity vector [ms^-1], which sets the step size.
+    resolution (string): Grid resolution, which sets the step size.
+    t_max (float): Maximum runtime of the simulation [s].
+    integrator (string, optional): 'RK45' (default), 'backward_euler', 
+                                   'crank_nicolson', 'theta', 'bdf2' or 
+                                   'exponential'.
+    integrator_options (dict, optional): Extra keyword arguments for the 
+                                         implicit or exponential integrators.
+    sink (optional): Output sink the normalised frames are written to as they
+                     are computed, see outputSinks.py. Default is None, meaning
+                     a MemorySink.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - ts (np.ndarray): Array of timesteps at which the solution was 
+                              evaluated (those kept by the sink).
+           - Psi (np.ndarray): The result of the sink, by default an 
+                               (N_nodes, 201) array of normalised solutions.
+    """
+    ID = mesh.ID
+    ts = np.linspace(0, t_max, 201)
     
-    # Initial condition for Psi_A
-    Psi_A = np.zeros(N_nodes)
-    def rhs(t, psi):
-        dpsidt = np.zeros_like(psi)
-        dpsidt[ID >= 0] = M_inv @ (F - K @ psi[ID >= 0])
-        return dpsidt
+    # Each integrator yields the solution at one output time after another
+    if integrator == 'RK45':
+        # Initial condition for Psi_A
+        Psi_A = np.zeros(mesh.N_nodes)
+        def rhs(t, psi):
+            count('rhs_evaluations')
+            dpsidt = np.zeros_like(psi)
+            dpsidt[ID >= 0] = mass_solve.solve(F - K @ psi[ID >= 0])
+            return dpsidt
+        
+        numeric_res = numericResolution(resolution)
     
-    # extract numerical value from string resolution. (There is definitely a more
-    # elegant way to do this...)
-    if resolution == '1_25':
-        numeric_res = 1250
-    elif resolution == '2_5':
-        numeric_res = 2500
+        # Run RK45 timestepping, interpolating y at linearly spaced times for
+        # consistent array size
+        frames = rk45Frames(rhs, Psi_A, ts,
+                            max_step= 0.5*np.sqrt(numeric_res)/np.linalg.norm(u))
+    elif integrator == 'exponential':
+        # the output times from the matrix exponential
+        frames = map(mesh.scatter, exponentialFrames(mass_solve, K, F, ts,
+                                                     **(integrator_options or {})))
     else:
-        numeric_res = int(resolution)*1000
+        # implicit steps land on the output times, with factorisations reused
+        # between steps
+        frames = map(mesh.scatter, implicitFrames(mass_solve.matrix, K, F, ts, 
+                                                  integrator,
+                                                  **(integrator_options or {})))
+    
+    sink = MemorySink() if sink is None else sink
+    sink.open(mesh.N_nodes, ts)
+    # the integrators only work as the frames are asked for, so this times them
+    with phase('time_integration', integrator=integrator):
+        for i, ys in enumerate(frames):
+            # normalising
+            if i == 0:
+                sink.write(i, np.zeros_like(ys))
+            else:
+                sink.write(i, 1/max(ys) * ys)
+    
+    return sink.ts, sink.close()
 
-    # Run RK45 timestepping
-    soln = integrate.solve_ivp(rhs, [0, t_max], Psi_A, method='RK45',
-                               max_step= 0.5*np.sqrt(numeric_res)/np.linalg.norm(u)
-                               ,dense_output=True)
-    # interpolate y at linearly spaced times for consistent array size
-    ts = np.linspace(0, t_max, 201)
-    ys = soln.sol(ts)
+def TwoDimTimeEvolvedAdvDiffFESweep(S, us, Ds, resolution, t_max, kernels='analytic',
+                                    mass_solver='lu', integrator='RK45',
+                                    integrator_options=None, sink_factory=None):
+    """
+    Solves the 2D time-dependent advection-diffusion equation for many sets of
+    parameters (wind and diffusion coefficient) on the same grid and source.
     
-    # normalising
-    Psi = np.zeros_like(ys)
-    for i in range(1,201):
-        Psi[:,i] = 1/max(ys[:,i]) * ys[:,i]
+    The mesh matrices, force vector and mass solver are prepared once,
+    and the stiffness matrix of each parameter set is formed as a sparse linear
+    combination of the diffusion and advection matrices.
+
+    Parameters:
+    S (function): Source term function, written with array operations.
+    us (array-like): An (n, 2) array of advection velocity vectors [ms^-1], or
+                     a single one to be used with every D.
+    Ds (float or array-like): n diffusion coefficients [m^2s^-1], or a single
+                              one to be used with every u.
+    resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    t_max (float): Maximum runtime of the simulation [s].
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'.
+    mass_solver (string, optional): How M^-1 is applied, 'lu' (default), 'cg'
+                                    or 'lumped'.
+    integrator (string, optional): Time integrator, see 
+                                   TwoDimTimeEvolvedAdvDiffFESolver.
+    integrator_options (dict, optional): Extra keyword arguments for the 
+                                         implicit integrators.
+    sink_factory (function, optional): Called with the index of each parameter
+                                       set to make its output sink (see 
+                                       outputSinks.py). Default is None, meaning
+                                       all solutions are kept in memory.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - nodes (np.ndarray): Array of node coordinates.
+           - IEN (np.ndarray): Array of element connectivity.
+           - southern_boarder (np.ndarray): Array of indices of nodes on the 
+                                            southern border.
+           - ts (np.ndarray): Array of timesteps at which the solution was evaluated.
+           - Psis (np.ndarray or list): An (n, N_nodes, 201) array of normalised 
+                                        solutions, one per parameter set, or 
+                                        with sink_factory the list of what each
+                                        sink returned.
+    """
+    mesh = loadMesh(resolution)
+    operator = affineOperator(mesh, kernels)
+    F = operator.force(S)
+    mass_solve = operator.massSolver(mass_solver)
+    us, Ds = parameterSets(us, Ds)
+    
+    if sink_factory is None:
+        Psis = np.zeros((len(Ds), mesh.N_nodes, 201))
+    else:
+        Psis = [None]*len(Ds)
+    for i in range(len(Ds)):
+        ts, Psis[i] = timeEvolve(mesh, mass_solve, operator.stiffness(us[i], Ds[i]), 
+                                 F, us[i], resolution, t_max, integrator,
+                                 integrator_options, 
+                                 None if sink_factory is None else sink_factory(i))
     
-    return nodes, IEN, southern_boarder, ts, Psi
-    
\ No newline at end of file
+    return mesh.nodes, mesh.IEN, mesh.dirichlet_nodes, ts, Psis
@@ -0,0 +1,143 @@
+import numpy as np
+from meshGeometry import loadMesh
+from parametrisedOperators import affineOperator
+from linearSolvers import factorisation
+from elementKernels import (batchedQuadraturePoints, quadrature_shape_functions,
+                            quadrature_weights)
+
+'''
+Adjoint (backward) solves for receptor values of the static problem.
+
+The (unnormalised) pollution at a receptor is a linear functional of the
+solution, r . psi, where r is the receptor's row of the interpolation matrix
+restricted to the equations. With K psi = F,
+
+    r . psi = r . K^-1 F = lambda . F,    K^T lambda = r
+
+so one solve with K^T gives the receptor value for every source at the cost of
+assembling its force vector. Since F_A = integral(S N_A), lambda . F is the
+integral of S times the field lambda_h = sum_A lambda_A N_A: the influence map,
+i.e. how much a unit of pollution released at each point contributes at the
+receptor.
+
+The adjoint solves reuse the LU factorisation of K (SuperLU solves with the
+transpose directly), so they are shared with forward solves for the same grid
+and parameters.
+'''
+
+class ReceptorAdjoint:
+    """
+    The adjoint solutions of a set of receptors for one grid, wind and D.
+
+    Attributes:
+    operator (AffineOperator): The operator on the mesh.
+    receptors (np.ndarray): A 2xN_receptors array of receptor coordinates.
+    Lambda (np.ndarray): An (N_equations, N_receptors) array of adjoint
+                         solutions, one per receptor.
+    """
+    __slots__ = ('operator', 'receptors', 'Lambda')
+
+    def __init__(self, operator, receptors, u, D):
+        """
+        Solves K^T lambda = r for each receptor.
+
+        Parameters:
+        operator (AffineOperator): The operator on the mesh.
+        receptors (array-like): A 2xN_receptors array (or a 2-element array) of
+                                receptor coordinates.
+        u (array-like): Advection velocity vector [ms^-1].
+        D (float): Diffusion coefficient [m^2s^-1].
+        """
+        mesh = operator.mesh
+        self.operator = operator
+        self.receptors = np.asarray(receptors, dtype=float).reshape(2, -1)
+        R = mesh.pointLocator.interpolationMatrix(self.receptors)
+        # rows of R on the equations (psi is zero on the Dirichlet nodes)
+        free = mesh.ID >= 0
+        r = np.zeros((mesh.N_equations, R.shape[0]))
+        r[mesh.ID[free]] = R[:, free].T.toarray()
+        self.Lambda = factorisation(operator, u, D).solve(r, trans='T')
+
+    def influenceMap(self):
+        """
+        The adjoint solutions at every node.
+
+        Returns:
+        np.ndarray: An (N_nodes, N_receptors) array, zero on the Dirichlet nodes.
+        """
+        return self.operator.mesh.scatter(self.Lambda)
+
+    def quadratureFunctional(self):
+        """
+        Writes lambda . F as a weighted sum of the source values at the
+        quadrature points, lambda . F = sum_q S(x_q) C[q], with the same
+        quadrature as the force vector.
+
+        Returns:
+        tuple: A tuple containing the following elements:
+               - points (np.ndarray): A (2, 3*N_elements) array of quadrature
+                                      points, in the order batched_force
+                                      evaluates S at them.
+               - C (np.ndarray): A (3*N_elements, N_receptors) array of weights,
+                                 the influence map at each point times its
+                                 quadrature weight.
+        """
+        mesh = self.operator.mesh
+        points = batchedQuadraturePoints(mesh.xes).transpose(1, 0, 2).reshape(2, -1)
+        # influence map at the quadrature points, C[e,q,r] = sum_a N_a(xi_q) lambda_r[IEN[e,a]]
+        Lambda_elements = self.influenceMap()[mesh.IEN]
+        C = np.einsum('qa,ear->eqr', quadrature_shape_functions, Lambda_elements)
+        C *= (quadrature_weights[np.newaxis, :]*2*mesh.areas[:, np.newaxis])[..., np.newaxis]
+        return points, C.reshape(-1, C.shape[2])
+
+    def values(self, Ss):
+        """
+        The (unnormalised) pollution at each receptor for each source term,
+        without a forward solve.
+
+        Parameters:
+        Ss (function or list): A source term function, or a list of them,
+                               written with array operations.
+
+        Returns:
+        np.ndarray: An (N_receptors,) array of values for a single source, or an
+                    (N_receptors, len(Ss)) array for a list of them.
+        """
+        if callable(Ss):
+            return self.Lambda.T @ self.operator.force(Ss)
+        return self.Lambda.T @ self.operator.forces(Ss)
+
+def TwoDimStaticAdvDiffFEAdjoint(receptors, u, D, resolution, kernels='analytic'):
+    """
+    Solves the adjoint of the 2D steady-state advection-diffusion equation for
+    a set of receptors.
+
+    Parameters:
+    receptors (array-like): A 2xN_receptors array (or a 2-element array) of
+                            receptor coordinates, e.g. Reading.
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - nodes (np.ndarray): Array of node coordinates.
+           - IEN (np.ndarray): Array of element connectivity.
+           - southern_boarder (np.ndarray): Array of indices of nodes on the
+                                            southern border.
+           - adjoint (ReceptorAdjoint): The adjoint solutions, whose
+                                        influenceMap() can be plotted like a
+                                        solution and whose values(Ss) give the
+                                        pollution at the receptors for any
+                                        sources.
+
+    Note: the values are those of the unnormalised solution, as normalising by
+    the maximum over the grid is not linear in the source. As for
+    TwoDimStaticAdvDiffFESolver, the advection velocity must be entered as the
+    negative of the desired value.
+    """
+    mesh = loadMesh(resolution)
+    adjoint = ReceptorAdjoint(affineOperator(mesh, kernels), receptors, u, D)
+    return mesh.nodes, mesh.IEN, mesh.dirichlet_nodes, adjoint
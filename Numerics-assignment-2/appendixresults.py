@@ -16,5 +16,7 @@ reading = np.array([473993, 171625])
 # Max runtime (secs)
 t_max = 15000
 
-convergence(t_max, -10*north, D, reading)
-convergence(t_max, -10*directed_at_reading, D, reading)
\ No newline at end of file
+# The exponential integrator gives the solution at every output time without
+# timestepping, so this takes seconds rather than ~30 mins with RK45
+convergence(t_max, -10*north, D, reading, integrator='exponential')
+convergence(t_max, -10*directed_at_reading, D, reading, integrator='exponential')
\ No newline at end of file
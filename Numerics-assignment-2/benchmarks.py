@@ -0,0 +1,344 @@
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+import scipy
+import matplotlib.pyplot as plt
+from meshCache import loadGrid, grid_resolutions
+from meshGeometry import Mesh, lasBoundaryTags, boundary_y_max, unitSquareGrid
+from parametrisedOperators import AffineOperator
+from linearSolvers import solveLinearSystem
+from massSolvers import MassSolver
+from pointLocation import PointLocator
+from outputSinks import ReceptorSink
+from TwoDimTimeEvolvedAdvDiffFESolver import timeEvolve
+
+'''
+Benchmarks of the solver stages on every provided grid and on structured meshes
+of the unit square of increasing size, for measuring scaling and catching
+regressions.
+
+For each mesh, the stages are timed separately (the best of a few repeats):
+
+    mesh_load            reading the grid (through the binary cache) and building
+                         the Mesh with its equation numbering, geometry and
+                         assembly plan
+    assembly             the diffusion, advection and mass matrices and the force
+                         vector
+    static_solve         LU factorisation and solve of K psi = F
+    time_evolved_solve   the time-evolved problem, with receptor output only
+    receptor_extraction  building the point locator and the interpolation
+                         matrix of the receptors, and applying it
+
+Nothing is reused from the per-grid caches of the solvers (every mesh is built
+with key None), so each stage is timed from scratch. The problem on each mesh
+is the Southampton one rescaled to its size: a Gaussian source in the middle,
+a wind blowing away from the Dirichlet boundary and the same Peclet number.
+
+    python benchmarks.py run results.json [--quick]
+    python benchmarks.py plot results.json scaling.pdf
+    python benchmarks.py compare old.json new.json [--threshold 1.2]
+
+run writes the timings (and mesh sizes and library versions) to a JSON file,
+plot draws each stage's time against the number of equations with the fitted
+scaling exponents, and compare lists the stages that got slower between two
+runs, exiting with status 1 if there are any.
+'''
+
+benchmark_stages = ['mesh_load', 'assembly', 'static_solve', 'time_evolved_solve',
+                    'receptor_extraction']
+
+# Number of elements along each side of the synthetic unit square meshes
+synthetic_sizes = [8, 16, 32, 64, 128, 256]
+
+def unitSquareMesh(Nx):
+    """
+    Mesh of the unit square triangulation of meshGeometry.unitSquareGrid (as
+    generate_2d_grid() in the top level TwoDimStaticDiffusionFESolver.py), with
+    the left edge Dirichlet.
+
+    Parameters:
+    Nx (int): Number of squares along each side.
+
+    Returns:
+    Mesh: The mesh (with key None).
+    """
+    mesh = Mesh(*unitSquareGrid(Nx), ('dirichlet',))
+    # the sparsity pattern counts as part of building the mesh
+    mesh.assemblyPlan
+    return mesh
+
+def gridMesh(family, resolution):
+    """
+    Builds the Mesh of one of the provided grids from scratch, with the same
+    southern Dirichlet border as loadMesh (see boundary_y_max).
+
+    Parameters:
+    family (string): Grid family, 'las' or 'esw'.
+    resolution (string): Grid resolution.
+
+    Returns:
+    Mesh: The mesh (with key None).
+    """
+    nodes, IEN, boundary_nodes = loadGrid(family, resolution)
+    tags = lasBoundaryTags(nodes, boundary_nodes, boundary_y_max[family])
+    mesh = Mesh(nodes, IEN, tags, ('south',))
+    # the sparsity pattern counts as part of building the mesh
+    mesh.assemblyPlan
+    return mesh
+
+def benchmarkProblem(mesh, peclet=30):
+    """
+    The problem solved on a mesh: a Gaussian source in the middle of it (of
+    width a twentieth of the mesh's extent), a 10ms^-1 wind blowing from the
+    Dirichlet boundary towards the middle, D giving the Peclet number, and the
+    time for the wind to cross the mesh.
+
+    Parameters:
+    mesh (Mesh): The mesh.
+    peclet (float, optional): Peclet number u L/D. Default is 30.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - S (function): The source term.
+           - u (np.ndarray): Advection velocity vector, entered (as for the
+                             solvers) as the negative of the wind [ms^-1].
+           - D (float): Diffusion coefficient [m^2s^-1].
+           - t_max (float): Run time of the time-evolved problem [s].
+    """
+    L = np.max(np.ptp(mesh.nodes, axis=1))
+    centre = mesh.nodes.mean(axis=1)
+    direction = centre - mesh.nodes[:, mesh.dirichlet_nodes].mean(axis=1)
+    u = -10*direction/np.linalg.norm(direction)
+    sigma = L/20
+    S = lambda x: np.exp(-1/(2*sigma**2)*((x[0] - centre[0])**2 + (x[1] - centre[1])**2))
+    return S, u, 10*L/peclet, L/10
+
+def _best(f, repeats):
+    # the result of f and its fastest time over the repeats
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+def benchmarkMesh(build, repeats=3, n_receptors=100, integrator='crank_nicolson'):
+    """
+    Times each stage on one mesh.
+
+    Parameters:
+    build (function): Builds the mesh, e.g. lambda: gridMesh('las', '10').
+    repeats (int, optional): Number of times each stage is run, of which the 
+                             fastest counts. Default is 3.
+    n_receptors (int, optional): Number of receptors, at randomly chosen element
+                                 centroids. Default is 100.
+    integrator (str, optional): Time integrator of the time-evolved problem,
+                                see timeEvolve, other than 'RK45' (whose step
+                                limit needs the resolution of a provided grid).
+                                Default is 'crank_nicolson'.
+
+    Returns:
+    dict: The sizes of the mesh (N_nodes, N_elements, N_equations and nnz of
+          K) and, under 'times', the time of each stage [s].
+    """
+    if integrator == 'RK45':
+        raise ValueError("RK45 needs a grid resolution for its step limit, so cannot "
+                         "be benchmarked, choose from ['backward_euler', 'crank_nicolson', "
+                         "'bdf2', 'exponential']")
+    times = dict()
+    mesh, times['mesh_load'] = _best(build, repeats)
+    S, u, D, t_max = benchmarkProblem(mesh)
+
+    def assemble():
+        operator = AffineOperator(mesh)
+        return operator, operator.stiffness(u, D), operator.force(S), operator.M
+    (operator, K, F, M), times['assembly'] = _best(assemble, repeats)
+
+    Psi, times['static_solve'] = _best(lambda: solveLinearSystem(K, F)[0], repeats)
+
+    rng = np.random.default_rng(0)
+    receptors = mesh.centroids[rng.choice(mesh.N_elements, n_receptors)].T
+    R = mesh.pointLocator.interpolationMatrix(receptors)
+    _, times['time_evolved_solve'] = _best(
+        lambda: timeEvolve(mesh, MassSolver(M), K, F, u, None, t_max, integrator,
+                           sink=ReceptorSink(R)), repeats)
+
+    psi = mesh.scatter(Psi)
+    _, times['receptor_extraction'] = _best(
+        lambda: PointLocator(mesh).interpolationMatrix(receptors) @ psi, repeats)
+
+    return {'N_nodes': mesh.N_nodes, 'N_elements': mesh.N_elements,
+            'N_equations': mesh.N_equations, 'nnz': K.nnz, 'times': times}
+
+def runBenchmarks(families=('las', 'esw'), sizes=synthetic_sizes, repeats=3,
+                  **options):
+    """
+    Times each stage on every grid of the given families and on a unit square
+    mesh of each size.
+
+    Parameters:
+    families (tuple, optional): Grid families. Default is ('las', 'esw').
+    sizes (list, optional): Numbers of squares along each side of the unit
+                            square meshes. Default is synthetic_sizes.
+    repeats (int, optional): Number of times each stage is run. Default is 3.
+    **options: Passed on to benchmarkMesh.
+
+    Returns:
+    dict: 'metadata' (versions, machine and date) and 'results', a list with
+          one entry per mesh: its name, family ('las', 'esw' or 'synthetic'),
+          sizes and times, see benchmarkMesh.
+    """
+    jobs = [(f'{family}_{resolution}k', family,
+             lambda family=family, resolution=resolution: gridMesh(family, resolution))
+            for family in families for resolution in grid_resolutions[family][::-1]]
+    jobs += [(f'unit_square_{Nx}', 'synthetic', lambda Nx=Nx: unitSquareMesh(Nx))
+             for Nx in sizes]
+    results = []
+    for name, family, build in jobs:
+        result = {'name': name, 'family': family}
+        result.update(benchmarkMesh(build, repeats, **options))
+        results.append(result)
+        print(f"{name}: {result['N_equations']} equations, " + ', '.join(
+            f'{stage} {seconds:.3g}s' for stage, seconds in result['times'].items()))
+    metadata = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version,
+                'numpy': np.__version__, 'scipy': scipy.__version__,
+                'machine': platform.platform(), 'processor': platform.processor(),
+                'repeats': repeats}
+    return {'metadata': metadata, 'results': results}
+
+def saveBenchmarks(benchmarks, filename):
+    with open(filename, 'w') as file:
+        json.dump(benchmarks, file, indent=1)
+
+def loadBenchmarks(filename):
+    with open(filename) as file:
+        return json.load(file)
+
+def scalingExponents(benchmarks, min_equations=1000):
+    """
+    Fits time ~ N_equations^p for each stage and mesh family.
+
+    Parameters:
+    benchmarks (dict): As returned by runBenchmarks or loadBenchmarks.
+    min_equations (int, optional): Smallest meshes left out of the fits, as 
+                                   fixed overheads dominate them. Default is 1000.
+
+    Returns:
+    dict: {family: {stage: p}}, for families with at least two meshes large
+          enough.
+    """
+    exponents = dict()
+    for family in dict.fromkeys(result['family'] for result in benchmarks['results']):
+        results = [result for result in benchmarks['results'] 
+                   if result['family'] == family and result['N_equations'] >= min_equations]
+        if len(results) < 2:
+            continue
+        Ns = np.log([result['N_equations'] for result in results])
+        exponents[family] = {
+            stage: np.polyfit(Ns, np.log([result['times'][stage] for result in results]),
+                              1)[0]
+            for stage in benchmark_stages}
+    return exponents
+
+def plotScaling(benchmarks, filename=None, min_equations=1000):
+    """
+    Plots the time of each stage against the number of equations on log axes,
+    one panel per stage, labelled with the fitted exponents.
+
+    Parameters:
+    benchmarks (dict): As returned by runBenchmarks or loadBenchmarks.
+    filename (str, optional): Saves the figure to this file. Default is None.
+    min_equations (int, optional): As for scalingExponents.
+
+    Returns:
+    dict: The exponents, see scalingExponents.
+    """
+    exponents = scalingExponents(benchmarks, min_equations)
+    fig, axes = plt.subplots(1, len(benchmark_stages), figsize=(4*len(benchmark_stages), 3.5),
+                             sharex=True)
+    for ax, stage in zip(axes, benchmark_stages):
+        for family in dict.fromkeys(result['family'] for result in benchmarks['results']):
+            results = [result for result in benchmarks['results'] 
+                       if result['family'] == family]
+            label = family
+            if family in exponents:
+                label += rf' $\propto N^{{{exponents[family][stage]:.2f}}}$'
+            ax.loglog([result['N_equations'] for result in results],
+                      [result['times'][stage] for result in results], 'x-', label=label)
+        ax.set_title(stage.replace('_', ' '))
+        ax.set_xlabel('Number of equations')
+        ax.grid()
+        ax.legend()
+    axes[0].set_ylabel('Time [s]')
+    fig.tight_layout()
+    if filename is not None:
+        fig.savefig(filename)
+    return exponents
+
+def compareBenchmarks(old, new, threshold=1.2, min_seconds=1e-3):
+    """
+    Finds the stages that got slower between two runs.
+
+    Parameters:
+    old (dict): The reference run, as returned by runBenchmarks or loadBenchmarks.
+    new (dict): The run to check.
+    threshold (float, optional): Smallest ratio of new to old time counted as a
+                                 slowdown. Default is 1.2.
+    min_seconds (float, optional): Stages faster than this in both runs are
+                                   ignored, as their timings are mostly noise.
+                                   Default is 1ms.
+
+    Returns:
+    list: (mesh name, stage, old time, new time, ratio) of every slowdown, for
+          the meshes in both runs, worst first.
+    """
+    old_results = {result['name']: result for result in old['results']}
+    slowdowns = []
+    for result in new['results']:
+        if result['name'] not in old_results:
+            continue
+        for stage in benchmark_stages:
+            t_old = old_results[result['name']]['times'][stage]
+            t_new = result['times'][stage]
+            if max(t_old, t_new) >= min_seconds and t_new > threshold*t_old:
+                slowdowns.append((result['name'], stage, t_old, t_new, t_new/t_old))
+    return sorted(slowdowns, key=lambda slowdown: -slowdown[4])
+
+if __name__ == '__main__':
+    
+    parser = argparse.ArgumentParser(description='Benchmarks of the solver stages')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='time every stage on every mesh')
+    run.add_argument('output')
+    run.add_argument('--quick', action='store_true',
+                     help='only the las grids and the smaller unit squares, once each')
+    plot = commands.add_parser('plot', help='plot the scaling with the number of equations')
+    plot.add_argument('results')
+    plot.add_argument('output')
+    compare = commands.add_parser('compare', help='list the slowdowns between two runs')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.quick:
+            benchmarks = runBenchmarks(('las',), synthetic_sizes[:4], repeats=1)
+        else:
+            benchmarks = runBenchmarks()
+        saveBenchmarks(benchmarks, args.output)
+        for family, stages in scalingExponents(benchmarks).items():
+            print(f'{family}: ' + ', '.join(f'{stage} N^{p:.2f}' for stage, p in stages.items()))
+    elif args.command == 'plot':
+        plotScaling(loadBenchmarks(args.results), args.output)
+    else:
+        slowdowns = compareBenchmarks(loadBenchmarks(args.old), loadBenchmarks(args.new),
+                                      args.threshold)
+        for name, stage, t_old, t_new, ratio in slowdowns:
+            print(f'{name} {stage}: {t_old:.3g}s -> {t_new:.3g}s ({ratio:.2f}x)')
+        if not slowdowns:
+            print('no slowdowns')
+        sys.exit(1 if slowdowns else 0)
@@ -0,0 +1,98 @@
+import numpy as np
+
+'''
+Boundary tagging and degree-of-freedom numbering with array operations.
+
+The solvers number the equations by skipping the Dirichlet nodes (ID[n] = -1
+on those), build the location matrix LM from ID and IEN, and finally scatter
+the solution on the equations back to all the nodes. Boundaries are described
+by a dict of named node sets ("tags"), e.g. {'south': ..., 'neumann': ...}, of
+which any subset can be imposed as (homogeneous) Dirichlet.
+'''
+
+def tagBoundaryNodes(nodes, predicates, candidates=None):
+    """
+    Sorts nodes into named boundary sets.
+
+    Parameters:
+    nodes (np.ndarray): A 2xN array containing the coordinates of the nodes.
+    predicates (dict): Maps each tag name to a function of the coordinate rows
+                       (x, y), vectorised, returning True for nodes in that set.
+                       Sets are claimed in order, so a node belongs to the first
+                       tag whose predicate it satisfies.
+    candidates (np.ndarray, optional): Indices of the nodes that may be tagged,
+                                       e.g. the boundary nodes of a grid. Default
+                                       is None, meaning all nodes.
+
+    Returns:
+    tags (dict): Maps each tag name to a sorted array of node indices.
+    """
+    if candidates is None:
+        candidates = np.arange(nodes.shape[1])
+    candidates = np.asarray(candidates, dtype=np.int64)
+    untagged = np.ones(len(candidates), dtype=bool)
+    tags = dict()
+    for name, predicate in predicates.items():
+        in_set = untagged & np.asarray(predicate(nodes[0, candidates],
+                                                 nodes[1, candidates]), dtype=bool)
+        tags[name] = np.sort(candidates[in_set])
+        untagged &= ~in_set
+    return tags
+
+def numberEquations(N_nodes, dirichlet_nodes):
+    """
+    Builds the ID array: the equation number of every node, or -1 on Dirichlet
+    nodes, numbering the remaining nodes in order.
+
+    Parameters:
+    N_nodes (int): Number of nodes.
+    dirichlet_nodes (array-like or list of array-like): Indices of the Dirichlet
+                                                        nodes, or several such
+                                                        sets (e.g. tags).
+
+    Returns:
+    ID (np.ndarray): The equation number of each node.
+    """
+    is_dirichlet = np.zeros(N_nodes, dtype=bool)
+    if len(dirichlet_nodes) > 0 and np.ndim(dirichlet_nodes[0]) > 0:
+        for node_set in dirichlet_nodes:
+            is_dirichlet[np.asarray(node_set, dtype=np.int64)] = True
+    else:
+        is_dirichlet[np.asarray(dirichlet_nodes, dtype=np.int64)] = True
+    ID = np.full(N_nodes, -1, dtype=np.int64)
+    ID[~is_dirichlet] = np.arange(N_nodes - np.count_nonzero(is_dirichlet))
+    return ID
+
+def locationMatrix(IEN, ID):
+    """
+    Builds the location matrix: the equation number of each local node of each
+    element.
+
+    Parameters:
+    IEN (np.ndarray): Element connectivity array.
+    ID (np.ndarray): The equation number of each node (-1 on Dirichlet nodes).
+
+    Returns:
+    LM (np.ndarray): A (3, N_elements) array with LM[a, e] = ID[IEN[e, a]].
+    """
+    return np.ascontiguousarray(ID[IEN].T)
+
+def scatterSolution(ID, Psi_interior, dirichlet_value=0):
+    """
+    Expands a solution on the equations to all nodes.
+
+    Parameters:
+    ID (np.ndarray): The equation number of each node (-1 on Dirichlet nodes).
+    Psi_interior (np.ndarray): Solution values, one per equation. Extra trailing
+                               axes (e.g. several solutions) are carried over.
+    dirichlet_value (float, optional): Value on the Dirichlet nodes. Default 0.
+
+    Returns:
+    Psi_A (np.ndarray): Solution values at every node.
+    """
+    Psi_interior = np.asarray(Psi_interior)
+    Psi_A = np.full((len(ID),) + Psi_interior.shape[1:], dirichlet_value,
+                    dtype=Psi_interior.dtype)
+    free = ID >= 0
+    Psi_A[free] = Psi_interior[ID[free]]
+    return Psi_A
@@ -0,0 +1,410 @@
+import numpy as np
+from instrumentation import count
+
+'''
+Whole-mesh ("batched") versions of the element kernels in
+TwoDimStaticAdvDiffFESolver.py and TwoDimTimeEvolvedAdvDiffFESolver.py.
+
+Every function here takes a stack of element coordinates, xes, of shape
+(N_elements, 2, 3), i.e. xes[e] is exactly the 'xe' that the per-element
+functions expect. The per-element functions remain the reference implementation
+and the tests check the two agree.
+
+Two backends are provided for the element matrices: 'quadrature', which mirrors
+the Gauss-quadrature construction of the per-element functions, and 'analytic',
+which uses the exact closed forms for linear triangles in terms of the element
+area and shape-function gradients. The force vector always uses quadrature as
+the source term is arbitrary.
+'''
+
+# Gauss-quadrature evaluation points and weights (same rule as localQuadrature)
+quadrature_points = 1/6 * np.array([[1, 4, 1],
+                                    [1, 1, 4]])
+quadrature_weights = 1/6 * np.ones(3)
+
+# Shape functions evaluated at each quadrature point, shape (3 points, 3 functions)
+quadrature_shape_functions = np.array([1 - quadrature_points[0] - quadrature_points[1],
+                                       quadrature_points[0],
+                                       quadrature_points[1]]).T
+
+# Derivatives of the local shape functions w.r.t. xi1 (first row) and xi2 (second
+# row), as in localShapeFunctionDerivatives()
+local_shape_function_derivatives = np.array([[-1, 1, 0],
+                                             [-1, 0, 1]])
+
+def elementCoordinates(nodes, IEN):
+    """
+    Gathers the global coordinates of the nodes of every element.
+
+    Parameters:
+    nodes (np.ndarray): A 2xN array containing the coordinates of the nodes,
+                        where N is the 'long' axis of nodes, i.e. N>>2.
+    IEN (np.ndarray): Element connectivity array where each row represents a
+                      triangular element and contains the indices of its nodes.
+
+    Returns:
+    xes (np.ndarray): An (N_elements, 2, 3) array where xes[e] is the 2x3 matrix
+                      of global coordinates of the nodes of element e.
+    """
+    return np.ascontiguousarray(nodes[:, IEN].transpose(1, 0, 2))
+
+def batchedJacobians(xes):
+    """
+    Computes the Jacobian matrix of every element at once.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+
+    Returns:
+    np.ndarray: An (N_elements, 2, 2) stack of Jacobian matrices.
+    """
+    return xes @ local_shape_function_derivatives.T
+
+def batchedGlobalShapeFunctionDerivatives(xes, jacobians=None):
+    """
+    Computes the derivatives of the shape functions with respect to global
+    coordinates for every element at once.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    jacobians (np.ndarray, optional): Precomputed (N_elements, 2, 2) Jacobians.
+                                      Default is None, in which case they are
+                                      computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 2, 3) stack where entry [e,:,a] is the global
+                gradient of shape function a on element e.
+    """
+    if jacobians is None:
+        jacobians = batchedJacobians(xes)
+    return np.linalg.inv(jacobians).transpose(0, 2, 1) @ local_shape_function_derivatives
+
+def batchedQuadraturePoints(xes):
+    """
+    Maps the Gauss-quadrature points of the reference triangle into every element.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+
+    Returns:
+    np.ndarray: An (N_elements, 2, 3) stack where entry [e,:,q] is the global
+                position of quadrature point q in element e.
+    """
+    return xes @ quadrature_shape_functions.T
+
+def batchedGlobalQuadrature(xes, values, detJ=None):
+    """
+    Performs Gauss quadrature over every element at once, given the integrand
+    already evaluated at the quadrature points.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    values (np.ndarray): Integrand values of shape (N_elements, ..., 3), the last
+                         axis running over the quadrature points.
+    detJ (np.ndarray, optional): Precomputed Jacobian determinants. Default is
+                                 None, in which case they are computed from xes.
+
+    Returns:
+    np.ndarray: The integrals, of shape values.shape[:-1].
+    """
+    if detJ is None:
+        detJ = np.linalg.det(batchedJacobians(xes))
+    integrals = values @ quadrature_weights
+    return np.abs(detJ).reshape((-1,) + (1,)*(integrals.ndim-1)) * integrals
+
+def _quadratureGeometry(xes, geometry):
+    # Jacobian determinants and global shape-function derivatives, computed as
+    # in the per-element functions unless precomputed (areas, dxNa) are given
+    if geometry is None:
+        jacobians = batchedJacobians(xes)
+        return np.linalg.det(jacobians), batchedGlobalShapeFunctionDerivatives(xes, jacobians)
+    areas, dxNa = geometry
+    return 2*areas, dxNa
+
+def batched_diffusion_stiffness(xes, geometry=None):
+    """
+    Computes the diffusion stiffness matrix of every element at once.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3, 3) stack of diffusion stiffness matrices.
+    """
+    detJ, dxNa = _quadratureGeometry(xes, geometry)
+    # The integrand dN_i . dN_j is constant over each element
+    integrand = np.einsum('eki,ekj->eij', dxNa, dxNa)
+    values = np.repeat(integrand[..., np.newaxis], 3, axis=-1)
+    return batchedGlobalQuadrature(xes, values, detJ)
+
+def batched_advection_stiffness(xes, u, geometry=None):
+    """
+    Computes the advection stiffness matrix of every element at once.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    u (array-like): Advection velocity vector.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3, 3) stack of advection stiffness matrices.
+    """
+    detJ, dxNa = _quadratureGeometry(xes, geometry)
+    u_dot_dxNa = u[0]*dxNa[:,0,:] + u[1]*dxNa[:,1,:]
+    # values[e,i,j,q] = N_i(xi_q) * (u . dN_j), the shape functions at the
+    # quadrature points being the same for every element
+    values = np.einsum('qi,ej->eijq', quadrature_shape_functions, u_dot_dxNa)
+    return batchedGlobalQuadrature(xes, values, detJ)
+
+def batched_stiffness(xes, D, u, geometry=None):
+    """
+    Computes the combined stiffness matrix of every element at once.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    D (float): Diffusion coefficient.
+    u (array-like): Advection velocity vector.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3, 3) stack of combined stiffness matrices.
+    """
+    detJ, dxNa = _quadratureGeometry(xes, geometry)
+    geometry = (0.5*np.abs(detJ), dxNa)
+    return (D * batched_diffusion_stiffness(xes, geometry)
+            - batched_advection_stiffness(xes, u, geometry))
+
+def sourceValues(S, x):
+    """
+    Evaluates a source term at many points, with a single call of S if it is
+    written with array operations, and otherwise one point at a time.
+
+    Parameters:
+    S (function): A source term function that takes global coordinates as input
+                  and returns a scalar value.
+    x (np.ndarray): A (2, N_points) array of coordinates.
+
+    Returns:
+    np.ndarray: An (N_points,) array of the values of S.
+    """
+    try:
+        values = np.asarray(S(x), dtype=float)
+    except Exception:
+        # e.g. S uses math functions or branches on its coordinates
+        values = None
+    if values is None or values.shape not in [(), (x.shape[1],)]:
+        values = np.array([S(point) for point in x.T], dtype=float)
+    return np.broadcast_to(values, (x.shape[1],))
+
+def batched_force(xes, S, geometry=None):
+    """
+    Computes the force vector of every element at once.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    S (function): A source term function that takes global coordinates as input
+                  and returns a scalar value. It is called once with a
+                  (2, 3*N_elements) array of coordinates if it is written with
+                  array operations (as S_sotonfire is), and otherwise at each
+                  point in turn, see sourceValues(). Constant functions
+                  returning a scalar are broadcast.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3) stack of force vectors.
+    """
+    N_elements = xes.shape[0]
+    x = batchedQuadraturePoints(xes).transpose(1, 0, 2).reshape(2, -1)
+    count('source_evaluations', x.shape[1])
+    S_values = sourceValues(S, x).reshape(N_elements, 3)
+    # values[e,i,q] = S(x_q) * N_i(xi_q)
+    values = np.einsum('eq,qi->eiq', S_values, quadrature_shape_functions)
+    detJ = None if geometry is None else 2*geometry[0]
+    return batchedGlobalQuadrature(xes, values, detJ)
+
+def batched_mass(xes, geometry=None):
+    """
+    Computes the mass matrix of every element at once.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3, 3) stack of mass matrices.
+    """
+    # N_i(xi_q) * N_j(xi_q) is the same on every element
+    reference = np.einsum('qi,qj->ijq', quadrature_shape_functions,
+                          quadrature_shape_functions)
+    values = np.broadcast_to(reference, (xes.shape[0], 3, 3, 3))
+    detJ = None if geometry is None else 2*geometry[0]
+    return batchedGlobalQuadrature(xes, values, detJ)
+
+def batchedJacobianDeterminants(xes):
+    """
+    Computes the (signed) Jacobian determinant of every element directly from 
+    the node coordinates.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+
+    Returns:
+    np.ndarray: The Jacobian determinant of each element (twice its signed area).
+    """
+    x = xes[:,0,:]
+    y = xes[:,1,:]
+    return (x[:,1]-x[:,0])*(y[:,2]-y[:,0]) - (x[:,2]-x[:,0])*(y[:,1]-y[:,0])
+
+def analyticGeometry(xes):
+    """
+    Computes the area and the global shape-function gradients of every element
+    directly from the node coordinates, without inverting the Jacobians.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - areas (np.ndarray): Area of each element.
+           - dxNa (np.ndarray): An (N_elements, 2, 3) stack of global gradients,
+                                as batchedGlobalShapeFunctionDerivatives().
+    """
+    x = xes[:,0,:]
+    y = xes[:,1,:]
+    detJ = batchedJacobianDeterminants(xes)
+    # grad N_a = [y_b - y_c, x_c - x_b] / detJ, with (a, b, c) cyclic
+    dxNa = np.empty_like(xes, dtype=float)
+    dxNa[:,0,:] = np.roll(y, -1, axis=1) - np.roll(y, -2, axis=1)
+    dxNa[:,1,:] = np.roll(x, -2, axis=1) - np.roll(x, -1, axis=1)
+    dxNa /= detJ[:, np.newaxis, np.newaxis]
+    return 0.5*np.abs(detJ), dxNa
+
+def analytic_diffusion_stiffness(xes, geometry=None):
+    """
+    Computes the diffusion stiffness matrix of every element at once from the
+    closed form  k_ij = area * dN_i . dN_j.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3, 3) stack of diffusion stiffness matrices.
+    """
+    areas, dxNa = analyticGeometry(xes) if geometry is None else geometry
+    return areas[:, np.newaxis, np.newaxis] * np.einsum('eki,ekj->eij', dxNa, dxNa)
+
+def analytic_advection_stiffness(xes, u, geometry=None):
+    """
+    Computes the advection stiffness matrix of every element at once from the
+    closed form  k_ij = area/3 * u . dN_j  (each shape function integrates to
+    area/3 and u . dN_j is constant on the element).
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    u (array-like): Advection velocity vector.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3, 3) stack of advection stiffness matrices.
+    """
+    areas, dxNa = analyticGeometry(xes) if geometry is None else geometry
+    u_dot_dxNa = u[0]*dxNa[:,0,:] + u[1]*dxNa[:,1,:]
+    rows = (areas/3)[:, np.newaxis] * u_dot_dxNa
+    return np.broadcast_to(rows[:, np.newaxis, :], (xes.shape[0], 3, 3)).copy()
+
+def analytic_stiffness(xes, D, u, geometry=None):
+    """
+    Computes the combined stiffness matrix of every element at once from the
+    closed forms.
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    D (float): Diffusion coefficient.
+    u (array-like): Advection velocity vector.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3, 3) stack of combined stiffness matrices.
+    """
+    areas, dxNa = analyticGeometry(xes) if geometry is None else geometry
+    u_dot_dxNa = u[0]*dxNa[:,0,:] + u[1]*dxNa[:,1,:]
+    output = D * np.einsum('eki,ekj->eij', dxNa, dxNa)
+    output -= (u_dot_dxNa/3)[:, np.newaxis, :]
+    return areas[:, np.newaxis, np.newaxis] * output
+
+def analytic_mass(xes, geometry=None):
+    """
+    Computes the mass matrix of every element at once from the closed form
+    m_ij = area/12 * (1 + delta_ij).
+
+    Parameters:
+    xes (np.ndarray): An (N_elements, 2, 3) stack of element coordinates.
+    geometry (tuple, optional): Precomputed (areas, dxNa) of the elements, as
+                                returned by analyticGeometry() or held by a
+                                Mesh. Default is None, in which case they are
+                                computed from xes.
+
+    Returns:
+    np.ndarray: An (N_elements, 3, 3) stack of mass matrices.
+    """
+    areas = 0.5*np.abs(batchedJacobianDeterminants(xes)) if geometry is None else geometry[0]
+    return areas[:, np.newaxis, np.newaxis]/12 * (np.ones((3,3)) + np.eye(3))
+
+# Element matrix backends, selectable by name
+kernel_backends = {
+    'quadrature': {
+        'diffusion_stiffness': batched_diffusion_stiffness,
+        'advection_stiffness': batched_advection_stiffness,
+        'stiffness': batched_stiffness,
+        'mass': batched_mass,
+    },
+    'analytic': {
+        'diffusion_stiffness': analytic_diffusion_stiffness,
+        'advection_stiffness': analytic_advection_stiffness,
+        'stiffness': analytic_stiffness,
+        'mass': analytic_mass,
+    },
+}
+
+def elementKernel(name, kernels='analytic'):
+    """
+    Looks up an element matrix function in one of the kernel backends.
+
+    Parameters:
+    name (str): One of 'diffusion_stiffness', 'advection_stiffness', 'stiffness'
+                or 'mass'.
+    kernels (str, optional): Backend, 'analytic' (default) or 'quadrature'.
+
+    Returns:
+    function: The batched element matrix function.
+    """
+    if kernels not in kernel_backends:
+        raise ValueError(f'Unknown kernel backend {kernels!r}, choose from '
+                         f'{list(kernel_backends)}')
+    return kernel_backends[kernels][name]
@@ -0,0 +1,271 @@
+import json
+import time
+import functools
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+'''
+Timers and counters for finding where the solvers spend their time.
+
+Every stage of the solvers reports into the module's recorder:
+
+    with phase('assembly'):         times a block (phases nest)
+        ...
+    @timed('static_solve')          times every call of a function
+    count('rhs_evaluations')        adds to a counter
+    peak('matrix_bytes', K.data.nbytes)
+                                    keeps the largest value reported
+
+Nothing is recorded unless a recorder is enabled, and when none is phase()
+returns a shared do-nothing context and count() and peak() return immediately,
+so the reporting costs one global lookup per call. To record,
+
+    with recording() as recorder:
+        TwoDimStaticAdvDiffFESolver(...)
+    recorder.save('profile.json')              # phases, totals and counters
+    recorder.saveChromeTrace('trace.json')     # open in chrome://tracing or 
+                                               # https://ui.perfetto.dev
+
+With track_memory=True, each phase also records the peak memory allocated 
+(including by numpy) while it ran, using tracemalloc. This slows allocation
+down considerably, so it is off by default.
+'''
+
+# The active recorder, None when disabled
+_recorder = None
+
+# Returned by phase() when disabled
+_null_phase = nullcontext()
+
+class Recorder:
+    """
+    Collects phases, counters and peaks.
+
+    Attributes:
+    events (list): One dict per completed phase: name, start and duration 
+                   [s, from the recorder's creation], depth and args.
+    counters (dict): Total of each counter.
+    peaks (dict): Largest value reported for each peak.
+    track_memory (bool): Whether phases record their peak traced memory.
+    """
+    __slots__ = ('events', 'counters', 'peaks', 'track_memory', '_t0', '_stack',
+                 '_started_tracemalloc')
+
+    def __init__(self, track_memory=False):
+        """
+        Parameters:
+        track_memory (bool, optional): Record the peak memory of each phase with
+                                       tracemalloc. Default is False.
+        """
+        self.events = []
+        self.counters = dict()
+        self.peaks = dict()
+        self.track_memory = track_memory
+        self._t0 = time.perf_counter()
+        # [name, start, args, running memory peak] of each open phase
+        self._stack = []
+        self._started_tracemalloc = False
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    @contextmanager
+    def phase(self, name, **args):
+        if self.track_memory:
+            # the peak so far belongs to the enclosing phase
+            if self._stack:
+                parent = self._stack[-1]
+                parent[3] = max(parent[3], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        entry = [name, time.perf_counter(), args, 0]
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._stack.pop()
+            args = dict(entry[2])
+            if self.track_memory:
+                memory = max(entry[3], tracemalloc.get_traced_memory()[1])
+                args['peak_bytes'] = memory
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent[3] = max(parent[3], memory)
+            self.events.append({'name': name, 'start': entry[1] - self._t0,
+                                'duration': end - entry[1],
+                                'depth': len(self._stack), 'args': args})
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def peak(self, name, value):
+        self.peaks[name] = max(self.peaks.get(name, value), value)
+
+    def totals(self):
+        """
+        The number of calls and total time of each phase.
+
+        Returns:
+        dict: {name: {'calls': int, 'seconds': float}}, in order of first
+              completion.
+        """
+        totals = dict()
+        for event in self.events:
+            total = totals.setdefault(event['name'], {'calls': 0, 'seconds': 0.0})
+            total['calls'] += 1
+            total['seconds'] += event['duration']
+        return totals
+
+    def report(self):
+        """
+        Everything recorded, as a JSON-serialisable dict.
+
+        Returns:
+        dict: With keys 'totals', 'counters', 'peaks' and 'events'.
+        """
+        return {'totals': self.totals(), 'counters': self.counters, 
+                'peaks': self.peaks, 'events': self.events}
+
+    def save(self, filename):
+        """
+        Writes report() to a JSON file.
+
+        Parameters:
+        filename (str): Path of the file.
+        """
+        with open(filename, 'w') as file:
+            json.dump(self.report(), file, indent=1)
+
+    def chromeTrace(self):
+        """
+        The phases as Chrome trace events (complete events, in microseconds),
+        with the counters and peaks as counter events at the end.
+
+        Returns:
+        dict: The trace, {'traceEvents': [...]}.
+        """
+        events = [{'name': event['name'], 'ph': 'X', 'pid': 0, 'tid': 0,
+                   'ts': 1e6*event['start'], 'dur': 1e6*event['duration'],
+                   'args': event['args']} 
+                  for event in sorted(self.events, key=lambda event: event['start'])]
+        end = max([e['ts'] + e['dur'] for e in events], default=0)
+        for name, value in {**self.counters, **self.peaks}.items():
+            events.append({'name': name, 'ph': 'C', 'pid': 0, 'ts': end,
+                           'args': {name: value}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def saveChromeTrace(self, filename):
+        """
+        Writes chromeTrace() to a JSON file, for chrome://tracing or Perfetto.
+
+        Parameters:
+        filename (str): Path of the file.
+        """
+        with open(filename, 'w') as file:
+            json.dump(self.chromeTrace(), file)
+
+    def close(self):
+        """Stops tracemalloc, if the recorder started it."""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+def enable(track_memory=False):
+    """
+    Starts recording into a new recorder.
+
+    Parameters:
+    track_memory (bool, optional): Record the peak memory of each phase. Default
+                                   is False.
+
+    Returns:
+    Recorder: The new recorder.
+    """
+    global _recorder
+    disable()
+    _recorder = Recorder(track_memory)
+    return _recorder
+
+def disable():
+    """
+    Stops recording.
+
+    Returns:
+    Recorder: The recorder that was active, or None.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+    return recorder
+
+@contextmanager
+def recording(track_memory=False):
+    """
+    Records everything run inside the with block.
+
+    Parameters:
+    track_memory (bool, optional): Record the peak memory of each phase. Default
+                                   is False.
+
+    Yields:
+    Recorder: The recorder, still readable after the block.
+    """
+    recorder = enable(track_memory)
+    try:
+        yield recorder
+    finally:
+        if _recorder is recorder:
+            disable()
+
+def phase(name, **args):
+    """
+    A context manager timing a block as a phase, if recording.
+
+    Parameters:
+    name (str): Name of the phase.
+    **args: Values stored with the phase (e.g. the resolution).
+    """
+    if _recorder is None:
+        return _null_phase
+    return _recorder.phase(name, **args)
+
+def timed(name):
+    """
+    A decorator timing every call of a function as a phase, if recording.
+
+    Parameters:
+    name (str): Name of the phase.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return f(*args, **kwargs)
+            with _recorder.phase(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, n=1):
+    """
+    Adds n to a counter, if recording.
+
+    Parameters:
+    name (str): Name of the counter.
+    n (int, optional): Amount to add. Default is 1.
+    """
+    if _recorder is not None:
+        _recorder.count(name, n)
+
+def peak(name, value):
+    """
+    Records a value, keeping the largest one reported under the name, if
+    recording.
+
+    Parameters:
+    name (str): Name of the peak.
+    value (float): The value, e.g. a number of bytes.
+    """
+    if _recorder is not None:
+        _recorder.peak(name, value)
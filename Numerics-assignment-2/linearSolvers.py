@@ -0,0 +1,206 @@
+import time
+import numpy as np
+from scipy import sparse as sp
+import scipy.sparse.linalg
+from instrumentation import phase, timed, count, peak
+
+'''
+Linear solver backends for the (non-symmetric) FE systems K psi = F.
+
+    'direct'    SuperLU (sp.linalg.splu) with a selectable column ordering
+    'gmres'     restarted GMRES
+    'bicgstab'  BiCGSTAB
+
+The Krylov methods can be preconditioned with an incomplete LU factorisation
+('ilu') or the diagonal ('jacobi'), and warm-started from an initial guess.
+'auto' picks the direct solver while the estimated memory of its LU factors
+(see luBytesEstimate) is within auto_direct_max_bytes, and ILU-preconditioned
+GMRES above it. On the las grids only the 1.25k one is over the default.
+
+Every solve returns a SolveReport alongside the solution.
+
+LU factorisations of K(u, D) are cached by factorisation(), keyed on the mesh,
+the parameters and the column ordering, so that solves which only change the
+source term (and so F) reuse them. F may then be an (N_equations, n) matrix of
+force vectors, solved with n pairs of triangular solves.
+'''
+
+# Largest estimated size of the LU factors [bytes] for which 'auto' uses the
+# direct solver
+auto_direct_max_bytes = 32*2**20
+
+# SuperLU factorisations already computed, keyed by (mesh key, kernel backend,
+# u_x, u_y, D, permc_spec), oldest first
+_factorisations = {}
+
+# Number of factorisations kept in _factorisations before the oldest is dropped
+max_cached_factorisations = 8
+
+class SolveReport:
+    """
+    Summary of one linear solve.
+
+    Attributes:
+    method (str): The backend used.
+    iterations (int): Number of Krylov iterations (0 for direct solves).
+    residual (float): Relative residual ||F - K psi|| / ||F||.
+    wall_time (float): Wall-clock time of the solve, including any
+                       factorisation or preconditioner setup [s].
+    converged (bool): Whether the solver reached its tolerance.
+    """
+    __slots__ = ('method', 'iterations', 'residual', 'wall_time', 'converged')
+
+    def __init__(self, method, iterations, residual, wall_time, converged):
+        self.method = method
+        self.iterations = iterations
+        self.residual = residual
+        self.wall_time = wall_time
+        self.converged = converged
+
+    def __repr__(self):
+        return (f'SolveReport(method={self.method!r}, iterations={self.iterations}, '
+                f'residual={self.residual:.3e}, wall_time={self.wall_time:.3e}, '
+                f'converged={self.converged})')
+
+def preconditioner(K, kind, drop_tol=1e-4, fill_factor=20):
+    """
+    Builds a preconditioner for K.
+
+    Parameters:
+    K (sp.spmatrix): The system matrix.
+    kind (str or None): 'ilu', 'jacobi' or None.
+    drop_tol (float, optional): ILU drop tolerance. Default is 1e-4.
+    fill_factor (float, optional): ILU fill factor. Default is 20.
+
+    Returns:
+    sp.linalg.LinearOperator or None: An approximation to K^-1.
+    """
+    if kind is None:
+        return None
+    if kind == 'ilu':
+        # K has a dominant positive diagonal, so no pivoting is needed - and
+        # threshold pivoting can hit exactly zero pivots in the incomplete
+        # factors
+        ilu = sp.linalg.spilu(sp.csc_matrix(K), drop_tol=drop_tol,
+                              fill_factor=fill_factor, diag_pivot_thresh=0)
+        return sp.linalg.LinearOperator(K.shape, ilu.solve)
+    if kind == 'jacobi':
+        inverse_diagonal = 1/K.diagonal()
+        return sp.linalg.LinearOperator(K.shape, lambda x: inverse_diagonal*x)
+    raise ValueError(f"Unknown preconditioner {kind!r}, choose from "
+                     "['ilu', 'jacobi', None]")
+
+def factorisation(operator, u, D, permc_spec='COLAMD'):
+    """
+    Returns the LU factorisation of K(u, D), factorising on first use only.
+
+    Parameters:
+    operator (AffineOperator): The operator on the mesh, see
+                               parametrisedOperators.py.
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    permc_spec (str, optional): SuperLU column ordering. Default is 'COLAMD'.
+
+    Returns:
+    sp.linalg.SuperLU: The (possibly cached) factorisation, whose solve() 
+                       accepts a vector or a matrix of right-hand sides.
+    """
+    if operator.mesh.key is None:
+        return _factorise(operator.stiffness(u, D), permc_spec)
+    key = (operator.mesh.key, operator.kernels, float(u[0]), float(u[1]), float(D),
+           permc_spec)
+    if key not in _factorisations:
+        if len(_factorisations) >= max_cached_factorisations:
+            del _factorisations[next(iter(_factorisations))]
+        _factorisations[key] = _factorise(operator.stiffness(u, D), permc_spec)
+    else:
+        count('factorisation_cache_hits')
+    return _factorisations[key]
+
+def _factorise(K, permc_spec):
+    with phase('factorise', permc_spec=permc_spec):
+        lu = sp.linalg.splu(sp.csc_matrix(K), permc_spec=permc_spec)
+    peak('lu_nnz', lu.L.nnz + lu.U.nnz)
+    return lu
+
+def luBytesEstimate(K):
+    """
+    Estimates the memory of the SuperLU factors of K (COLAMD ordering), from
+    the fill of the las grids: nnz(L + U) grows from ~8 nnz(K) on the 5k grid
+    to ~16 nnz(K) on the 1.25k one, which is fitted by 0.93 N^0.27 nnz(K).
+
+    Parameters:
+    K (sp.spmatrix): The system matrix.
+
+    Returns:
+    float: Estimated bytes of the factors, at 12 per entry (value and index).
+    """
+    return 12*0.93*K.shape[0]**0.27*K.nnz
+
+@timed('linear_solve')
+def solveLinearSystem(K, F, method='direct', permc_spec='COLAMD',
+                      preconditioning='ilu', x0=None, rtol=1e-10, maxiter=None,
+                      restart=50, lu=None):
+    """
+    Solves K psi = F with the chosen backend.
+
+    Parameters:
+    K (sp.spmatrix): The system matrix.
+    F (np.ndarray): The right-hand side, or for the direct solver an 
+                    (N_equations, n) matrix of right-hand sides.
+    method (str, optional): 'direct' (default), 'gmres', 'bicgstab' or 'auto'.
+    permc_spec (str, optional): SuperLU column ordering for the direct solver,
+                                one of 'COLAMD' (default), 'MMD_AT_PLUS_A',
+                                'MMD_ATA' or 'NATURAL'.
+    preconditioning (str or None, optional): Krylov preconditioner, 'ilu'
+                                             (default), 'jacobi' or None.
+    x0 (np.ndarray, optional): Initial guess for the Krylov methods (warm start),
+                               e.g. the solution for nearby parameters.
+    rtol (float, optional): Relative tolerance of the Krylov methods.
+    maxiter (int, optional): Maximum number of Krylov iterations.
+    restart (int, optional): GMRES restart length. Default is 50.
+    lu (sp.linalg.SuperLU, optional): An existing factorisation of K (see
+                                      factorisation()) for the direct solver
+                                      to reuse.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - psi (np.ndarray): The solution.
+           - report (SolveReport): Iterations, residual and timing of the solve.
+    """
+    start = time.perf_counter()
+    if method == 'auto':
+        method = 'direct' if luBytesEstimate(K) <= auto_direct_max_bytes else 'gmres'
+
+    iterations = 0
+    if method == 'direct':
+        if lu is None:
+            lu = _factorise(K, permc_spec)
+        psi = lu.solve(F)
+        converged = True
+    elif method in ['gmres', 'bicgstab']:
+        if np.ndim(F) > 1:
+            raise ValueError("Several right-hand sides are only supported by the "
+                             "direct solver")
+        # count iterations through the callback
+        def callback(_):
+            nonlocal iterations
+            iterations += 1
+        M = preconditioner(K, preconditioning)
+        if method == 'gmres':
+            psi, info = sp.linalg.gmres(K, F, x0=x0, rtol=rtol, restart=restart,
+                                        maxiter=maxiter, M=M, callback=callback,
+                                        callback_type='pr_norm')
+        else:
+            psi, info = sp.linalg.bicgstab(K, F, x0=x0, rtol=rtol, maxiter=maxiter,
+                                           M=M, callback=callback)
+        converged = info == 0
+    else:
+        raise ValueError(f"Unknown linear solver {method!r}, choose from "
+                         "['direct', 'gmres', 'bicgstab', 'auto']")
+
+    count('linear_solver_iterations', iterations)
+    wall_time = time.perf_counter() - start
+    norm_F = np.linalg.norm(F)
+    residual = np.linalg.norm(F - K @ psi) / (norm_F if norm_F > 0 else 1)
+    return psi, SolveReport(method, iterations, residual, wall_time, converged)
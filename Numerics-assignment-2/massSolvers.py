@@ -0,0 +1,95 @@
+import numpy as np
+from scipy import sparse as sp
+import scipy.sparse.linalg
+from instrumentation import phase, count
+
+'''
+Solves with the mass matrix, M x = b, for evaluating the time derivative
+M^-1 (F - K psi) of the semi-discrete system without forming M^-1 (which is
+dense for a FE mass matrix).
+
+    'lu'      sparse LU of M, factorised once and reused for every solve
+    'cg'      conjugate gradients (M is symmetric positive definite) with a
+              diagonal preconditioner, warm-started from the previous solve
+    'lumped'  row-sum lumped mass, so M is replaced by a diagonal matrix and a
+              solve is a division. This changes the discretisation slightly.
+'''
+
+class MassSolver:
+    """
+    Repeated solves with a mass matrix.
+
+    Attributes:
+    strategy (str): 'lu', 'cg' or 'lumped'.
+    M (sp.spmatrix): The mass matrix.
+    rtol (float): Relative tolerance of the CG solves.
+    iterations (int): Total number of CG iterations so far.
+    """
+    __slots__ = ('strategy', 'M', 'rtol', 'iterations', '_lu', '_diagonal',
+                 '_preconditioner', '_x0')
+
+    def __init__(self, M, strategy='lu', rtol=1e-12):
+        """
+        Prepares the solves: factorises M, or forms its diagonal or lumped
+        diagonal.
+
+        Parameters:
+        M (sp.spmatrix): The mass matrix.
+        strategy (str, optional): 'lu' (default), 'cg' or 'lumped'.
+        rtol (float, optional): Relative tolerance of the CG solves. Default is
+                                1e-12.
+        """
+        self.strategy = strategy
+        self.M = M
+        self.rtol = rtol
+        self.iterations = 0
+        self._lu = None
+        self._diagonal = None
+        self._preconditioner = None
+        self._x0 = None
+        if strategy == 'lu':
+            with phase('mass_factorise'):
+                self._lu = sp.linalg.splu(sp.csc_matrix(M))
+        elif strategy == 'cg':
+            inverse_diagonal = 1/M.diagonal()
+            self._preconditioner = sp.linalg.LinearOperator(
+                M.shape, lambda x: inverse_diagonal*x)
+        elif strategy == 'lumped':
+            self._diagonal = np.asarray(M.sum(axis=1)).ravel()
+        else:
+            raise ValueError(f"Unknown mass solver {strategy!r}, choose from "
+                             "['lu', 'cg', 'lumped']")
+
+    @property
+    def matrix(self):
+        """The mass matrix that is solved with: M, or its lumped diagonal."""
+        if self._diagonal is not None:
+            return sp.diags(self._diagonal, format='csr')
+        return self.M
+
+    def solve(self, b):
+        """
+        Solves M x = b.
+
+        Parameters:
+        b (np.ndarray): The right-hand side.
+
+        Returns:
+        np.ndarray: The solution x (for 'lumped', with M replaced by its lumped
+                    diagonal).
+        """
+        count('mass_solves')
+        if self._lu is not None:
+            return self._lu.solve(b)
+        if self._diagonal is not None:
+            return b/self._diagonal
+
+        def callback(_):
+            self.iterations += 1
+            count('mass_cg_iterations')
+        x, info = sp.linalg.cg(self.M, b, x0=self._x0, rtol=self.rtol,
+                               M=self._preconditioner, callback=callback)
+        if info != 0:
+            raise RuntimeError(f'CG on the mass matrix did not converge (info={info})')
+        self._x0 = x
+        return x
@@ -0,0 +1,184 @@
+import os
+import json
+import hashlib
+import numpy as np
+from instrumentation import phase, count
+
+'''
+Loading of the las_grids and esw_grids meshes through a binary cache.
+
+The first time a grid is requested its three text files are parsed with
+np.loadtxt and saved as .npy files in <family>_grids/.cache/, alongside a small
+JSON record of the size, mtime and SHA-256 hash of each source file. Later
+requests check the record against the source files (mtime and size first, the
+hash only if those changed) and memory-map the .npy files instead of parsing
+the text again.
+'''
+
+# Directory containing las_grids/ and esw_grids/
+grid_root = os.path.dirname(os.path.abspath(__file__))
+
+# Available resolutions of each grid family, finest first
+grid_resolutions = {
+    'las': ['1_25', '2_5', '5', '10', '20', '40'],
+    'esw': ['6_25', '12_5', '25', '50', '100'],
+}
+
+# dtype of each of the three files making up a grid
+grid_dtypes = {
+    'nodes': np.float64,
+    'IEN': np.int64,
+    'bdry': np.int64,
+}
+
+def gridSourcePath(family, kind, resolution):
+    """
+    Path to one of the text files of a grid.
+
+    Parameters:
+    family (string): Grid family, 'las' or 'esw'.
+    kind (string): One of 'nodes', 'IEN' or 'bdry'.
+    resolution (string): Grid resolution, e.g. '1_25' for las_*_1_25k.txt.
+
+    Returns:
+    string: The path to the text file.
+    """
+    return os.path.join(grid_root, f'{family}_grids',
+                        f'{family}_{kind}_{resolution}k.txt')
+
+def gridCachePath(family, kind, resolution):
+    """
+    Path (without extension) of the cached binary copy of a grid file.
+
+    Parameters:
+    family (string): Grid family, 'las' or 'esw'.
+    kind (string): One of 'nodes', 'IEN' or 'bdry'.
+    resolution (string): Grid resolution.
+
+    Returns:
+    string: The cache path, to which '.npy' and '.json' are appended.
+    """
+    return os.path.join(grid_root, f'{family}_grids', '.cache',
+                        f'{family}_{kind}_{resolution}k')
+
+def fileHash(path):
+    """
+    Computes the SHA-256 hash of a file.
+
+    Parameters:
+    path (string): Path to the file.
+
+    Returns:
+    string: The hex digest.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _sourceRecord(path, sha256=None):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256 if sha256 is not None else fileHash(path)}
+
+def _writeAtomically(path, write):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as file:
+        write(file)
+    os.replace(tmp, path)
+
+def loadGridFile(family, kind, resolution, mmap=True):
+    """
+    Loads one of the three files of a grid, through the binary cache.
+
+    Parameters:
+    family (string): Grid family, 'las' or 'esw'.
+    kind (string): One of 'nodes', 'IEN' or 'bdry'.
+    resolution (string): Grid resolution.
+    mmap (bool, optional): Memory-map the cached array (read-only) rather than
+                           reading it into memory. Default is True.
+
+    Returns:
+    np.ndarray: The array np.loadtxt would have returned.
+    """
+    source = gridSourcePath(family, kind, resolution)
+    cache = gridCachePath(family, kind, resolution)
+
+    if os.path.exists(cache + '.npy') and os.path.exists(cache + '.json'):
+        with open(cache + '.json') as file:
+            record = json.load(file)
+        stat = os.stat(source)
+        valid = (stat.st_size == record['size']
+                 and stat.st_mtime_ns == record['mtime_ns'])
+        if not valid and stat.st_size == record['size']:
+            # touched but possibly unchanged: fall back on the content hash
+            sha256 = fileHash(source)
+            valid = sha256 == record['sha256']
+            if valid:
+                _writeAtomically(cache + '.json', lambda file: file.write(
+                    json.dumps(_sourceRecord(source, sha256)).encode()))
+        if valid:
+            count('grid_cache_hits')
+            return np.load(cache + '.npy', mmap_mode='r' if mmap else None)
+
+    with phase('loadtxt', file=os.path.basename(source)):
+        array = np.loadtxt(source, dtype=grid_dtypes[kind])
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        _writeAtomically(cache + '.npy', lambda file: np.save(file, array))
+        _writeAtomically(cache + '.json', lambda file: file.write(
+            json.dumps(_sourceRecord(source)).encode()))
+    except OSError:
+        # read-only checkout: just use the parsed array
+        pass
+    return array
+
+def loadGrid(family, resolution, mmap=True):
+    """
+    Loads the nodes, element connectivity and boundary nodes of a grid.
+
+    Parameters:
+    family (string): Grid family, 'las' or 'esw'.
+    resolution (string): Grid resolution, one of grid_resolutions[family].
+    mmap (bool, optional): Memory-map the cached arrays. Default is True.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - nodes (np.ndarray): (N_nodes, 2) array of node coordinates.
+           - IEN (np.ndarray): Array of element connectivity.
+           - boundary_nodes (np.ndarray): Array of indices of boundary nodes.
+    """
+    if family not in grid_resolutions:
+        raise ValueError(f'Unknown grid family {family!r}, choose from '
+                         f'{list(grid_resolutions)}')
+    return tuple(loadGridFile(family, kind, resolution, mmap)
+                 for kind in ['nodes', 'IEN', 'bdry'])
+
+def gridHash(family, resolution):
+    """
+    A hash of the contents of the three text files of a grid, e.g. for keying
+    results computed on it. The SHA-256 hashes recorded by the cache are used
+    when they are still valid, so the files are not normally read.
+
+    Parameters:
+    family (string): Grid family, 'las' or 'esw'.
+    resolution (string): Grid resolution.
+
+    Returns:
+    string: The hex digest.
+    """
+    sha = hashlib.sha256()
+    for kind in ['nodes', 'IEN', 'bdry']:
+        source = gridSourcePath(family, kind, resolution)
+        cache = gridCachePath(family, kind, resolution)
+        stat = os.stat(source)
+        sha256 = None
+        if os.path.exists(cache + '.json'):
+            with open(cache + '.json') as file:
+                record = json.load(file)
+            if (stat.st_size == record['size']
+                    and stat.st_mtime_ns == record['mtime_ns']):
+                sha256 = record['sha256']
+        sha.update((sha256 or fileHash(source)).encode())
+    return sha.hexdigest()
@@ -0,0 +1,330 @@
+import sys
+import numpy as np
+from elementKernels import (elementCoordinates, batchedJacobians,
+                            analyticGeometry)
+from sparseAssembly import AssemblyPlan
+from pointLocation import PointLocator
+from meshTopology import MeshTopology
+from meshCache import loadGrid
+from instrumentation import phase
+from dofNumbering import (tagBoundaryNodes, numberEquations, locationMatrix,
+                          scatterSolution)
+
+'''
+A Mesh object holding a triangulation together with everything that only
+depends on it: the equation numbering (ID and LM), the per-element geometry, the
+sparse assembly plan, the point location index and the connectivity tables. It
+is built once per grid and shared between the static solver, the time-evolved
+solver and pollutionExtractor.
+
+All per-element quantities are stored as separate contiguous arrays whose first
+axis runs over the elements ("struct of arrays"), so they can be passed
+straight to the batched kernels in elementKernels.py.
+'''
+
+# Meshes already built, keyed by (family, resolution)
+_meshes = {}
+
+# Northing [m] below which a boundary node of each grid family is on the
+# southern (Dirichlet) border. For las this is the south coast, as in the
+# original solvers. The esw grids have no such coast in the original code, so
+# their border is taken by analogy as the southern tenth of their northing
+# range (9484m to 977195m on the finest grid, giving 9484 + 0.1*967711 ~ 106km).
+# This is a modelling choice of this code, not of the grid data, and can be
+# changed here.
+boundary_y_max = {'las': 110000, 'esw': 106000}
+
+# Meshes built by arrayMesh for arrays that did not come from loadMesh, oldest
+# first
+_array_meshes = []
+
+# Number of meshes kept in _array_meshes before the oldest is dropped
+max_array_meshes = 4
+
+def lasBoundaryTags(nodes, boundary_nodes, y_max=110000):
+    """
+    Tags the boundary of one of the provided grids: the southern border (the
+    coast, on which the Dirichlet condition is imposed) and the rest, which is
+    left as a natural (Neumann) boundary.
+
+    Parameters:
+    nodes (np.ndarray): An (N_nodes, 2) array of node coordinates.
+    boundary_nodes (np.ndarray): Array of indices of the boundary nodes.
+    y_max (float, optional): Northing below which a boundary node counts as on
+                             the southern border [m]. Default is 110000.
+
+    Returns:
+    dict: Maps 'south' and 'neumann' to arrays of node indices.
+    """
+    return tagBoundaryNodes(np.asarray(nodes).T,
+                            {'south': lambda x, y: y <= y_max,
+                             'neumann': lambda x, y: np.ones_like(x, dtype=bool)},
+                            candidates=boundary_nodes)
+
+def unitSquareGrid(Nx):
+    """
+    Structured triangulation of the unit square, two triangles per square, 
+    with the left edge tagged Dirichlet and the other three Neumann.
+
+    Parameters:
+    Nx (int): Number of squares along each side.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - nodes (np.ndarray): An (N_nodes, 2) array of node coordinates.
+           - IEN (np.ndarray): Element connectivity array.
+           - tags (dict): Maps 'dirichlet' and 'neumann' to arrays of node 
+                          indices.
+    """
+    Nnodes = Nx + 1
+    X, Y = np.meshgrid(np.linspace(0, 1, Nnodes), np.linspace(0, 1, Nnodes))
+    nodes = np.column_stack((X.ravel(), Y.ravel()))
+    # two triangles per square, lower-left corner node (i, j)
+    i, j = np.meshgrid(np.arange(Nx), np.arange(Nx))
+    corner = (i + j*Nnodes).ravel()
+    IEN = np.zeros((2*Nx**2, 3), dtype=np.int64)
+    IEN[0::2, :] = np.column_stack((corner, corner+1, corner+Nnodes))
+    IEN[1::2, :] = np.column_stack((corner+1, corner+1+Nnodes, corner+Nnodes))
+    tags = tagBoundaryNodes(nodes.T, {
+        'dirichlet': lambda x, y: np.isclose(x, 0),
+        'neumann': lambda x, y: np.isclose(y, 0) | np.isclose(x, 1) | np.isclose(y, 1)})
+    return nodes, IEN, tags
+
+class Mesh:
+    """
+    A triangular mesh with its precomputed equation numbering and geometry.
+
+    Attributes:
+    key (hashable): Identifies the mesh, e.g. ('las', '1_25'), or None.
+    nodes (np.ndarray): A 2xN_nodes array of node coordinates.
+    IEN (np.ndarray): (N_elements, 3) element connectivity array.
+    boundary_tags (dict): Named sets of boundary node indices.
+    dirichlet_tags (tuple): Names of the tags imposed as homogeneous Dirichlet.
+    boundary_nodes (np.ndarray): Array of indices of all tagged nodes.
+    dirichlet_nodes (np.ndarray): Array of indices of the Dirichlet nodes.
+    ID (np.ndarray): Equation number of each node, -1 on Dirichlet nodes.
+    LM (np.ndarray): (3, N_elements) location matrix.
+    xes (np.ndarray): (N_elements, 2, 3) stack of element coordinates.
+    jacobians (np.ndarray): (N_elements, 2, 2) Jacobians of the local-to-global
+                            map.
+    detJ (np.ndarray): Jacobian determinants.
+    invJT (np.ndarray): (N_elements, 2, 2) inverse-transposed Jacobians.
+    dxNa (np.ndarray): (N_elements, 2, 3) global shape-function gradients.
+    areas (np.ndarray): Element areas.
+    centroids (np.ndarray): (N_elements, 2) element centroids.
+    """
+    __slots__ = ('key', 'nodes', 'IEN', 'boundary_tags', 'dirichlet_tags',
+                 'boundary_nodes', 'dirichlet_nodes', 'ID', 'LM', 'xes',
+                 'jacobians', 'detJ', 'invJT', 'dxNa', 'areas', 'centroids',
+                 '_assembly_plan', '_point_locator', '_topology')
+
+    def __init__(self, nodes, IEN, boundary_tags, dirichlet_tags, key=None):
+        """
+        Builds the mesh and all its derived arrays.
+
+        Parameters:
+        nodes (np.ndarray): An (N_nodes, 2) array of node coordinates, as stored
+                            in the grid files.
+        IEN (np.ndarray): Element connectivity array.
+        boundary_tags (dict): Named sets of boundary node indices, see
+                              dofNumbering.tagBoundaryNodes.
+        dirichlet_tags (iterable): Names of the tags on which the solution is
+                                   zero, and so ignored by the solver.
+        key (hashable, optional): Identifies the mesh. Default is None.
+        """
+        self.key = key
+        self.nodes = np.ascontiguousarray(np.asarray(nodes, dtype=float).T)
+        self.IEN = np.ascontiguousarray(IEN, dtype=np.int64)
+        self.boundary_tags = {name: np.asarray(node_set, dtype=np.int64)
+                              for name, node_set in boundary_tags.items()}
+        self.dirichlet_tags = tuple(dirichlet_tags)
+        self.boundary_nodes = np.unique(np.concatenate(
+            [np.zeros(0, dtype=np.int64)] + list(self.boundary_tags.values())))
+        self.dirichlet_nodes = np.unique(np.concatenate(
+            [np.zeros(0, dtype=np.int64)]
+            + [self.boundary_tags[name] for name in self.dirichlet_tags]))
+
+        # Equation numbering, skipping the Dirichlet nodes, and location matrix
+        self.ID = numberEquations(self.N_nodes, self.dirichlet_nodes)
+        self.LM = locationMatrix(self.IEN, self.ID)
+
+        # Element geometry
+        self.xes = elementCoordinates(self.nodes, self.IEN)
+        self.jacobians = batchedJacobians(self.xes)
+        self.areas, self.dxNa = analyticGeometry(self.xes)
+        self.detJ = np.linalg.det(self.jacobians)
+        self.invJT = np.ascontiguousarray(np.linalg.inv(self.jacobians).transpose(0, 2, 1))
+        self.centroids = np.ascontiguousarray(self.xes.mean(axis=2))
+        self._assembly_plan = None
+        self._point_locator = None
+        self._topology = None
+
+    @property
+    def N_nodes(self):
+        """Number of nodes."""
+        return self.nodes.shape[1]
+
+    @property
+    def N_elements(self):
+        """Number of elements."""
+        return self.IEN.shape[0]
+
+    @property
+    def N_equations(self):
+        """Number of equations (non-Dirichlet nodes)."""
+        return int(np.max(self.ID)) + 1
+
+    @property
+    def geometry(self):
+        """The (areas, dxNa) pair accepted by the kernels in elementKernels.py."""
+        return self.areas, self.dxNa
+
+    @property
+    def assemblyPlan(self):
+        """The sparse assembly plan of the mesh, built on first use."""
+        if self._assembly_plan is None:
+            self._assembly_plan = AssemblyPlan(self.LM, self.N_equations)
+        return self._assembly_plan
+
+    @property
+    def pointLocator(self):
+        """The point location index of the mesh, built on first use."""
+        if self._point_locator is None:
+            self._point_locator = PointLocator(self)
+        return self._point_locator
+
+    @property
+    def topology(self):
+        """The element lookup and adjacency tables of the mesh, built on first use."""
+        if self._topology is None:
+            self._topology = MeshTopology(self.IEN, self.N_nodes)
+        return self._topology
+
+    @property
+    def nbytes(self):
+        """
+        Memory footprint of the arrays held by the mesh [bytes], including
+        those of the assembly plan, point locator and topology once they are
+        built. The k-d tree's own nodes and the keys of the topology's triangle
+        index are not counted, only the tree's data and the index's hash table.
+        """
+        total = _arrayBytes(self, self.__slots__)
+        if self._assembly_plan is not None:
+            total += _arrayBytes(self._assembly_plan, AssemblyPlan.__slots__)
+        if self._point_locator is not None:
+            tree = self._point_locator.tree
+            total += tree.data.nbytes + tree.indices.nbytes
+        if self._topology is not None:
+            # the topology's IEN is the mesh's own
+            total += _arrayBytes(self._topology, [name for name in MeshTopology.__slots__
+                                                  if name != 'IEN'])
+            total += sys.getsizeof(self._topology.triangle_index)
+        return total
+
+    def localCoords(self, elements, x):
+        """
+        Transforms global coordinates to local coordinates, vectorised over
+        points, using the precomputed inverse Jacobians.
+
+        Parameters:
+        elements (array-like): Index of the element to map each point into.
+        x (np.ndarray): A 2xN_points array (or a 2-element array) of global
+                        coordinates.
+
+        Returns:
+        np.ndarray: The local coordinates (xi1, xi2), with the same shape as x.
+        """
+        elements = np.asarray(elements)
+        x = np.asarray(x, dtype=float)
+        offsets = x - self.xes[elements, :, 0].T
+        # xi = J^-1 (x - x0^e), with J^-1 = invJT^T
+        return np.einsum('...ji,j...->i...', self.invJT[elements], offsets)
+
+    def scatter(self, Psi_interior):
+        """
+        Expands a solution on the equations to all nodes, with zeros on the
+        Dirichlet nodes.
+
+        Parameters:
+        Psi_interior (np.ndarray): Solution values, one per equation. Extra
+                                   trailing axes are carried over.
+
+        Returns:
+        np.ndarray: Solution values at every node.
+        """
+        return scatterSolution(self.ID, Psi_interior)
+
+def _arrayBytes(obj, names):
+    # total size of the attributes of obj in names that are arrays
+    return sum(getattr(obj, name).nbytes for name in names
+               if isinstance(getattr(obj, name), np.ndarray))
+
+def loadMesh(resolution, family='las'):
+    """
+    Returns the Mesh of one of the provided grids, building it on first use only.
+
+    Parameters:
+    resolution (string): Grid resolution, e.g. one of ['1_25', '2_5', '5', '10',
+                         '20', '40'] for the las grids.
+    family (string, optional): Grid family, 'las' (default) or 'esw'.
+
+    Returns:
+    Mesh: The (possibly cached) mesh, with the boundary nodes south of
+          boundary_y_max[family] as Dirichlet boundary (see boundary_y_max for
+          where the esw value comes from).
+    """
+    key = (family, resolution)
+    if key not in _meshes:
+        with phase('load_mesh', resolution=resolution):
+            nodes, IEN, boundary_nodes = loadGrid(family, resolution)
+            tags = lasBoundaryTags(nodes, boundary_nodes, boundary_y_max[family])
+            _meshes[key] = Mesh(nodes, IEN, tags, ('south',), key=key)
+    return _meshes[key]
+
+def meshFromArrays(nodes, IEN):
+    """
+    Finds the cached Mesh whose node and element arrays are the given ones, e.g.
+    those returned by one of the solvers. The arrays themselves are matched 
+    first, then their contents, so copies (or reloaded arrays) match too.
+
+    Parameters:
+    nodes (np.ndarray or None): A 2xN array containing the coordinates of the
+                                nodes, or None to match on IEN alone.
+    IEN (np.ndarray): Element connectivity array.
+
+    Returns:
+    Mesh or None: The matching mesh, or None if there is none.
+    """
+    meshes = list(_meshes.values()) + _array_meshes
+    for mesh in meshes:
+        if (nodes is None or mesh.nodes is nodes) and mesh.IEN is IEN:
+            return mesh
+    IEN = np.asarray(IEN)
+    nodes = None if nodes is None else np.asarray(nodes)
+    for mesh in meshes:
+        if (mesh.IEN.shape == IEN.shape and np.array_equal(mesh.IEN, IEN)
+                and (nodes is None or (mesh.nodes.shape == nodes.shape
+                                       and np.array_equal(mesh.nodes, nodes)))):
+            return mesh
+    return None
+
+def arrayMesh(nodes, IEN):
+    """
+    Returns the Mesh of a pair of node and element arrays: the cached one they
+    match (see meshFromArrays), or else one built (without boundary conditions,
+    e.g. for point location) on first use only.
+
+    Parameters:
+    nodes (np.ndarray): A 2xN array containing the coordinates of the nodes.
+    IEN (np.ndarray): Element connectivity array.
+
+    Returns:
+    Mesh: The (possibly cached) mesh.
+    """
+    mesh = meshFromArrays(nodes, IEN)
+    if mesh is None:
+        if len(_array_meshes) >= max_array_meshes:
+            del _array_meshes[0]
+        mesh = Mesh(np.asarray(nodes).T, IEN, {}, ())
+        _array_meshes.append(mesh)
+    return mesh
@@ -0,0 +1,116 @@
+import numpy as np
+
+'''
+Connectivity tables of a triangulation, built once per mesh with array
+operations:
+
+    triangle_index  canonical (sorted) node triple -> element, as a hash table
+    node-to-element the elements around each node, in CSR form
+    edges           every edge once, as a sorted node pair
+    element_edges   the edge opposite each local node of each element
+    edge_elements   the (one or two) elements on each edge
+    neighbours      the element across each edge of each element
+
+Local edge a of an element is the one opposite its local node a, i.e. joining
+local nodes a+1 and a+2 (mod 3), so that a negative barycentric coordinate a
+points across edge a.
+'''
+
+class MeshTopology:
+    """
+    Element lookup and adjacency tables of a triangulation.
+
+    Attributes:
+    IEN (np.ndarray): (N_elements, 3) element connectivity array.
+    N_nodes (int): Number of nodes.
+    triangle_index (dict): Maps each sorted node triple to its element index.
+    node_element_ptr (np.ndarray): CSR pointer of the node-to-element table, so
+                                   the elements around node n are
+                                   node_elements[node_element_ptr[n]:node_element_ptr[n+1]].
+    node_elements (np.ndarray): CSR indices of the node-to-element table.
+    edges (np.ndarray): (N_edges, 2) array of sorted node pairs.
+    element_edges (np.ndarray): (N_elements, 3) edge index of each local edge.
+    edge_elements (np.ndarray): (N_edges, 2) elements on each edge, -1 for the
+                                missing one on boundary edges.
+    neighbours (np.ndarray): (N_elements, 3) element across each local edge, -1
+                             on the boundary.
+    """
+    __slots__ = ('IEN', 'N_nodes', 'triangle_index', 'node_element_ptr',
+                 'node_elements', 'edges', 'element_edges', 'edge_elements',
+                 'neighbours')
+
+    def __init__(self, IEN, N_nodes=None):
+        """
+        Builds all the tables.
+
+        Parameters:
+        IEN (np.ndarray): Element connectivity array.
+        N_nodes (int, optional): Number of nodes. Default is None, meaning one
+                                 more than the largest node index in IEN.
+        """
+        self.IEN = np.asarray(IEN, dtype=np.int64)
+        N_elements = self.IEN.shape[0]
+        self.N_nodes = int(self.IEN.max()) + 1 if N_nodes is None else N_nodes
+
+        # np.sort() as the order of the nodes in a triangle need not be the same
+        # as they appear in IEN
+        self.triangle_index = dict(zip(map(tuple, np.sort(self.IEN, axis=1).tolist()),
+                                       range(N_elements)))
+
+        # Node-to-element table: group the (node, element) pairs by node
+        order = np.argsort(self.IEN.ravel(), kind='stable')
+        self.node_elements = order // 3
+        self.node_element_ptr = np.zeros(self.N_nodes + 1, dtype=np.int64)
+        self.node_element_ptr[1:] = np.cumsum(np.bincount(self.IEN.ravel(),
+                                                          minlength=self.N_nodes))
+
+        # Edges: local edge a joins local nodes a+1 and a+2
+        local_edges = np.stack([self.IEN[:, [1, 2]], self.IEN[:, [2, 0]],
+                                self.IEN[:, [0, 1]]], axis=1)
+        local_edges = np.sort(local_edges, axis=2).reshape(-1, 2)
+        self.edges, edge_ids = np.unique(local_edges, axis=0, return_inverse=True)
+        edge_ids = edge_ids.ravel()
+        self.element_edges = edge_ids.reshape(N_elements, 3)
+
+        # Each edge has one element (boundary) or two (interior)
+        order = np.argsort(edge_ids, kind='stable')
+        sorted_ids = edge_ids[order]
+        first = np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]
+        self.edge_elements = np.full((len(self.edges), 2), -1, dtype=np.int64)
+        self.edge_elements[sorted_ids[first], 0] = order[first] // 3
+        self.edge_elements[sorted_ids[~first], 1] = order[~first] // 3
+
+        # The neighbour across an edge is whichever of its elements is not this one
+        across = self.edge_elements[self.element_edges]
+        own = np.arange(N_elements)[:, np.newaxis]
+        self.neighbours = np.where(across[:, :, 0] == own, across[:, :, 1],
+                                   across[:, :, 0])
+
+    @property
+    def boundary_edges(self):
+        """Indices of the edges with only one element."""
+        return np.where(self.edge_elements[:, 1] < 0)[0]
+
+    def findElement(self, triangle):
+        """
+        Looks up a triangle, given by its nodes in any order.
+
+        Parameters:
+        triangle (array-like): The indices of the three nodes.
+
+        Returns:
+        int: The index of the element in IEN, or -1 if it is not an element.
+        """
+        return self.triangle_index.get(tuple(sorted(int(n) for n in triangle)), -1)
+
+    def nodeElements(self, node):
+        """
+        The elements around a node.
+
+        Parameters:
+        node (int): Node index.
+
+        Returns:
+        np.ndarray: Indices of the elements that have the node as a vertex.
+        """
+        return self.node_elements[self.node_element_ptr[node]:self.node_element_ptr[node+1]]
@@ -0,0 +1,148 @@
+import numpy as np
+from instrumentation import peak
+
+'''
+Output sinks for the time-evolved solver. The solver hands each normalised
+frame (the solution at all nodes at one output time) to a sink as soon as it is
+computed, and never holds more than one frame itself, so memory only grows with
+the number of output times if the sink chooses to keep them.
+
+    MemorySink      keeps every frame in an (N_nodes, N_times) array (default)
+    MemmapSink      writes every frame to an (N_nodes, N_times) .npy file
+    ReceptorSink    keeps only the values at some receptors, R @ frame, and
+                    optionally the last frame
+    EveryKthSink    passes every k-th frame on to another sink
+
+Every sink has the same three methods: open(N_nodes, ts) before the first
+frame, write(i, psi) for frame i at time ts[i], and close(), which returns the
+result. The output times actually kept are available as sink.ts.
+'''
+
+class MemorySink:
+    """
+    Keeps every frame in memory.
+
+    Attributes:
+    ts (np.ndarray): The output times.
+    Psi (np.ndarray): An (N_nodes, N_times) array of frames.
+    """
+    __slots__ = ('ts', 'Psi')
+
+    def __init__(self):
+        self.ts = None
+        self.Psi = None
+
+    def open(self, N_nodes, ts):
+        self.ts = ts
+        self.Psi = np.zeros((N_nodes, len(ts)))
+        peak('frame_store_bytes', self.Psi.nbytes)
+
+    def write(self, i, psi):
+        self.Psi[:, i] = psi
+
+    def close(self):
+        return self.Psi
+
+class MemmapSink:
+    """
+    Writes every frame to a memory-mapped .npy file, stored column by column
+    (Fortran order) so each frame is one contiguous write.
+
+    Attributes:
+    filename (str): Path of the .npy file.
+    ts (np.ndarray): The output times.
+    Psi (np.memmap): The (N_nodes, N_times) array in the file.
+    """
+    __slots__ = ('filename', 'ts', 'Psi')
+
+    def __init__(self, filename):
+        """
+        Parameters:
+        filename (str): Path of the .npy file to write, overwritten if it exists.
+        """
+        self.filename = filename
+        self.ts = None
+        self.Psi = None
+
+    def open(self, N_nodes, ts):
+        self.ts = ts
+        self.Psi = np.lib.format.open_memmap(self.filename, mode='w+', dtype=float,
+                                             shape=(N_nodes, len(ts)),
+                                             fortran_order=True)
+
+    def write(self, i, psi):
+        self.Psi[:, i] = psi
+
+    def close(self):
+        self.Psi.flush()
+        return self.Psi
+
+class ReceptorSink:
+    """
+    Keeps only the values of each frame at a set of receptors.
+
+    Attributes:
+    R (sp.spmatrix): (N_receptors, N_nodes) interpolation matrix, see
+                     PointLocator.interpolationMatrix.
+    keep_final (bool): Whether the last frame is kept as well.
+    ts (np.ndarray): The output times.
+    values (np.ndarray): An (N_receptors, N_times) array of receptor values.
+    final (np.ndarray): The last frame written, if keep_final.
+    """
+    __slots__ = ('R', 'keep_final', 'ts', 'values', 'final')
+
+    def __init__(self, R, keep_final=False):
+        """
+        Parameters:
+        R (sp.spmatrix): (N_receptors, N_nodes) interpolation matrix.
+        keep_final (bool, optional): Also keep the last frame. Default is False.
+        """
+        self.R = R
+        self.keep_final = keep_final
+        self.ts = None
+        self.values = None
+        self.final = None
+
+    def open(self, N_nodes, ts):
+        self.ts = ts
+        self.values = np.zeros((self.R.shape[0], len(ts)))
+
+    def write(self, i, psi):
+        self.values[:, i] = self.R @ psi
+        if self.keep_final:
+            self.final = psi
+
+    def close(self):
+        return self.values
+
+class EveryKthSink:
+    """
+    Passes every k-th frame (starting with the first) on to another sink.
+
+    Attributes:
+    sink: The sink the kept frames are written to.
+    k (int): Keep one frame in k.
+    ts (np.ndarray): The output times that are kept.
+    """
+    __slots__ = ('sink', 'k', 'ts')
+
+    def __init__(self, sink, k):
+        """
+        Parameters:
+        sink: The sink the kept frames are written to.
+        k (int): Keep one frame in k.
+        """
+        self.sink = sink
+        self.k = k
+        self.ts = None
+
+    def open(self, N_nodes, ts):
+        self.ts = ts[::self.k]
+        self.sink.open(N_nodes, self.ts)
+
+    def write(self, i, psi):
+        if i % self.k == 0:
+            self.sink.write(i // self.k, psi)
+
+    def close(self):
+        return self.sink.close()
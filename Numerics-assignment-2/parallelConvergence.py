@@ -0,0 +1,165 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from meshCache import gridHash
+from resultCache import ResultCache, resultKey, solverCodeKey, result_cache_dir
+from meshGeometry import loadMesh
+from TwoDimStaticAdvDiffFESolver import TwoDimStaticAdvDiffFESolver
+from TwoDimTimeEvolvedAdvDiffFESolver import TwoDimTimeEvolvedAdvDiffFEReceptors
+from staticPollutionOverReading import S_sotonfire
+import staticPollutionOverReading
+import timeEvolvedPollutionOverReading
+
+'''
+The convergence studies of staticPollutionOverReading and 
+timeEvolvedPollutionOverReading, with every (resolution, u, D) solve dispatched
+to a process pool and its result cached on disk.
+
+Results are stored in a ResultCache (see resultCache.py), keyed by the name of
+the solve, the source term, the grid files and the other inputs, so rerunning a
+study (or another study sharing some of its solves, e.g. the 1.25k solution)
+only computes what is missing. The cached results are the
+normalised static solution at every node and the normalised time series at the
+receptor. Both studies write the same text files as the serial versions.
+'''
+
+# Resolutions of the static study, finest (and so slowest) first
+static_resolutions = ['1_25', '2_5', '5', '10', '20', '40']
+
+# Resolutions of the time-dependent study: N, 2N, 4N
+time_dependent_resolutions = ['20', '10', '5']
+
+def staticSolution(S, u, D, resolution):
+    """
+    The normalised static solution at every node.
+    """
+    return TwoDimStaticAdvDiffFESolver(S, u, D, resolution)[3]
+
+def receptorTimeSeries(S, u, D, resolution, t_max, coords, integrator):
+    """
+    The normalised time series at a point.
+    """
+    return TwoDimTimeEvolvedAdvDiffFEReceptors(S, u, D, resolution, t_max, coords,
+                                               integrator=integrator)[1][0]
+
+def solutionKey(solve, S, u, D, resolution, *options):
+    """
+    The cache key of one solve.
+
+    Parameters:
+    solve (function): The module-level function doing the solve.
+    S (function): The source term, see resultCache.sourceKey.
+    u, D, resolution, *options: The other arguments of solve.
+
+    Returns:
+    string: The hex digest identifying the result.
+    """
+    return resultKey(f'{solve.__module__}.{solve.__qualname__}', solverCodeKey(), S, u, D,
+                     gridHash('las', resolution), *options)
+
+def _cachedSolve(cache_dir, solve, args):
+    # runs in a worker: solve and store the result before returning it
+    result = solve(*args)
+    if cache_dir is not None:
+        ResultCache(cache_dir).put(solutionKey(solve, *args), [result])
+    return result
+
+def solveAll(jobs, cache_dir=result_cache_dir, max_workers=None):
+    """
+    Runs a list of solves, taking those already done from the cache and 
+    dispatching the rest to a process pool.
+
+    Parameters:
+    jobs (list): (solve, args) pairs, where solve is a module-level function
+                 (so it can be sent to a worker) and args its arguments, the
+                 source term first.
+    cache_dir (string, optional): Directory of cached results. Default is
+                                  result_cache_dir, None disables the cache.
+    max_workers (int, optional): Number of worker processes. Default is None,
+                                 meaning the number of CPUs.
+
+    Returns:
+    list: The result of each job.
+    """
+    results = [None]*len(jobs)
+    missing = []
+    for i, (solve, args) in enumerate(jobs):
+        cached = (None if cache_dir is None else
+                  ResultCache(cache_dir).get(solutionKey(solve, *args)))
+        if cached is not None:
+            results[i] = cached[0]
+        else:
+            missing.append(i)
+    
+    if missing:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {i: pool.submit(_cachedSolve, cache_dir, *jobs[i]) 
+                       for i in missing}
+            for i, future in futures.items():
+                results[i] = future.result()
+    return results
+
+def staticConvergence(coords, u, D, S=S_sotonfire, cache_dir=result_cache_dir,
+                      max_workers=None):
+    """
+    The static convergence study of staticPollutionOverReading.convergence, 
+    with the six resolutions solved in parallel. Writes the same
+    static_convergence_results_for_u=[...].txt file (but no plots).
+
+    Parameters:
+    coords (array-like): A 2-element array containing the coordinates where the 
+                         pollution value is to be extracted.
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    S (function, optional): Module-level source term function. Default is 
+                            S_sotonfire.
+    cache_dir (string, optional): Directory of cached solutions, None disables 
+                                  the cache.
+    max_workers (int, optional): Number of worker processes. Default is the
+                                 number of CPUs.
+
+    Returns:
+    dict: The pollution at coords for each resolution.
+    """
+    psis = solveAll([(staticSolution, (S, u, D, res)) for res in static_resolutions],
+                    cache_dir, max_workers)
+    pollutions = {res: (loadMesh(res).pointLocator.interpolationMatrix(coords) @ psi)[0]
+                  for res, psi in zip(static_resolutions, psis)}
+    staticPollutionOverReading.writeConvergenceResults(pollutions, u)
+    return pollutions
+
+def timeDependentConvergence(t_max, u, D, coords, integrator='RK45', S=S_sotonfire,
+                             cache_dir=result_cache_dir, max_workers=None):
+    """
+    The time-dependent convergence study of 
+    timeEvolvedPollutionOverReading.convergence, with the three resolutions 
+    solved in parallel. Writes the same 
+    time_dep_convergence_results_for_u=[...].txt file.
+
+    Parameters:
+    t_max (float): Maximum runtime of the simulation [s].
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    coords (array-like): A 2-element array containing the coordinates where the
+                         pollution value is to be extracted.
+    integrator (str, optional): Time integrator of the solver, 'RK45' (default)
+                                or e.g. 'exponential'.
+    S, cache_dir, max_workers (optional): As for staticConvergence.
+
+    Returns:
+    list: The time series at coords for the 20k, 10k and 5k resolutions.
+    """
+    solns = solveAll([(receptorTimeSeries, (S, u, D, res, t_max, coords, integrator))
+                      for res in time_dependent_resolutions], cache_dir, max_workers)
+    timeEvolvedPollutionOverReading.writeConvergenceResults(*solns, u)
+    return solns
+
+if __name__ == '__main__':
+    
+    north = np.array([0,1])
+    directed_at_reading = np.array([473993 - 442365, 171625 - 115483])
+    directed_at_reading = 1/np.linalg.norm(directed_at_reading)*directed_at_reading
+    reading = np.array([473993, 171625])
+    
+    for u in [-10*north, -10*directed_at_reading]:
+        staticConvergence(reading, u, 10000)
+        timeDependentConvergence(15000, u, 10000, reading, integrator='exponential')
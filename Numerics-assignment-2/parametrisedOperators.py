@@ -0,0 +1,163 @@
+import numpy as np
+from scipy import sparse as sp
+from elementKernels import elementKernel, batched_force
+from massSolvers import MassSolver
+from instrumentation import phase, peak
+
+'''
+Affine decomposition of the advection-diffusion operator in its parameters.
+
+The global stiffness matrix is
+
+    K(u, D) = D*Kd - (u_x*Ax + u_y*Ay)
+
+where Kd is the diffusion matrix and Ax, Ay are the advection matrices for unit
+wind along x and y. These (and the mass matrix) only depend on the mesh, so are
+assembled once, on the mesh's shared sparsity pattern, after which K for any
+(u, D) is a linear combination of three CSR data arrays.
+'''
+
+# Operators already assembled, keyed by (mesh key, kernel backend)
+_operators = {}
+
+class AffineOperator:
+    """
+    The parameter-independent pieces of the advection-diffusion operator on a
+    mesh, all sharing the mesh's CSR sparsity pattern.
+
+    Attributes:
+    mesh (Mesh): The mesh the operator is assembled on.
+    Kd (sp.csr_matrix): Diffusion stiffness matrix (unit D).
+    Ax (sp.csr_matrix): Advection stiffness matrix for u = [1, 0].
+    Ay (sp.csr_matrix): Advection stiffness matrix for u = [0, 1].
+    """
+    __slots__ = ('mesh', 'kernels', 'Kd', 'Ax', 'Ay', '_M', '_mass_solvers')
+
+    def __init__(self, mesh, kernels='analytic'):
+        """
+        Assembles Kd, Ax and Ay.
+
+        Parameters:
+        mesh (Mesh): The mesh to assemble on.
+        kernels (string, optional): Element matrix backend, 'analytic' (default)
+                                    or 'quadrature'.
+        """
+        self.mesh = mesh
+        self.kernels = kernels
+        plan = mesh.assemblyPlan
+        with phase('operator_assembly', kernels=kernels):
+            self.Kd = plan.assembleMatrix(
+                elementKernel('diffusion_stiffness', kernels)(mesh.xes, mesh.geometry))
+            advection = elementKernel('advection_stiffness', kernels)
+            self.Ax = plan.assembleMatrix(advection(mesh.xes, [1, 0], mesh.geometry))
+            self.Ay = plan.assembleMatrix(advection(mesh.xes, [0, 1], mesh.geometry))
+        peak('operator_bytes', 3*self.Kd.data.nbytes + self.Kd.indices.nbytes 
+             + self.Kd.indptr.nbytes)
+        self._M = None
+        self._mass_solvers = dict()
+
+    @property
+    def M(self):
+        """The mass matrix (CSC), assembled on first use."""
+        if self._M is None:
+            with phase('mass_assembly', kernels=self.kernels):
+                m_es = elementKernel('mass', self.kernels)(self.mesh.xes,
+                                                           self.mesh.geometry)
+                self._M = self.mesh.assemblyPlan.assembleMatrix(m_es).tocsc()
+        return self._M
+
+    def massSolver(self, strategy='lu'):
+        """
+        Returns the solver for M x = b with the given strategy, preparing it on
+        first use only.
+
+        Parameters:
+        strategy (str, optional): 'lu' (default), 'cg' or 'lumped'. See 
+                                  massSolvers.py.
+
+        Returns:
+        MassSolver: The (possibly cached) solver.
+        """
+        if strategy not in self._mass_solvers:
+            self._mass_solvers[strategy] = MassSolver(self.M, strategy)
+        return self._mass_solvers[strategy]
+
+    def stiffness(self, u, D):
+        """
+        Forms the global stiffness matrix for one set of parameters.
+
+        Parameters:
+        u (array-like): Advection velocity vector [ms^-1].
+        D (float): Diffusion coefficient [m^2s^-1].
+
+        Returns:
+        sp.csr_matrix: K(u, D) = D*Kd - (u_x*Ax + u_y*Ay).
+        """
+        data = D*self.Kd.data - (u[0]*self.Ax.data + u[1]*self.Ay.data)
+        return sp.csr_matrix((data, self.Kd.indices, self.Kd.indptr),
+                             shape=self.Kd.shape)
+
+    def force(self, S):
+        """
+        Assembles the global force vector for a source term.
+
+        Parameters:
+        S (function): Source term function, written with array operations.
+
+        Returns:
+        np.ndarray: The global force vector.
+        """
+        with phase('force'):
+            f_es = batched_force(self.mesh.xes, S, self.mesh.geometry)
+            return self.mesh.assemblyPlan.assembleVector(f_es)
+
+    def forces(self, Ss):
+        """
+        Assembles the global force vectors of several source terms.
+
+        Parameters:
+        Ss (list): Source term functions, written with array operations.
+
+        Returns:
+        np.ndarray: An (N_equations, len(Ss)) array, one force vector per column.
+        """
+        return np.column_stack([self.force(S) for S in Ss])
+
+def affineOperator(mesh, kernels='analytic'):
+    """
+    Returns the affine decomposition of the operator on a mesh, assembling it on
+    first use only.
+
+    Parameters:
+    mesh (Mesh): The mesh to assemble on.
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'.
+
+    Returns:
+    AffineOperator: The (possibly cached) operator.
+    """
+    key = (mesh.key, kernels)
+    if mesh.key is None:
+        return AffineOperator(mesh, kernels)
+    if key not in _operators:
+        _operators[key] = AffineOperator(mesh, kernels)
+    return _operators[key]
+
+def parameterSets(us, Ds):
+    """
+    Broadcasts arrays of wind vectors and diffusion coefficients against each
+    other.
+
+    Parameters:
+    us (array-like): One wind vector [u_x, u_y] or an (n, 2) array of them.
+    Ds (float or array-like): One diffusion coefficient or n of them.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - us (np.ndarray): An (n, 2) array of wind vectors.
+           - Ds (np.ndarray): An array of n diffusion coefficients.
+    """
+    us = np.atleast_2d(np.asarray(us, dtype=float))
+    Ds = np.atleast_1d(np.asarray(Ds, dtype=float))
+    n = np.broadcast_shapes((us.shape[0],), Ds.shape)[0]
+    return np.broadcast_to(us, (n, 2)), np.broadcast_to(Ds, (n,))
@@ -0,0 +1,145 @@
+import numpy as np
+from scipy import sparse as sp
+from scipy.spatial import cKDTree
+from instrumentation import count
+
+'''
+Point location on a triangular mesh: finding the element that contains a point,
+and the point's barycentric coordinates in it (which are exactly the values of
+the three local shape functions there).
+
+A KD-tree over the element centroids is built once per mesh. Each query takes
+the elements with the nearest centroids as candidates and keeps the first one
+whose barycentric coordinates are all non-negative, so a query costs O(log N)
+rather than a scan over every node. Points not contained in any of the
+candidates (e.g. near very stretched elements, or outside the mesh) walk from
+the nearest candidate across the edge of most negative barycentric coordinate,
+using the neighbour table of the mesh (see meshTopology.py), until they reach
+their element or the boundary.
+
+For fixed receptor locations, interpolationMatrix() packs the located elements
+and weights into a sparse (N_points x N_nodes) matrix R, so that the values at
+every receptor of any number of nodal fields are R @ psi.
+'''
+
+class PointLocator:
+    """
+    Point location index of a mesh.
+
+    Attributes:
+    mesh (Mesh): The mesh the index is built on.
+    tree (cKDTree): KD-tree over the element centroids.
+    """
+    __slots__ = ('mesh', 'tree')
+
+    # Number of nearest centroids tried first, and the most tried before a point
+    # is deemed to lie outside the mesh
+    initial_candidates = 8
+    max_candidates = 64
+
+    def __init__(self, mesh):
+        """
+        Builds the KD-tree.
+
+        Parameters:
+        mesh (Mesh): The mesh to index, see meshGeometry.py.
+        """
+        self.mesh = mesh
+        self.tree = cKDTree(mesh.centroids)
+
+    def locate(self, points, tol=1e-10):
+        """
+        Finds the element containing each point.
+
+        Parameters:
+        points (np.ndarray): A 2xN_points array (or a 2-element array) of global
+                             coordinates.
+        tol (float, optional): Tolerance on the barycentric coordinates, so that
+                               points on an edge count as inside. Default 1e-10.
+
+        Returns:
+        tuple: A tuple containing the following elements:
+               - elements (np.ndarray): Index of the containing element of each
+                 point. A point outside the mesh gets the boundary element
+                 the walk towards it stopped in instead.
+               - weights (np.ndarray): An (N_points, 3) array of barycentric
+                 coordinates, i.e. the local shape functions at each point,
+                 extrapolated for points outside the mesh.
+               - inside (np.ndarray): Whether each point lies in the mesh.
+        """
+        x = np.asarray(points, dtype=float).reshape(2, -1)
+        N_points = x.shape[1]
+        count('located_points', N_points)
+        elements = np.zeros(N_points, dtype=np.int64)
+        xi = np.zeros((2, N_points))
+        inside = np.zeros(N_points, dtype=bool)
+
+        unresolved = np.arange(N_points)
+        k = min(self.initial_candidates, self.mesh.N_elements)
+        while len(unresolved) > 0:
+            candidates = self.tree.query(x[:, unresolved].T, k=k)[1]
+            candidates = candidates.reshape(len(unresolved), k)
+            # local coordinates of every point in each of its candidates
+            xi_candidates = self.mesh.localCoords(
+                candidates.ravel(), np.repeat(x[:, unresolved], k, axis=1)
+                ).reshape(2, len(unresolved), k)
+            contains = ((xi_candidates[0] >= -tol) & (xi_candidates[1] >= -tol)
+                        & (xi_candidates.sum(axis=0) <= 1 + tol))
+            found = contains.any(axis=1)
+            # first containing candidate, or the nearest if there is none
+            first = np.argmax(contains, axis=1)
+            rows = np.arange(len(unresolved))
+            elements[unresolved] = candidates[rows, first]
+            xi[:, unresolved] = xi_candidates[:, rows, first]
+            inside[unresolved] = found
+            unresolved = unresolved[~found]
+            if k >= min(self.max_candidates, self.mesh.N_elements):
+                break
+            k = min(4*k, self.max_candidates, self.mesh.N_elements)
+
+        if len(unresolved) > 0:
+            count('walked_points', len(unresolved))
+            self._walk(x, unresolved, elements, xi, inside, tol)
+
+        weights = np.column_stack([1 - xi[0] - xi[1], xi[0], xi[1]])
+        return elements, weights, inside
+
+    def _walk(self, x, walkers, elements, xi, inside, tol):
+        """
+        Walks points from their current elements towards the ones containing
+        them, updating elements, xi and inside in place.
+        """
+        neighbours = self.mesh.topology.neighbours
+        for _ in range(self.mesh.N_elements):
+            weights = np.vstack([1 - xi[0, walkers] - xi[1, walkers], xi[:, walkers]])
+            exit_edge = np.argmin(weights, axis=0)
+            arrived = weights[exit_edge, np.arange(len(walkers))] >= -tol
+            inside[walkers[arrived]] = True
+            # the point is outside the mesh if its element has no neighbour there
+            step = neighbours[elements[walkers], exit_edge]
+            walking = ~arrived & (step >= 0)
+            walkers, step = walkers[walking], step[walking]
+            if len(walkers) == 0:
+                break
+            elements[walkers] = step
+            xi[:, walkers] = self.mesh.localCoords(step, x[:, walkers])
+
+    def interpolationMatrix(self, points):
+        """
+        Builds the sparse matrix interpolating nodal values to the given points.
+
+        Parameters:
+        points (np.ndarray): A 2xN_points array (or a 2-element array) of global
+                             coordinates, e.g. receptor locations.
+
+        Returns:
+        sp.csr_matrix: An (N_points, N_nodes) matrix R with three entries per
+                       row (the barycentric weights), so that R @ psi gives the
+                       values of psi at the points. psi may also be an
+                       (N_nodes, N_times) array of solutions.
+        """
+        elements, weights = self.locate(points)[:2]
+        N_points = len(elements)
+        rows = np.repeat(np.arange(N_points), 3)
+        return sp.csr_matrix((weights.ravel(), (rows, self.mesh.IEN[elements].ravel())),
+                             shape=(N_points, self.mesh.N_nodes))
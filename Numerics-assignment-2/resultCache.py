@@ -0,0 +1,311 @@
+import os
+import types
+import hashlib
+import numpy as np
+from meshCache import grid_root, gridHash, _writeAtomically
+from meshGeometry import loadMesh
+from TwoDimStaticAdvDiffFESolver import TwoDimStaticAdvDiffFESolver
+from TwoDimTimeEvolvedAdvDiffFESolver import TwoDimTimeEvolvedAdvDiffFESolver
+
+'''
+Opt-in memoisation of solver calls across sessions, in a content-addressed
+on-disk store.
+
+A result is keyed by the SHA-256 hash of everything it depends on:
+
+    the mesh            the contents of its three grid files (meshCache.gridHash)
+    the source term     its code object, default arguments, closure values and
+                        the values of the (non-module) globals it uses, or an
+                        explicit key (the source_key argument, or an attribute
+                        S.cache_key)
+    the parameters      u, D, t_max and the solver options, by value
+    the solver code     the source of every module the results depend on
+                        (solver_modules), and cache_version
+
+so renaming a source or reloading a module does not invalidate it, but changing
+the grid files, the body of the source or the solvers does. Bump cache_version
+to invalidate every result for changes outside the solver modules (e.g. a new
+version of scipy). Each result is stored as a 
+compressed .npz file in the cache directory, and when the directory grows past
+its size limit the least recently used entries are removed.
+
+    cachedStaticSolver(S, u, D, resolution, ...)
+    cachedTimeEvolvedSolver(S, u, D, resolution, t_max, ...)
+
+take the same arguments and return the same as TwoDimStaticAdvDiffFESolver and
+TwoDimTimeEvolvedAdvDiffFESolver.
+'''
+
+# Default directory of cached results (ignored by git, like the grid caches)
+result_cache_dir = os.path.join(grid_root, '.cache', 'results')
+
+# Part of every key, so increasing it invalidates all stored results
+cache_version = 1
+
+# Modules whose source is part of every key, as a change to any of them can
+# change the results: the solvers and everything they use, and the adjoint,
+# source-receptor and sensitivity solvers that can be run through solveAll
+solver_modules = ['meshCache', 'meshGeometry', 'dofNumbering', 'elementKernels',
+                  'sparseAssembly', 'parametrisedOperators', 'linearSolvers',
+                  'massSolvers', 'timeIntegrators', 'outputSinks', 'pointLocation',
+                  'meshTopology', 'TwoDimStaticAdvDiffFESolver',
+                  'TwoDimTimeEvolvedAdvDiffFESolver', 'adjointSolver',
+                  'sourceReceptor', 'sensitivities', 'parallelConvergence']
+
+# The hash of the solver modules, computed on first use
+_solver_code_key = None
+
+def _update(sha, x, seen):
+    # feeds a value into the hash, tagging each with its type so that e.g. 
+    # '1' and 1 differ
+    if isinstance(x, (types.FunctionType, types.CodeType)):
+        sha.update(b'function')
+        _updateFunction(sha, x, seen)
+    elif isinstance(x, str):
+        sha.update(b'str' + x.encode())
+    elif x is None:
+        sha.update(b'None')
+    elif isinstance(x, dict):
+        sha.update(b'dict')
+        for k in sorted(x):
+            _update(sha, k, seen)
+            _update(sha, x[k], seen)
+    elif isinstance(x, (list, tuple)) and not all(np.isscalar(v) and not isinstance(v, str)
+                                                  for v in x):
+        sha.update(b'sequence')
+        for v in x:
+            _update(sha, v, seen)
+    else:
+        array = np.asarray(x)
+        if array.dtype.kind in 'iuf':
+            # integer and float inputs give the same results
+            array = array.astype(float)
+        elif array.dtype.kind not in 'bc':
+            raise TypeError(f'Cannot hash a {type(x).__name__} for the result '
+                            'cache, pass an explicit key instead')
+        sha.update(b'array' + array.dtype.str.encode() + str(array.shape).encode())
+        sha.update(np.ascontiguousarray(array).tobytes())
+
+def _updateFunction(sha, f, seen):
+    if id(f) in seen:
+        # recursion
+        sha.update(b'seen')
+        return
+    seen.add(id(f))
+    code = f if isinstance(f, types.CodeType) else f.__code__
+    sha.update(code.co_code)
+    _update(sha, list(code.co_names), seen)
+    for const in code.co_consts:
+        # nested functions (e.g. lambdas) are code objects in co_consts
+        _update(sha, const if not isinstance(const, (bytes, frozenset)) else repr(const),
+                seen)
+    if isinstance(f, types.CodeType):
+        return
+    _update(sha, list(f.__defaults__ or ()), seen)
+    for cell in f.__closure__ or ():
+        _update(sha, cell.cell_contents, seen)
+    for name in code.co_names:
+        value = f.__globals__.get(name)
+        # modules (np, ...) are identified by their name alone, already hashed
+        if value is not None and not isinstance(value, types.ModuleType):
+            _update(sha, value, seen)
+
+def sourceKey(S):
+    """
+    The key of a source term function: its cache_key attribute if it has one,
+    or else a hash of its code, defaults, closure values and the globals it
+    uses.
+
+    Parameters:
+    S (function): Source term function.
+
+    Returns:
+    string: The key.
+    """
+    key = getattr(S, 'cache_key', None)
+    if key is not None:
+        return str(key)
+    sha = hashlib.sha256()
+    _updateFunction(sha, S, set())
+    return sha.hexdigest()
+
+def resultKey(*inputs):
+    """
+    Hashes the inputs of a computation into a key for the result cache.
+
+    Parameters:
+    *inputs: Strings, numbers, arrays, lists, dicts or functions (hashed with
+             sourceKey's rules).
+
+    Returns:
+    string: The hex digest.
+    """
+    sha = hashlib.sha256()
+    _update(sha, list(inputs), set())
+    return sha.hexdigest()
+
+def solverCodeKey():
+    """
+    A hash of cache_version and the source files of solver_modules, which are
+    read on first use only. Modules that only plot or time results (e.g.
+    instrumentation and benchmarks) are left out on purpose.
+
+    Returns:
+    string: The hex digest.
+    """
+    global _solver_code_key
+    if _solver_code_key is None:
+        sha = hashlib.sha256(str(cache_version).encode())
+        for module in solver_modules:
+            with open(os.path.join(grid_root, f'{module}.py'), 'rb') as file:
+                sha.update(module.encode() + file.read())
+        _solver_code_key = sha.hexdigest()
+    return _solver_code_key
+
+class ResultCache:
+    """
+    A directory of results, each a list of arrays stored as a compressed .npz 
+    file named by its key, with least recently used eviction once the 
+    directory exceeds a size.
+
+    Attributes:
+    directory (string): The directory of the cache.
+    max_bytes (int): Size limit of the directory.
+    """
+    __slots__ = ('directory', 'max_bytes')
+
+    def __init__(self, directory=result_cache_dir, max_bytes=2**30):
+        """
+        Parameters:
+        directory (string, optional): The directory of the cache, created on
+                                      first use. Default is result_cache_dir.
+        max_bytes (int, optional): Size limit of the directory. Default is 1GiB.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def get(self, key):
+        """
+        Looks a result up, marking it as used.
+
+        Parameters:
+        key (string): The key of the result.
+
+        Returns:
+        list: The stored arrays, or None if there is no such result.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = [data[f'arr_{i}'] for i in range(len(data.files))]
+            # the modification time records the last use
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return arrays
+
+    def put(self, key, arrays):
+        """
+        Stores a result, then evicts the least recently used results until the
+        directory is within its size limit.
+
+        Parameters:
+        key (string): The key of the result.
+        arrays (list): The arrays making up the result.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        _writeAtomically(self.path(key), lambda file: np.savez_compressed(file, *arrays))
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used results until the directory is within 
+        its size limit.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # removed by another process
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def clear(self):
+        """Removes every result."""
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.npz'):
+                    os.remove(entry.path)
+
+def cachedStaticSolver(S, u, D, resolution, kernels='analytic', linear_solver='direct',
+                       solver_options=None, source_key=None, cache=None):
+    """
+    TwoDimStaticAdvDiffFESolver, through the result cache.
+
+    Parameters:
+    S, u, D, resolution, kernels, linear_solver, solver_options: As for 
+        TwoDimStaticAdvDiffFESolver.
+    source_key (string, optional): Key identifying S, for sources that cannot
+                                   be hashed (or to share results between 
+                                   sources known to be the same). Default is
+                                   None, meaning sourceKey(S).
+    cache (ResultCache, optional): The cache. Default is None, meaning a
+                                   ResultCache in result_cache_dir.
+
+    Returns:
+    tuple: As for TwoDimStaticAdvDiffFESolver.
+    """
+    cache = ResultCache() if cache is None else cache
+    key = resultKey('TwoDimStaticAdvDiffFESolver', solverCodeKey(),
+                    source_key or sourceKey(S), u, D,
+                    gridHash('las', resolution), kernels, linear_solver, solver_options)
+    result = cache.get(key)
+    if result is None:
+        result = TwoDimStaticAdvDiffFESolver(S, u, D, resolution, kernels, 
+                                             linear_solver, solver_options)[3:]
+        cache.put(key, result)
+    # the mesh arrays are not stored
+    mesh = loadMesh(resolution)
+    return (mesh.nodes, mesh.IEN, mesh.dirichlet_nodes, *result)
+
+def cachedTimeEvolvedSolver(S, u, D, resolution, t_max, kernels='analytic',
+                            mass_solver='lu', integrator='RK45', integrator_options=None,
+                            source_key=None, cache=None):
+    """
+    TwoDimTimeEvolvedAdvDiffFESolver (with the default output sink), through the
+    result cache.
+
+    Parameters:
+    S, u, D, resolution, t_max, kernels, mass_solver, integrator, 
+    integrator_options: As for TwoDimTimeEvolvedAdvDiffFESolver.
+    source_key, cache (optional): As for cachedStaticSolver.
+
+    Returns:
+    tuple: As for TwoDimTimeEvolvedAdvDiffFESolver.
+    """
+    cache = ResultCache() if cache is None else cache
+    key = resultKey('TwoDimTimeEvolvedAdvDiffFESolver', solverCodeKey(),
+                    source_key or sourceKey(S), u, D, gridHash('las', resolution), t_max, kernels, mass_solver,
+                    integrator, integrator_options)
+    result = cache.get(key)
+    if result is None:
+        result = TwoDimTimeEvolvedAdvDiffFESolver(S, u, D, resolution, t_max, kernels,
+                                                  mass_solver, integrator,
+                                                  integrator_options)[3:]
+        cache.put(key, result)
+    mesh = loadMesh(resolution)
+    return (mesh.nodes, mesh.IEN, mesh.dirichlet_nodes, *result)
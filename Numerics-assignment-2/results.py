@@ -1,5 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from meshCache import loadGrid
 
 def meshPlotter(filename, nodes, IEN, boundary_nodes, psi=None):
     """
@@ -46,10 +47,7 @@ def meshPlotter(filename, nodes, IEN, boundary_nodes, psi=None):
     return figsize
 
 # Load in example mesh figure
-nodes = np.loadtxt('las_grids/las_nodes_10k.txt')
-IEN = np.loadtxt('las_grids/las_IEN_10k.txt', dtype=np.int64)
-boundary_nodes = np.loadtxt('las_grids/las_bdry_10k.txt', 
-                            dtype=np.int64)
+nodes, IEN, boundary_nodes = loadGrid('las', '10')
 
 figsize = meshPlotter('example_mesh', nodes, IEN, boundary_nodes)
 
@@ -0,0 +1,170 @@
+import numpy as np
+from meshGeometry import loadMesh
+from parametrisedOperators import affineOperator
+from linearSolvers import factorisation
+from timeIntegrators import integrator_thetas, thetaTangentFrames, exponentialTangentFrames
+
+'''
+Tangent-linear sensitivities of the solution to the wind and diffusion 
+coefficient.
+
+K(u, D) = D*Kd - (u_x*Ax + u_y*Ay) is affine in the parameters, so
+
+    dK/du_x = -Ax,    dK/du_y = -Ay,    dK/dD = Kd
+
+and differentiating K psi = F gives, for each parameter p,
+
+    K dpsi/dp = -(dK/dp) psi
+
+i.e. one extra back-substitution with the factorisation of K per parameter,
+rather than an assemble and solve for each side of a finite difference. The
+time-evolved derivatives come from the tangent-linear system integrated with
+the solution, either by a theta-method (see timeIntegrators.thetaTangentFrames)
+or in closed form with the matrix exponential (exponentialTangentFrames).
+
+These are the derivatives of the solution of the integrator they are computed
+with: the theta-methods give those of the Crank-Nicolson or backward Euler
+solution, and 'exponential' those of the exact semi-discrete solution. There is
+no tangent-linear of RK45 (the default of TwoDimTimeEvolvedAdvDiffFESolver) or
+BDF2. RK45 solutions approximate the exponential one to within its tolerance,
+so for derivatives of an RK45 run use integrator='exponential'.
+
+The derivatives are with respect to the components of u as passed to the
+solvers, i.e. of minus the physical wind, and are those of the normalised
+solution psi/max(psi), taking the node of the maximum as fixed.
+'''
+
+# order of the parameters in the derivative arrays
+parameter_names = ('u_x', 'u_y', 'D')
+
+def parameterDerivatives(operator):
+    """
+    The derivatives of K with respect to u_x, u_y and D.
+
+    Parameters:
+    operator (AffineOperator): The operator on the mesh.
+
+    Returns:
+    list: [dK/du_x, dK/du_y, dK/dD] as sparse matrices.
+    """
+    return [-operator.Ax, -operator.Ay, operator.Kd]
+
+def normalisedSensitivities(psi, dpsi):
+    """
+    Normalises a solution by its maximum, along with its derivatives.
+
+    Parameters:
+    psi (np.ndarray): The unnormalised solution at every node.
+    dpsi (np.ndarray): An (N_nodes, N_parameters) array of its derivatives.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - psi (np.ndarray): psi/max(psi).
+           - dpsi (np.ndarray): The derivatives of psi/max(psi), with the node
+                                of the maximum held fixed.
+    """
+    k = np.argmax(psi)
+    psi_normalised = psi/psi[k]
+    return psi_normalised, (dpsi - np.outer(psi_normalised, dpsi[k]))/psi[k]
+
+def TwoDimStaticAdvDiffFESensitivities(S, u, D, resolution, receptors, 
+                                       kernels='analytic'):
+    """
+    Solves the 2D steady-state advection-diffusion equation and gives the 
+    derivatives of the normalised solution at a set of receptors with respect to
+    u_x, u_y and D.
+
+    Parameters:
+    S (function): Source term function, written with array operations.
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    receptors (array-like): A 2xN_receptors array (or a 2-element array) of
+                            receptor coordinates, e.g. Reading.
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - values (np.ndarray): An (N_receptors,) array of the normalised 
+                                  solution at each receptor.
+           - dvalues (np.ndarray): An (N_receptors, 3) array of its derivatives
+                                   with respect to u_x, u_y and D.
+                                   
+    Note: as for TwoDimStaticAdvDiffFESolver, the advection velocity must be
+    entered as the negative of the desired value.
+    """
+    mesh = loadMesh(resolution)
+    operator = affineOperator(mesh, kernels)
+    lu = factorisation(operator, u, D)
+    psi = lu.solve(operator.force(S))
+    dpsi = lu.solve(-np.column_stack([dK @ psi for dK in parameterDerivatives(operator)]))
+    psi, dpsi = normalisedSensitivities(mesh.scatter(psi), mesh.scatter(dpsi))
+    R = mesh.pointLocator.interpolationMatrix(receptors)
+    return R @ psi, R @ dpsi
+
+def TwoDimTimeEvolvedAdvDiffFESensitivities(S, u, D, resolution, t_max, receptors,
+                                            kernels='analytic', mass_solver='lu',
+                                            integrator='crank_nicolson',
+                                            integrator_options=None):
+    """
+    Solves the 2D time-dependent advection-diffusion equation and gives the 
+    derivatives of the normalised solution at a set of receptors with respect to
+    u_x, u_y and D, at 201 equally spaced times.
+
+    Parameters:
+    S (function): Source term function, written with array operations.
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    t_max (float): Maximum runtime of the simulation [s].
+    receptors (array-like): A 2xN_receptors array (or a 2-element array) of
+                            receptor coordinates.
+    kernels, mass_solver (optional): As for TwoDimTimeEvolvedAdvDiffFESolver.
+    integrator (string, optional): 'crank_nicolson' (default), 'backward_euler',
+                                   'theta' or 'exponential'. The derivatives are
+                                   those of the solver's solution with the same
+                                   integrator; 'RK45' and 'bdf2' are not 
+                                   supported (see the module docstring).
+    integrator_options (dict, optional): dt, and theta for 'theta', or chunk for
+                                         'exponential'.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - ts (np.ndarray): Array of timesteps at which the solution was evaluated.
+           - values (np.ndarray): An (N_receptors, 201) array of the normalised
+                                  solution at each receptor.
+           - dvalues (np.ndarray): An (N_receptors, 3, 201) array of its 
+                                   derivatives with respect to u_x, u_y and D.
+
+    Note: as for TwoDimTimeEvolvedAdvDiffFESolver, the advection velocity must be
+    entered as the negative of the desired value.
+    """
+    options = dict(integrator_options or {})
+    if integrator == 'theta':
+        theta = options.pop('theta')
+    elif integrator in integrator_thetas:
+        theta = integrator_thetas[integrator]
+    elif integrator != 'exponential':
+        raise ValueError(f"Sensitivities need a theta-method or exponential "
+                         f"integrator, not {integrator!r}, choose from "
+                         "['backward_euler', 'crank_nicolson', 'theta', 'exponential']")
+    mesh = loadMesh(resolution)
+    operator = affineOperator(mesh, kernels)
+    R = mesh.pointLocator.interpolationMatrix(receptors)
+    ts = np.linspace(0, t_max, 201)
+    mass_solve = operator.massSolver(mass_solver)
+    K, F, dKs = operator.stiffness(u, D), operator.force(S), parameterDerivatives(operator)
+    if integrator == 'exponential':
+        frames = exponentialTangentFrames(mass_solve, K, F, dKs, ts, **options)
+    else:
+        frames = thetaTangentFrames(mass_solve.matrix, K, F, dKs, ts, theta, **options)
+    
+    values = np.zeros((R.shape[0], len(ts)))
+    dvalues = np.zeros((R.shape[0], len(parameter_names), len(ts)))
+    for i, (psi, dpsi) in enumerate(frames):
+        # the first frame is zero, as in timeEvolve
+        if i > 0:
+            psi, dpsi = normalisedSensitivities(mesh.scatter(psi), mesh.scatter(dpsi))
+            values[:, i], dvalues[:, :, i] = R @ psi, R @ dpsi
+    return ts, values, dvalues
@@ -0,0 +1,167 @@
+import numpy as np
+from meshGeometry import loadMesh
+from parametrisedOperators import affineOperator
+from adjointSolver import ReceptorAdjoint
+
+'''
+Source-receptor (Green's) matrices for the static problem.
+
+For a fixed grid, wind and D, the (unnormalised) pollution at a set of
+receptors is linear in the source, so for sources that are combinations of a
+fixed set of basis sources,
+
+    S = sum_j s_j S_j    gives    values = G s,    G[i,j] = value at receptor i of S_j
+
+G is computed once from the receptors' adjoint solutions (see adjointSolver.py)
+and stored with np.savez_compressed, after which a scenario with any number of
+fires at the basis centres is a matrix-vector product rather than a new FE
+solve. The basis sources are Gaussian bumps like S_sotonfire,
+
+    S_j(x) = exp(-|x - c_j|^2/(2 sigma^2)),
+
+so s_j is the peak strength of the fire at c_j (1 for S_sotonfire). Each column
+of G only costs an evaluation of S_j at the quadrature points, against the
+adjoint solutions weighted by the quadrature (ReceptorAdjoint.quadratureFunctional).
+'''
+
+def gridCentres(x_range, y_range, spacing):
+    """
+    A regular grid of source centres.
+
+    Parameters:
+    x_range (tuple): (x_min, x_max) of the grid [m].
+    y_range (tuple): (y_min, y_max) of the grid [m].
+    spacing (float): Distance between neighbouring centres [m].
+
+    Returns:
+    np.ndarray: A 2xN_sources array of centres, x varying fastest.
+    """
+    xs = np.arange(x_range[0], x_range[1] + spacing/2, spacing)
+    ys = np.arange(y_range[0], y_range[1] + spacing/2, spacing)
+    X, Y = np.meshgrid(xs, ys)
+    return np.vstack([X.ravel(), Y.ravel()])
+
+def gaussianSource(centre, sigma=10000):
+    """
+    The basis source with its centre at centre, as a source term function.
+
+    Parameters:
+    centre (array-like): The centre of the bump [m].
+    sigma (float, optional): Width of the bump [m]. Default is 10000, as for
+                             S_sotonfire.
+
+    Returns:
+    function: The source term S(x).
+    """
+    x0, y0 = centre
+    return lambda x: np.exp(-1/(2*sigma**2)*((x[0] - x0)**2 + (x[1] - y0)**2))
+
+class SourceReceptorMatrix:
+    """
+    The pollution at a set of receptors due to each of a set of Gaussian basis
+    sources, for one grid, wind and D.
+
+    Attributes:
+    G (np.ndarray): An (N_receptors, N_sources) array, the (unnormalised) value
+                    at each receptor for a unit strength source at each centre.
+    centres (np.ndarray): A 2xN_sources array of source centres.
+    sigma (float): Width of the basis sources [m].
+    receptors (np.ndarray): A 2xN_receptors array of receptor coordinates.
+    u (np.ndarray): Advection velocity vector, as passed to the solver [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    resolution (string): Grid resolution.
+    """
+    __slots__ = ('G', 'centres', 'sigma', 'receptors', 'u', 'D', 'resolution')
+
+    def __init__(self, G, centres, sigma, receptors, u, D, resolution):
+        self.G = G
+        self.centres = centres
+        self.sigma = sigma
+        self.receptors = receptors
+        self.u = u
+        self.D = D
+        self.resolution = resolution
+
+    def values(self, strengths):
+        """
+        The pollution at the receptors for a combination of the basis sources.
+
+        Parameters:
+        strengths (array-like): The strength of the source at each centre, an
+                                (N_sources,) array, or (N_sources, N_scenarios)
+                                for several scenarios at once.
+
+        Returns:
+        np.ndarray: An (N_receptors,) array of values, or (N_receptors, 
+                    N_scenarios).
+        """
+        return self.G @ np.asarray(strengths, dtype=float)
+
+    def save(self, filename):
+        """
+        Stores the matrix and the parameters it was computed for.
+
+        Parameters:
+        filename (str): Path of the .npz file.
+        """
+        np.savez_compressed(filename, G=self.G, centres=self.centres,
+                            sigma=self.sigma, receptors=self.receptors,
+                            u=self.u, D=self.D, resolution=self.resolution)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Reads a matrix stored with save().
+
+        Parameters:
+        filename (str): Path of the .npz file.
+
+        Returns:
+        SourceReceptorMatrix: The stored matrix.
+        """
+        with np.load(filename) as data:
+            return cls(data['G'], data['centres'], float(data['sigma']),
+                       data['receptors'], data['u'], float(data['D']),
+                       str(data['resolution']))
+
+def sourceReceptorMatrix(centres, receptors, u, D, resolution, sigma=10000,
+                         kernels='analytic', chunk=32):
+    """
+    Computes the source-receptor matrix between Gaussian basis sources and a
+    set of receptors, with one adjoint solve per receptor.
+
+    Parameters:
+    centres (array-like): A 2xN_sources array of source centres, e.g. from
+                          gridCentres.
+    receptors (array-like): A 2xN_receptors array (or a 2-element array) of
+                            receptor coordinates, e.g. Reading.
+    u (array-like): Advection velocity vector [ms^-1].
+    D (float): Diffusion coefficient [m^2s^-1].
+    resolution (string): Grid resolution, one of ['1_25', '2_5', '5', '10', '20', '40'].
+    sigma (float, optional): Width of the basis sources [m]. Default is 10000.
+    kernels (string, optional): Element matrix backend, 'analytic' (default) or
+                                'quadrature'.
+    chunk (int, optional): Number of sources evaluated at once, which bounds 
+                           the memory used to chunk x 3*N_elements values. 
+                           Default is 32.
+
+    Returns:
+    SourceReceptorMatrix: The matrix G and the parameters it was computed for.
+
+    Note: as for TwoDimStaticAdvDiffFESolver, the advection velocity must be 
+    entered as the negative of the desired value, and the values are those of
+    the unnormalised solution.
+    """
+    centres = np.asarray(centres, dtype=float).reshape(2, -1)
+    mesh = loadMesh(resolution)
+    adjoint = ReceptorAdjoint(affineOperator(mesh, kernels), receptors, u, D)
+    points, C = adjoint.quadratureFunctional()
+    G = np.zeros((C.shape[1], centres.shape[1]))
+    for start in range(0, centres.shape[1], chunk):
+        cs = centres[:, start:start + chunk]
+        # all the sources of the chunk at all the quadrature points
+        r2 = ((points[0][:, np.newaxis] - cs[0])**2 
+              + (points[1][:, np.newaxis] - cs[1])**2)
+        G[:, start:start + chunk] = C.T @ np.exp(-1/(2*sigma**2)*r2)
+    return SourceReceptorMatrix(G, centres, sigma, adjoint.receptors,
+                                np.asarray(u, dtype=float), D, resolution)
@@ -0,0 +1,211 @@
+import numpy as np
+from scipy import sparse as sp
+from instrumentation import timed
+
+'''
+Bulk assembly of global FE matrices and vectors from stacks of element
+contributions, replacing the incremental K[A, B] += k_e[a, b] updates on a
+sp.lil_matrix.
+
+All functions take the location matrix LM of shape (3, N_elements), where
+LM[a, e] is the equation number of local node a of element e, or -1 if that
+node carries a Dirichlet condition (and so is dropped from the system).
+
+For one-off assemblies use assembleMatrix()/assembleSystem(). When the same mesh
+is assembled repeatedly (e.g. different u or D), use assemblyPlan() instead: the
+sparsity pattern is worked out once and each re-assembly is a single bincount
+into the CSR data array.
+'''
+
+# Assembly plans already built, keyed by a caller-supplied mesh key
+_assembly_plans = {}
+
+def assemblyTriplets(LM, k_es):
+    """
+    Builds the COO (row, column, value) triplets of every element contribution
+    that does not touch a Dirichlet node.
+
+    Parameters:
+    LM (np.ndarray): A (3, N_elements) location matrix.
+    k_es (np.ndarray): An (N_elements, 3, 3) stack of element matrices.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - rows (np.ndarray): Global row index of each kept entry.
+           - cols (np.ndarray): Global column index of each kept entry.
+           - values (np.ndarray): Value of each kept entry.
+    """
+    LMT = LM.T
+    rows = np.broadcast_to(LMT[:, :, np.newaxis], k_es.shape)
+    cols = np.broadcast_to(LMT[:, np.newaxis, :], k_es.shape)
+    # if not on a BC node, keep the entry
+    mask = (rows >= 0) & (cols >= 0)
+    return rows[mask], cols[mask], k_es[mask]
+
+def assembleMatrix(LM, k_es, N_equations):
+    """
+    Assembles a global sparse matrix from element matrices in one bulk
+    COO -> CSR conversion, duplicate entries being summed.
+
+    Parameters:
+    LM (np.ndarray): A (3, N_elements) location matrix.
+    k_es (np.ndarray): An (N_elements, 3, 3) stack of element matrices.
+    N_equations (int): Number of equations (unknowns) in the global system.
+
+    Returns:
+    sp.csr_matrix: The N_equations x N_equations global matrix.
+    """
+    rows, cols, values = assemblyTriplets(LM, k_es)
+    return sp.coo_matrix((values, (rows, cols)),
+                         shape=(N_equations, N_equations)).tocsr()
+
+def assembleVector(LM, f_es, N_equations):
+    """
+    Assembles a global vector from element vectors.
+
+    Parameters:
+    LM (np.ndarray): A (3, N_elements) location matrix.
+    f_es (np.ndarray): An (N_elements, 3) stack of element vectors.
+    N_equations (int): Number of equations (unknowns) in the global system.
+
+    Returns:
+    np.ndarray: The global vector of length N_equations.
+    """
+    rows = LM.T
+    mask = rows >= 0
+    return np.bincount(rows[mask], weights=f_es[mask], minlength=N_equations)
+
+def assembleSystem(LM, k_es, f_es, N_equations):
+    """
+    Assembles the global matrix and force vector of a linear FE system.
+
+    Parameters:
+    LM (np.ndarray): A (3, N_elements) location matrix.
+    k_es (np.ndarray): An (N_elements, 3, 3) stack of element stiffness matrices.
+    f_es (np.ndarray): An (N_elements, 3) stack of element force vectors.
+    N_equations (int): Number of equations (unknowns) in the global system.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - K (sp.csr_matrix): Global stiffness matrix.
+           - F (np.ndarray): Global force vector.
+    """
+    return assembleMatrix(LM, k_es, N_equations), assembleVector(LM, f_es, N_equations)
+
+class AssemblyPlan:
+    """
+    The sparsity pattern of a global FE matrix on a fixed mesh, together with
+    the map from each element-local entry to its slot in the CSR data array.
+
+    Attributes:
+    N_equations (int): Number of equations (unknowns) in the global system.
+    indptr (np.ndarray): CSR row pointer array.
+    indices (np.ndarray): CSR column index array.
+    entry_mask (np.ndarray): (N_elements, 3, 3) boolean mask of the element
+                             entries that do not touch a Dirichlet node.
+    scatter (np.ndarray): CSR data slot of each entry selected by entry_mask.
+    vector_mask (np.ndarray): (N_elements, 3) boolean mask of the element
+                              vector entries not on a Dirichlet node.
+    vector_rows (np.ndarray): Global row of each entry selected by vector_mask.
+    """
+    __slots__ = ('N_equations', 'indptr', 'indices', 'entry_mask', 'scatter',
+                 'vector_mask', 'vector_rows')
+
+    def __init__(self, LM, N_equations):
+        """
+        Builds the plan from the location matrix (the symbolic assembly).
+
+        Parameters:
+        LM (np.ndarray): A (3, N_elements) location matrix.
+        N_equations (int): Number of equations (unknowns) in the global system.
+        """
+        N_equations = int(N_equations)
+        LMT = LM.T.astype(np.int64)
+        shape = (LMT.shape[0], 3, 3)
+        rows = np.broadcast_to(LMT[:, :, np.newaxis], shape)
+        cols = np.broadcast_to(LMT[:, np.newaxis, :], shape)
+        self.entry_mask = (rows >= 0) & (cols >= 0)
+        
+        # np.unique sorts by row then column, i.e. precisely CSR order
+        keys = rows[self.entry_mask] * N_equations + cols[self.entry_mask]
+        unique_keys, scatter = np.unique(keys, return_inverse=True)
+        row_counts = np.bincount(unique_keys // N_equations, minlength=N_equations)
+        
+        self.N_equations = N_equations
+        self.indptr = np.concatenate(([0], np.cumsum(row_counts)))
+        self.indices = unique_keys % N_equations
+        self.scatter = scatter.ravel()
+        self.vector_mask = LMT >= 0
+        self.vector_rows = LMT[self.vector_mask]
+
+    @property
+    def nnz(self):
+        """Number of stored entries in the global matrix."""
+        return len(self.indices)
+
+    @timed('assembly')
+    def assembleMatrix(self, k_es, out=None):
+        """
+        Assembles a global sparse matrix on the planned pattern.
+
+        Parameters:
+        k_es (np.ndarray): An (N_elements, 3, 3) stack of element matrices.
+        out (np.ndarray, optional): Preallocated array of length nnz to hold the
+                                    CSR data. Default is None.
+
+        Returns:
+        sp.csr_matrix: The N_equations x N_equations global matrix.
+        """
+        data = np.bincount(self.scatter, weights=k_es[self.entry_mask],
+                           minlength=self.nnz)
+        if out is not None:
+            out[:] = data
+            data = out
+        return sp.csr_matrix((data, self.indices, self.indptr),
+                             shape=(self.N_equations, self.N_equations))
+
+    @timed('assembly')
+    def assembleVector(self, f_es):
+        """
+        Assembles a global vector from element vectors.
+
+        Parameters:
+        f_es (np.ndarray): An (N_elements, 3) stack of element vectors.
+
+        Returns:
+        np.ndarray: The global vector of length N_equations.
+        """
+        return np.bincount(self.vector_rows, weights=f_es[self.vector_mask],
+                           minlength=self.N_equations)
+
+    def assembleSystem(self, k_es, f_es):
+        """
+        Assembles the global matrix and force vector of a linear FE system.
+
+        Parameters:
+        k_es (np.ndarray): An (N_elements, 3, 3) stack of element stiffness matrices.
+        f_es (np.ndarray): An (N_elements, 3) stack of element force vectors.
+
+        Returns:
+        tuple: A tuple containing the following elements:
+               - K (sp.csr_matrix): Global stiffness matrix.
+               - F (np.ndarray): Global force vector.
+        """
+        return self.assembleMatrix(k_es), self.assembleVector(f_es)
+
+def assemblyPlan(key, LM, N_equations):
+    """
+    Returns the assembly plan for a mesh, building it on first use only.
+
+    Parameters:
+    key (hashable): Identifies the mesh and its Dirichlet nodes, e.g.
+                    ('las', resolution). Plans are only rebuilt for new keys.
+    LM (np.ndarray): A (3, N_elements) location matrix.
+    N_equations (int): Number of equations (unknowns) in the global system.
+
+    Returns:
+    AssemblyPlan: The (possibly cached) plan for this mesh.
+    """
+    if key not in _assembly_plans:
+        _assembly_plans[key] = AssemblyPlan(LM, N_equations)
+    return _assembly_plans[key]
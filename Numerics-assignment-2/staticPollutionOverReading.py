@@ -1,7 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from TwoDimStaticAdvDiffFESolver import (localShapeFunctions, global2localCoords,
-                                         TwoDimStaticAdvDiffFESolver)
+from TwoDimStaticAdvDiffFESolver import TwoDimStaticAdvDiffFESolver
+from meshGeometry import meshFromArrays, arrayMesh
+from meshTopology import MeshTopology
+from instrumentation import phase, timed
 
 def S_sotonfire(x):
     """
@@ -17,7 +19,7 @@ def S_sotonfire(x):
     sigma = 10000
     return np.exp(-1/(2*sigma**2)*((x[0]-442365)**2 + (x[1]-115483)**2))
 
-def elementValidityChecker(IEN, element):
+def elementValidityChecker(IEN, element, topology=None):
     """
     Checks if a given triangular element exists in the element connectivity array 
     (IEN).
@@ -27,30 +29,47 @@ def elementValidityChecker(IEN, element):
                       triangular element and contains the indices of its nodes.
     element (array-like): A list or array containing the indices of the nodes 
                           of the triangular element to be checked.
+    topology (MeshTopology, optional): The connectivity tables of IEN. Default
+                                       is None, in which case those of the mesh
+                                       IEN came from are used (see 
+                                       meshTopology.py), or built.
 
     Returns:
     tuple: A tuple containing the following elements:
            - IENindex (int): The index of the element in the IEN array if it 
-             exists, otherwise 0.
+             exists, otherwise -1 (as for MeshTopology.findElement).
            - existsinIEN (bool): True if the element exists in the IEN array, 
                                  False otherwise.
     """
-    # np.sort() is necessary as the order of the nodes in 'element' need not be
-    # the same as they appear in IEN
-    IENindex = np.where(np.all(np.sort(IEN,axis=1) == np.sort(element), axis=1))[0]
-    
-    if len(IENindex) == 0:
-        # With the provided grids, this only occurs on the 2.5k resolution
-        print('Triangle does not exist in IEN. If things go wrong, check here')
-        existsinIEN = False
-    else:
-        IENindex = IENindex[0]
-        existsinIEN = True
-    return IENindex, existsinIEN
+    if topology is None:
+        mesh = meshFromArrays(None, IEN)
+        topology = mesh.topology if mesh is not None else MeshTopology(IEN)
+    # the triangle index is keyed on the sorted nodes, as the order of the nodes
+    # in 'element' need not be the same as they appear in IEN
+    IENindex = topology.findElement(element)
+    return IENindex, IENindex >= 0
+
+def pollutionMesh(nodes, IEN, mesh=None):
+    """
+    Returns the Mesh that nodes and IEN belong to, i.e. the one shared with the
+    solver that returned them (matched by content, so copies work too), or one
+    built for them once if they did not come from a solver.
+
+    Parameters:
+    nodes (np.ndarray): A 2xN array containing the coordinates of the nodes.
+    IEN (np.ndarray): Element connectivity array.
+    mesh (Mesh, optional): The mesh, if already known. Default is None.
+
+    Returns:
+    Mesh: The mesh of nodes and IEN.
+    """
+    if mesh is None:
+        mesh = arrayMesh(nodes, IEN)
+    return mesh
 
-def nearestElement2Coords(nodes, IEN, coords):
+def nearestElement2Coords(nodes, IEN, coords, mesh=None):
     '''
-    Finds the nearest triangular element to the given coordinates.
+    Finds the triangular element containing the given coordinates.
 
     Parameters:
     nodes (np.ndarray): A 2xN array containing the coordinates of the nodes, 
@@ -58,77 +77,50 @@ def nearestElement2Coords(nodes, IEN, coords):
     IEN (np.ndarray): Element connectivity array where each row represents a 
                       triangular element and contains the indices of its nodes.
     coords (array-like): A 2-element array containing the coordinates for which
-                         the nearest element is to be found.
+                         the containing element is to be found.
+    mesh (Mesh, optional): The Mesh that nodes and IEN belong to. Default is None,
+                           in which case it is looked up as in pollutionExtractor.
 
     Returns:
     np.ndarray: A 3-element array containing the indices of the nodes of the 
-                nearest element or of the constructed triangle if no valid element
-                was found.
+                containing element, in the order they appear in IEN. If coords
+                is outside the grid, the element with the nearest centroid is
+                returned instead.
     
-    Argument for the validity of this construction: 
-        
-    I am constructing a large circle centred at 'coords' and computing the number 
-    of nodes within the circle, then shrinking the radius until there are exactly 
-    3 nodes within it.
-    In most cases, these 3 nodes are precisely the nodes of the triangle that 
-    contains 'coords'. However, it can be shown geometrically that this is not 
-    always the case. Nevertheless, the local coordinate construction is valid 
-    outside the confines of the reference triangle as it maps all of mathbb{R}^2
-    in principle. (We only care about xi_1,2 inside the reference triangle for 
-    the purposes of solving, but they exist everywhere anyway). Therefore, 
-    relative to a "close enough" triangle, the basis-function construction seen
-    in pollutionExtractor() still holds.
-    The purpose of elementValidityChecker() is to see if the identified triangle
-    (of which the searching radius now defines its circumcircle) is actually
-    one of the triangles in IEN. If so, then it relabels the order of the nodes 
-    found by the search to match the order they appear in the IEN, for consistency
-    reasons. Since for at least one resolution, this test fails (yet I proceed
-    anyway), this check is essentially superfluous but remains for sanity reasons.
+    The search uses the point location index of the mesh (see pointLocation.py):
+    a KD-tree over the element centroids proposes candidates, and the first one
+    in which coords has non-negative barycentric coordinates is the containing
+    element. This replaces shrinking a circle around coords until it holds
+    exactly 3 nodes, which did not always find an element of IEN.
     '''
-    def locateTriangle(coords):
-        """
-        Identifies the nodes of the triangle that contains the given coordinates.
-
-        Parameters:
-        nodes (np.ndarray): A 2xN array containing the coordinates of the nodes, 
-                            where N is the 'long' axis of nodes, i.e. N>>2.
-        coords (array-like): A 2-element array containing the coordinates for 
-                             which the nearest triangle is to be found.
-    
-        Returns:
-        test (np.ndarray): A 3-element array containing the indices of the nodes
-                           of the identified triangle.
-        
-        Raises:
-        Exception: If a degenerate triangle is found (less than 3 nodes within 
-                                                      the tolerance).
-        """
-        error = np.zeros_like(nodes[0,:])
-        for i in range(len(error)):
-            error[i] = np.sqrt((nodes[0,i]-coords[0])**2 + (nodes[1,i]-coords[1])**2)
+    mesh = pollutionMesh(nodes, IEN, mesh)
+    elements = mesh.pointLocator.locate(coords)[0]
+    return IEN[elements[0]]
     
-        tol = 18000
-        test = np.where(error < tol)[0]
-        while len(test) > 3:
-            tol -= 10
-            test = np.where(error < tol)[0]
-            
-        if len(test) < 3:
-            raise Exception('Degenerate triangle found!')
-            
-        return test
-    
-    candidate_triangle = locateTriangle(coords)
-    IENindex, existsinIEN = elementValidityChecker(IEN, candidate_triangle)
-    
-    if existsinIEN:
-        #Use the order of the nodes as the appear in IEN, not 'candidate_triangle' itself
-        matching_row = IEN[IENindex,:]
-        return matching_row
-    else:
-        return candidate_triangle
-    
-def pollutionExtractor(psi, nodes, IEN, coords):
+def receptorMatrix(nodes, IEN, receptors, mesh=None):
+    """
+    Builds the sparse interpolation matrix from the nodes to a set of receptors,
+    which only depends on the mesh and can be reused for any solution on it.
+
+    Parameters:
+    nodes (np.ndarray): A 2xN array containing the coordinates of the nodes.
+    IEN (np.ndarray): Element connectivity array.
+    receptors (array-like): A 2xN_receptors array (or a 2-element array) of
+                            receptor coordinates.
+    mesh (Mesh, optional): The Mesh that nodes and IEN belong to. Default is None,
+                           in which case it is looked up as in pollutionExtractor.
+
+    Returns:
+    sp.csr_matrix: An (N_receptors, N_nodes) matrix R, so that R @ psi are the
+                   pollution values at the receptors. psi may be a single 
+                   solution or an (N_nodes, N_times) array of them.
+    """
+    mesh = pollutionMesh(nodes, IEN, mesh)
+    with phase('point_location'):
+        return mesh.pointLocator.interpolationMatrix(receptors)
+
+@timed('pollution_extraction')
+def pollutionExtractor(psi, nodes, IEN, coords, mesh=None):
     """
     Extracts the pollution value at given coordinates.
 
@@ -140,21 +132,19 @@ def pollutionExtractor(psi, nodes, IEN, coords):
                       triangular element and contains the indices of its nodes.
     coords (array-like): A 2-element array containing the coordinates where the
                          pollution value is to be extracted.
+    mesh (Mesh, optional): The Mesh that nodes and IEN belong to. Default is None,
+                           in which case it is looked up from the solver's cache
+                           (see meshGeometry.meshFromArrays).
 
     Returns:
     pollution (float): The pollution value at the given coordinates.
-    """
-    # find nodes of the triangle that contains 'coords'
-    elementnodes = nearestElement2Coords(nodes, IEN, coords)
-    # get the coords of the nodes of that triangle
-    xe = nodes[:,elementnodes]
-    
-    # find the local coords of 'coords' in that triangle
-    xi = global2localCoords(xe, coords)
     
-    N = localShapeFunctions(xi)
-    # use basis function representation to determine the value of psi at 'coords'
-    pollution = np.dot(psi[elementnodes], N)
+    For repeated extraction at the same coordinates (e.g. over time), build
+    receptorMatrix() once instead.
+    """
+    # use basis function representation to determine the value of psi at 
+    # 'coords', from the local shape functions of the triangle containing it
+    pollution = (receptorMatrix(nodes, IEN, coords, mesh) @ psi)[0]
     return pollution
 
 def convergence(max_res_data, coords, u, D, figsize, filename1, filename2):
@@ -253,49 +243,64 @@ def convergence(max_res_data, coords, u, D, figsize, filename1, filename2):
     
     plt.show()
     
-    ###########################################################################
-    
-    def theoretic_convergence(y_N, y_2N, y_4N):
-        """
-        Computes the theoretical convergence rate and errors using Richardson 
-        extraolation.
-    
-        Parameters:
-        y_N (float): Solution value at the base resolution.
-        y_2N (float): Solution value at twice the base resolution.
-        y_4N (float): Solution value at four times the base resolution.
+    writeConvergenceResults({'1_25': y_1_25k, '2_5': y_2_5k, '5': y_5k, '10': y_10k,
+                             '20': y_20k, '40': y_40k}, u)
+
+def theoreticConvergence(y_N, y_2N, y_4N):
+    """
+    Computes the theoretical convergence rate and errors using Richardson 
+    extraolation.
+
+    Parameters:
+    y_N (float): Solution value at the base resolution.
+    y_2N (float): Solution value at twice the base resolution.
+    y_4N (float): Solution value at four times the base resolution.
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - s (float): Theoretical convergence rate.
+           - abs_error (float): Absolute error of the solution at the base 
+                                resolution.
+           - rel_error (float): Relative error of the solution at the base 
+                                resolution (as a percentage).
+    """
+
+    y2N_N = abs(y_2N - y_N)
+    y4N_2N = abs(y_4N - y_2N)
     
-        Returns:
-        tuple: A tuple containing the following elements:
-               - s (float): Theoretical convergence rate.
-               - abs_error (float): Absolute error of the solution at the base 
-                                    resolution.
-               - rel_error (float): Relative error of the solution at the base 
-                                    resolution (as a percentage).
-        """
+    s = np.log2(y2N_N/y4N_2N)
     
-        y2N_N = abs(y_2N - y_N)
-        y4N_2N = abs(y_4N - y_2N)
-        
-        s = np.log2(y2N_N/y4N_2N)
-        
-        abs_error = y2N_N/(1-2**(-s))
-        rel_error = abs_error/y_N * 100
+    abs_error = y2N_N/(1-2**(-s))
+    rel_error = abs_error/y_N * 100
 
-        return s, abs_error, rel_error
-    
+    return s, abs_error, rel_error
+
+def writeConvergenceResults(pollutions, u):
+    """
+    Writes the Richardson extrapolation estimates over every triplet of 
+    resolutions to static_convergence_results_for_u=[...].txt.
+
+    Parameters:
+    pollutions (dict): The pollution at the coordinates for each resolution in
+                       ['1_25', '2_5', '5', '10', '20', '40'].
+    u (array-like): Advection velocity vector [ms^-1].
+
+    Returns:
+    None.
+    """
+    y = pollutions
     # set up arrays
     ss = np.zeros(4)
     abs_errors = np.zeros(4)
     rel_errors = np.zeros(4)
-    ys = np.array([[y_5k, y_2_5k, y_1_25k],
-                   [y_10k, y_5k, y_2_5k],
-                   [y_20k, y_10k, y_5k],
-                   [y_40k, y_20k, y_10k]])
+    ys = np.array([[y['5'], y['2_5'], y['1_25']],
+                   [y['10'], y['5'], y['2_5']],
+                   [y['20'], y['10'], y['5']],
+                   [y['40'], y['20'], y['10']]])
     
     # compute theoretical order and error estimates over all triplets of resolutions
-    for i, y in enumerate(ys):
-        ss[i], abs_errors[i], rel_errors[i] = theoretic_convergence(*y)
+    for i, triplet in enumerate(ys):
+        ss[i], abs_errors[i], rel_errors[i] = theoreticConvergence(*triplet)
         
     textual_data = (f'theoretical convergence order = {ss}\n'
                     f'theoretical absolute error = {abs_errors}\n'
@@ -307,4 +312,4 @@ def convergence(max_res_data, coords, u, D, figsize, filename1, filename2):
     # save the data to a .txt file instead of just dumping to the console
     with open(f'static_convergence_results_for_u=[{abs(u[0]):.2f}, {abs(u[1]):.2f}].txt',
               'w') as file:
-        file.write(textual_data)
\ No newline at end of file
+        file.write(textual_data)
@@ -1,8 +1,68 @@
+import os
+import math
 import numpy as np
 from TwoDimStaticAdvDiffFESolver import *
 from TwoDimTimeEvolvedAdvDiffFESolver import mass
+from elementKernels import (elementCoordinates, batchedJacobians, elementKernel,
+                            batched_stiffness, batched_diffusion_stiffness, 
+                            batched_advection_stiffness, batched_force, batched_mass,
+                            analytic_stiffness, analytic_diffusion_stiffness,
+                            analytic_advection_stiffness, analytic_mass)
+from sparseAssembly import assembleSystem, assemblyPlan
+import meshCache
+from meshGeometry import Mesh, loadMesh, meshFromArrays, unitSquareGrid
+from pointLocation import PointLocator
+from meshTopology import MeshTopology
+from massSolvers import MassSolver
+from adjointSolver import TwoDimStaticAdvDiffFEAdjoint
+from sensitivities import (TwoDimStaticAdvDiffFESensitivities,
+                           TwoDimTimeEvolvedAdvDiffFESensitivities)
+import parallelConvergence
+from parallelConvergence import solveAll, staticSolution, receptorTimeSeries
+import resultCache
+from resultCache import (ResultCache, sourceKey, resultKey, cachedStaticSolver,
+                         cachedTimeEvolvedSolver)
+import instrumentation
+from instrumentation import recording, phase, count
+from benchmarks import (unitSquareMesh, gridMesh, benchmarkMesh, benchmark_stages,
+                        scalingExponents, compareBenchmarks)
+from sourceReceptor import (sourceReceptorMatrix, SourceReceptorMatrix, gridCentres,
+                            gaussianSource)
+from outputSinks import MemorySink, MemmapSink, ReceptorSink, EveryKthSink
+from timeIntegrators import implicitIntegrate, stepSizes, exponentialIntegrate
+import scipy.linalg
+from staticPollutionOverReading import (nearestElement2Coords, pollutionExtractor,
+                                        pollutionMesh,
+                                        receptorMatrix, elementValidityChecker)
+from dofNumbering import tagBoundaryNodes, numberEquations, locationMatrix, scatterSolution
+from parametrisedOperators import affineOperator
+from linearSolvers import solveLinearSystem, preconditioner, factorisation
+from TwoDimTimeEvolvedAdvDiffFESolver import (TwoDimTimeEvolvedAdvDiffFESolver,
+                                              TwoDimTimeEvolvedAdvDiffFESweep,
+                                              TwoDimTimeEvolvedAdvDiffFEReceptors)
+from scipy import sparse as sp
 import pytest
 
+def random_elements(N_elements=50, seed=0):
+    '''
+    Stack of randomly placed, non-degenerate triangles of varying size and 
+    orientation, for comparing the batched kernels to the per-element ones.
+    '''
+    rng = np.random.default_rng(seed)
+    xes = rng.uniform(-1, 1, (N_elements, 2, 3)) * rng.uniform(0.1, 1e4, (N_elements, 1, 1))
+    detJ = np.linalg.det(batchedJacobians(xes))
+    return xes[abs(detJ) > 1e-3 * np.max(abs(detJ))]
+
+def unit_square_mesh(Nx):
+    '''
+    meshGeometry.unitSquareGrid, with the left edge Dirichlet. Returns nodes as
+    a 2xN array, IEN, and a reference numbering ID and LM.
+    '''
+    nodes, IEN, _ = unitSquareGrid(Nx)
+    dirichlet = np.isclose(nodes[:,0], 0)
+    ID = np.where(dirichlet, -1, np.cumsum(~dirichlet) - 1)
+    return nodes.T, IEN, ID, ID[IEN].T
+
 def test_local2globalCoords():
     
     default = {
@@ -213,6 +273,8 @@ def test_diffusion_stiffness():
     for t in [default, translated, scaled, rotated]:
         assert np.allclose(diffusion_stiffness(t["xe"]),
                            t["ans"]), f"element\n {t['xe']} is broken"
+        assert np.allclose(analytic_diffusion_stiffness(t["xe"][np.newaxis])[0],
+                           t["ans"]), f"analytic element\n {t['xe']} is broken"
         
 
 def test_advection_stiffness():
@@ -274,6 +336,8 @@ def test_advection_stiffness():
               scaled, rotated]:
         assert np.allclose(advection_stiffness(t["xe"],t["u"]),
                            t["ans"]), f"element\n {t['xe']} with velocity\n {t['u']} is broken"
+        assert np.allclose(analytic_advection_stiffness(t["xe"][np.newaxis],t["u"])[0],
+                           t["ans"]), f"analytic element\n {t['xe']} with velocity\n {t['u']} is broken"
         
 def test_global2localcoords():
     
@@ -406,4 +470,916 @@ def test_mass():
     
     for t in [default, translated, scaled, rotated]:
         assert np.allclose(mass(t["xe"]),
-                           t["ans"]), f"element\n {t['xe']} is broken"
\ No newline at end of file
+                           t["ans"]), f"element\n {t['xe']} is broken"
+        assert np.allclose(analytic_mass(t["xe"][np.newaxis])[0],
+                           t["ans"]), f"analytic element\n {t['xe']} is broken"
+        
+def test_batched_kernels():
+    
+    xes = random_elements()
+    u = np.array([3, -7])
+    D = 2.5
+    S = lambda x: np.exp(-(x[0]**2 + x[1]**2)/1e7) + x[0]
+    
+    batched = {
+                "diffusion": batched_diffusion_stiffness(xes),
+                "advection": batched_advection_stiffness(xes, u),
+                "stiffness": batched_stiffness(xes, D, u),
+                "force": batched_force(xes, S),
+                "mass": batched_mass(xes)
+              }
+    
+    analytic = {
+                "diffusion": analytic_diffusion_stiffness(xes),
+                "advection": analytic_advection_stiffness(xes, u),
+                "stiffness": analytic_stiffness(xes, D, u),
+                "mass": analytic_mass(xes)
+               }
+    
+    for e, xe in enumerate(xes):
+        reference = {
+                    "diffusion": diffusion_stiffness(xe),
+                    "advection": advection_stiffness(xe, u),
+                    "stiffness": stiffness(xe, D, u),
+                    "force": force(xe, S),
+                    "mass": mass(xe)
+                    }
+        for name in reference:
+            assert np.allclose(batched[name][e], 
+                               reference[name]), f"batched {name} of element\n {xe} is broken"
+        for name in analytic:
+            assert np.allclose(analytic[name][e], 
+                               reference[name]), f"analytic {name} of element\n {xe} is broken"
+
+def test_elementKernel():
+    
+    assert elementKernel('stiffness', 'analytic') is analytic_stiffness
+    assert elementKernel('mass', 'quadrature') is batched_mass
+    with pytest.raises(ValueError):
+        elementKernel('stiffness', 'spectral')
+
+def test_batched_force_constant_source():
+    
+    xes = np.array([[[0, 1, 0],
+                     [0, 0, 1]],
+                    [[0, 2, 0],
+                     [0, 0, 2]]])
+    ans = np.array([1/6 * np.array([1, 1, 1]),
+                    2/3 * np.array([1, 1, 1])])
+    
+    assert np.allclose(batched_force(xes, lambda x: 1), ans)
+
+def test_batched_force_scalar_source():
+    
+    # a source written for one point at a time is evaluated point by point
+    def scalar_source(x):
+        x, y = x
+        if x < 400000:
+            return 0.0
+        return math.exp(-1/(2*10000**2)*((x-442365)**2 + (y-115483)**2))
+    
+    def array_source(x):
+        return np.where(x[0] < 400000, 0, gaussian_source(x))
+    
+    xes = loadMesh('20').xes
+    assert np.allclose(batched_force(xes, scalar_source), batched_force(xes, array_source))
+    assert np.allclose(TwoDimStaticAdvDiffFESolver(scalar_source, [-4.9, -8.7], 10000, '40')[3],
+                       TwoDimStaticAdvDiffFESolver(array_source, [-4.9, -8.7], 10000, '40')[3])
+
+
+def test_assembleSystem():
+    
+    nodes, IEN, ID, LM = unit_square_mesh(6)
+    N_equations = np.max(ID)+1
+    xes = elementCoordinates(nodes, IEN)
+    k_es = batched_stiffness(xes, 0.3, np.array([1, 2]))
+    f_es = batched_force(xes, lambda x: x[0]*x[1])
+    
+    # reference incremental assembly
+    K_ref = sp.lil_matrix((N_equations, N_equations))
+    F_ref = np.zeros(N_equations)
+    for e in range(IEN.shape[0]):
+        for a in range(3):
+            A = LM[a, e]
+            for b in range(3):
+                B = LM[b, e]
+                if (A >= 0) and (B >= 0):
+                    K_ref[A, B] += k_es[e, a, b]
+            if (A >= 0):
+                F_ref[A] += f_es[e, a]
+    
+    K, F = assembleSystem(LM, k_es, f_es, N_equations)
+    
+    assert sp.isspmatrix_csr(K)
+    assert np.allclose(K.toarray(), K_ref.toarray())
+    assert np.allclose(F, F_ref)
+
+
+def test_assemblyPlan():
+    
+    nodes, IEN, ID, LM = unit_square_mesh(5)
+    N_equations = np.max(ID)+1
+    xes = elementCoordinates(nodes, IEN)
+    plan = assemblyPlan(('unit_square', 5), LM, N_equations)
+    
+    assert assemblyPlan(('unit_square', 5), LM, N_equations) is plan
+    
+    # re-assembling with different parameters reuses the same pattern
+    for D, u in [(1, np.array([0, 0])), (0.1, np.array([3, -1]))]:
+        k_es = batched_stiffness(xes, D, u)
+        f_es = batched_force(xes, lambda x: 1 + x[0])
+        K, F = plan.assembleSystem(k_es, f_es)
+        K_ref, F_ref = assembleSystem(LM, k_es, f_es, N_equations)
+        
+        assert np.array_equal(K.indptr, plan.indptr)
+        assert np.allclose(K.toarray(), K_ref.toarray())
+        assert np.allclose(F, F_ref)
+
+
+def test_loadGrid(tmp_path, monkeypatch):
+    
+    monkeypatch.setattr(meshCache, 'grid_root', str(tmp_path))
+    (tmp_path / 'las_grids').mkdir()
+    nodes = np.array([[0., 0.], [1., 0.], [0., 1.], [1., 1.]])
+    IEN = np.array([[0, 1, 2], [1, 3, 2]])
+    bdry = np.arange(4)
+    for kind, data, fmt in [('nodes', nodes, '%.18e'), ('IEN', IEN, '%d'), 
+                            ('bdry', bdry, '%d')]:
+        np.savetxt(meshCache.gridSourcePath('las', kind, '1'), data, fmt=fmt)
+    
+    # first load parses the text, second comes from the memory-mapped cache
+    for i in range(2):
+        loaded = meshCache.loadGrid('las', '1')
+        for array, ans in zip(loaded, [nodes, IEN, bdry]):
+            assert np.array_equal(array, ans)
+    assert isinstance(loaded[0], np.memmap)
+    assert loaded[1].dtype == np.int64
+    
+    # a touched but unchanged file keeps the cache, a changed one rebuilds it
+    source = meshCache.gridSourcePath('las', 'nodes', '1')
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert np.array_equal(meshCache.loadGrid('las', '1')[0], nodes)
+    np.savetxt(source, 2*nodes)
+    assert np.array_equal(meshCache.loadGrid('las', '1')[0], 2*nodes)
+    
+    with pytest.raises(ValueError):
+        meshCache.loadGrid('abc', '1')
+
+
+def test_Mesh():
+    
+    nodes, IEN, ID, LM = unit_square_mesh(4)
+    left_edge = np.where(np.isclose(nodes[0], 0))[0]
+    mesh = Mesh(nodes.T, IEN, {'left': left_edge}, ['left'])
+    
+    assert np.array_equal(mesh.ID, ID)
+    assert np.array_equal(mesh.LM, LM)
+    assert mesh.N_equations == np.max(ID)+1
+    assert np.isclose(np.sum(mesh.areas), 1)
+    
+    rng = np.random.default_rng(1)
+    for e in range(mesh.N_elements):
+        xe = nodes[:,IEN[e,:]]
+        x = local2globalCoords(xe, rng.uniform(0, 0.5, 2))
+        assert np.allclose(mesh.jacobians[e], jacobian(xe))
+        assert np.allclose(mesh.dxNa[e], globalShapeFunctionDerivatives(xe))
+        assert np.allclose(mesh.localCoords(e, x), global2localCoords(xe, x))
+    
+    # vectorised over points
+    x = mesh.centroids.T
+    assert np.allclose(mesh.localCoords(np.arange(mesh.N_elements), x), 1/3)
+    
+    assert mesh.nbytes > mesh.xes.nbytes
+    # the lazily built tables count once they exist
+    nbytes = mesh.nbytes
+    mesh.pointLocator, mesh.topology
+    assert mesh.nbytes > nbytes + mesh.topology.neighbours.nbytes
+
+def test_loadMesh():
+    
+    mesh = loadMesh('40')
+    assert loadMesh('40') is mesh
+    assert mesh.nodes.shape == (2, mesh.N_nodes)
+    assert np.all(mesh.ID[mesh.dirichlet_nodes] == -1)
+    assert mesh.N_equations == mesh.N_nodes - len(mesh.dirichlet_nodes)
+
+
+def test_dofNumbering():
+    
+    nodes, IEN, ID_ref, LM_ref = unit_square_mesh(3)
+    tags = tagBoundaryNodes(nodes, {'left': lambda x, y: np.isclose(x, 0),
+                                    'bottom': lambda x, y: np.isclose(y, 0)})
+    
+    # tags are claimed in order, so the corner (0, 0) is only 'left'
+    assert np.array_equal(tags['left'], [0, 4, 8, 12])
+    assert np.array_equal(tags['bottom'], [1, 2, 3])
+    
+    ID = numberEquations(len(ID_ref), tags['left'])
+    assert np.array_equal(ID, ID_ref)
+    assert np.array_equal(locationMatrix(IEN, ID), LM_ref)
+    
+    # several Dirichlet sets at once
+    ID = numberEquations(len(ID_ref), [tags['left'], tags['bottom']])
+    assert np.array_equal(ID[[0, 1, 4, 5]], [-1, -1, -1, 0])
+    assert np.max(ID) == 16 - 7 - 1
+    
+    Psi_interior = np.arange(np.max(ID)+1) + 1.
+    Psi_A = scatterSolution(ID, Psi_interior)
+    assert np.all(Psi_A[ID < 0] == 0)
+    assert np.array_equal(Psi_A[ID >= 0], Psi_interior)
+    assert scatterSolution(ID, np.ones((np.max(ID)+1, 2))).shape == (16, 2)
+
+
+def gaussian_source(x):
+    # S_sotonfire, without importing the plotting scripts
+    return np.exp(-1/(2*10000**2)*((x[0]-442365)**2 + (x[1]-115483)**2))
+
+def test_affineOperator():
+    
+    mesh = loadMesh('40')
+    operator = affineOperator(mesh)
+    assert affineOperator(mesh) is operator
+    
+    for u, D in [(np.array([-3, -8]), 10000), (np.array([5, 0]), 10)]:
+        K_ref = mesh.assemblyPlan.assembleMatrix(batched_stiffness(mesh.xes, D, u))
+        assert np.allclose(operator.stiffness(u, D).toarray(), K_ref.toarray())
+
+def test_TwoDimStaticAdvDiffFESweep():
+    
+    us = -10*np.array([[0, 1], [0.49, 0.87], [1, 0]])
+    Ds = np.array([10000, 5000, 20000])
+    nodes, IEN, southern_boarder, Psis = TwoDimStaticAdvDiffFESweep(gaussian_source,
+                                                                    us, Ds, '40')
+    assert Psis.shape == (nodes.shape[1], 3)
+    for i in range(3):
+        Psi = TwoDimStaticAdvDiffFESolver(gaussian_source, us[i], Ds[i], '40')[-1]
+        assert np.allclose(Psis[:,i], Psi)
+        
+def test_TwoDimTimeEvolvedAdvDiffFESweep():
+    
+    us = -10*np.array([[0, 1], [1, 0]])
+    ts, Psis = TwoDimTimeEvolvedAdvDiffFESweep(gaussian_source, us, 10000, '40', 2000)[3:]
+    assert Psis.shape[0] == 2
+    for i in range(2):
+        Psi = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, us[i], 10000, '40', 2000)[-1]
+        assert np.allclose(Psis[i], Psi)
+
+def test_solveLinearSystem():
+    
+    mesh = loadMesh('20')
+    operator = affineOperator(mesh)
+    K = operator.stiffness(-10*np.array([0.49, 0.87]), 10000)
+    F = operator.force(gaussian_source)
+    psi_ref = sp.linalg.spsolve(K.tocsc(), F)
+    
+    cases = [{'method': 'direct'},
+             {'method': 'direct', 'permc_spec': 'MMD_AT_PLUS_A'},
+             {'method': 'gmres'},
+             {'method': 'bicgstab'},
+             {'method': 'gmres', 'preconditioning': 'jacobi'},
+             {'method': 'auto'}]
+    for case in cases:
+        psi, report = solveLinearSystem(K, F, **case)
+        assert np.allclose(psi, psi_ref, rtol=1e-6, atol=1e-8*np.max(abs(psi_ref)))
+        assert report.converged
+        assert report.residual < 1e-9
+        assert report.wall_time >= 0
+        if case['method'] in ['gmres', 'bicgstab']:
+            assert report.iterations > 0
+    
+    # warm start from the solution converges immediately
+    psi, report = solveLinearSystem(K, F, 'gmres', x0=psi_ref)
+    assert report.iterations <= 1
+    
+    # 'auto' factorises until the fill gets too large, e.g. on the 1.25k grid
+    assert solveLinearSystem(K, F, 'auto')[1].method == 'direct'
+    operator = affineOperator(loadMesh('1_25'))
+    K_fine = operator.stiffness(-10*np.array([0.49, 0.87]), 10000)
+    psi, report = solveLinearSystem(K_fine, operator.force(gaussian_source), 'auto')
+    assert report.method == 'gmres' and report.converged
+    
+    with pytest.raises(ValueError):
+        solveLinearSystem(K, F, 'cholesky')
+    with pytest.raises(ValueError):
+        preconditioner(K, 'multigrid')
+    
+    # the solver options are passed through the static solver
+    Psi = TwoDimStaticAdvDiffFESolver(gaussian_source, -10*np.array([0.49, 0.87]),
+                                      10000, '20')[-1]
+    *_, Psi_gmres, report = TwoDimStaticAdvDiffFESolver(
+        gaussian_source, -10*np.array([0.49, 0.87]), 10000, '20',
+        linear_solver='gmres', solver_options={'rtol': 1e-12}, return_report=True)
+    assert report.method == 'gmres'
+    assert np.allclose(Psi_gmres, Psi)
+
+def test_TwoDimStaticAdvDiffFEMultiSource():
+    
+    u, D = -10*np.array([0.49, 0.87]), 10000
+    # fires of varying location and width
+    Ss = [lambda x, x0=x0, w=w: np.exp(-1/(2*w**2)*((x[0]-x0)**2 + (x[1]-115483)**2))
+          for x0, w in [(442365, 10000), (430000, 5000), (450000, 20000)]]
+    nodes, IEN, southern_boarder, Psis = TwoDimStaticAdvDiffFEMultiSource(Ss, u, D, '40')
+    assert Psis.shape == (nodes.shape[1], 3)
+    for i in range(3):
+        Psi = TwoDimStaticAdvDiffFESolver(Ss[i], u, D, '40')[-1]
+        assert np.allclose(Psis[:,i], Psi)
+    
+    # the factorisation is shared with later solves with the same parameters
+    operator = affineOperator(loadMesh('40'))
+    assert factorisation(operator, u, D) is factorisation(operator, u, D)
+    assert factorisation(operator, u, D) is not factorisation(operator, u, 2*D)
+    
+    # several right-hand sides are only supported by the direct solver
+    Fs = operator.forces(Ss)
+    with pytest.raises(ValueError):
+        solveLinearSystem(operator.stiffness(u, D), Fs, 'gmres')
+
+def test_PointLocator(monkeypatch):
+    
+    nodes, IEN, ID, LM = unit_square_mesh(4)
+    mesh = Mesh(nodes.T, IEN, {}, ())
+    assert isinstance(mesh.pointLocator, PointLocator)
+    assert mesh.pointLocator is mesh.pointLocator
+    
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 1, (2, 200))
+    elements, weights, inside = mesh.pointLocator.locate(points)
+    assert np.all(inside)
+    assert np.all(weights >= -1e-10)
+    assert np.allclose(weights.sum(axis=1), 1)
+    # the weights reproduce the points
+    assert np.allclose(np.einsum('eij,ej->ie', mesh.xes[elements], weights), points)
+    
+    # a node is found in one of the elements it belongs to
+    elements, weights, inside = mesh.pointLocator.locate(nodes[:,5])
+    assert 5 in IEN[elements[0]]
+    assert np.allclose(weights[0][IEN[elements[0]] == 5], 1)
+    
+    # points far from every candidate centroid are found by walking
+    monkeypatch.setattr(PointLocator, 'initial_candidates', 1)
+    monkeypatch.setattr(PointLocator, 'max_candidates', 1)
+    elements_walked, weights_walked, inside = mesh.pointLocator.locate(points)
+    assert np.all(inside)
+    assert np.allclose(np.einsum('eij,ej->ie', mesh.xes[elements_walked], weights_walked),
+                       points)
+    
+    # points outside the mesh are flagged and extrapolated from a nearby element
+    elements, weights, inside = mesh.pointLocator.locate(np.array([[1.5, 0.5], [0.5, -2]]))
+    assert not np.any(inside)
+    assert np.allclose(np.einsum('eij,ej->ie', mesh.xes[elements], weights),
+                       [[1.5, 0.5], [0.5, -2]])
+
+def test_pollutionExtractor():
+    
+    # a linear field is interpolated exactly
+    nodes, IEN, ID, LM = unit_square_mesh(4)
+    psi = 2*nodes[0] - 3*nodes[1] + 1
+    for coords in [np.array([0.3, 0.55]), np.array([0.9, 0.1]), nodes[:,7]]:
+        assert np.isclose(pollutionExtractor(psi, nodes, IEN, coords),
+                          2*coords[0] - 3*coords[1] + 1)
+        element = nearestElement2Coords(nodes, IEN, coords)
+        assert any(np.array_equal(element, row) for row in IEN)
+    
+    # on a grid, the containing element is found
+    mesh = loadMesh('20')
+    reading = np.array([473993, 171625])
+    element = nearestElement2Coords(mesh.nodes, mesh.IEN, reading)
+    xi = global2localCoords(mesh.nodes[:,element], reading)
+    assert np.all(xi >= 0) and np.sum(xi) <= 1
+
+def test_receptorMatrix():
+    
+    nodes, IEN, ID, LM = unit_square_mesh(4)
+    receptors = np.array([[0.3, 0.9, 0.5, 1], [0.55, 0.1, 0.5, 1]])
+    R = receptorMatrix(nodes, IEN, receptors)
+    assert R.shape == (4, nodes.shape[1])
+    assert np.all(np.diff(R.indptr) == 3)
+    assert np.allclose(R.sum(axis=1), 1)
+    
+    # several linear fields, e.g. timesteps, are interpolated exactly at once
+    ys = np.column_stack([a*nodes[0] + b*nodes[1] + 1 for a, b in [(2, -3), (0, 1), (5, 5)]])
+    values = R @ ys
+    assert values.shape == (4, 3)
+    for j, (a, b) in enumerate([(2, -3), (0, 1), (5, 5)]):
+        assert np.allclose(values[:,j], a*receptors[0] + b*receptors[1] + 1)
+        for i in range(4):
+            assert np.isclose(pollutionExtractor(ys[:,j], nodes, IEN, receptors[:,i]),
+                              values[i,j])
+
+def test_MeshTopology():
+    
+    # 5x5 nodes, 16 squares of 2 triangles
+    nodes, IEN, ID, LM = unit_square_mesh(4)
+    topology = MeshTopology(IEN)
+    assert topology.N_nodes == 25
+    
+    for e in [0, 7, 17]:
+        assert topology.findElement(IEN[e]) == e
+        assert topology.findElement(IEN[e][::-1]) == e
+    assert topology.findElement([0, 1, 24]) == -1
+    
+    # every element is listed around each of its nodes
+    for n in range(25):
+        assert set(topology.nodeElements(n)) == set(np.where(np.any(IEN == n, axis=1))[0])
+    
+    # Euler: E = N_nodes + N_elements - 1, with 4*4 boundary edges
+    assert len(topology.edges) == 25 + 32 - 1
+    assert len(topology.boundary_edges) == 16
+    for e in range(32):
+        for a in range(3):
+            edge = topology.edges[topology.element_edges[e, a]]
+            assert set(edge) == set(IEN[e]) - {IEN[e, a]}
+            f = topology.neighbours[e, a]
+            if f >= 0:
+                assert set(edge) < set(IEN[f])
+                assert e in topology.neighbours[f]
+    
+    # the mesh topology backs elementValidityChecker
+    mesh = loadMesh('40')
+    assert mesh.topology is mesh.topology
+    assert elementValidityChecker(mesh.IEN, mesh.IEN[10][[2, 0, 1]]) == (10, True)
+    assert elementValidityChecker(IEN, [0, 1, 24]) == (-1, False)
+
+def test_MassSolver():
+    
+    operator = affineOperator(loadMesh('40'))
+    M = operator.M
+    b = np.random.default_rng(0).normal(size=M.shape[0])
+    x_ref = np.linalg.solve(M.toarray(), b)
+    
+    for strategy in ['lu', 'cg']:
+        mass_solve = MassSolver(M, strategy)
+        assert np.allclose(mass_solve.solve(b), x_ref)
+        assert mass_solve.matrix is M
+    
+    # lumping keeps the total mass, and solves with the row sums
+    mass_solve = MassSolver(M, 'lumped')
+    assert np.isclose(mass_solve.matrix.sum(), M.sum())
+    assert np.allclose(mass_solve.solve(b), b/np.asarray(M.sum(axis=1)).ravel())
+    
+    assert operator.massSolver('lu') is operator.massSolver('lu')
+    with pytest.raises(ValueError):
+        MassSolver(M, 'inverse')
+    
+    # the time-evolved solution does not depend on how M is solved with, and
+    # somewhat on lumping it on a grid this coarse
+    Psi = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, -10*np.array([0, 1]),
+                                           10000, '40', 2000)[-1]
+    Psi_cg = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, -10*np.array([0, 1]),
+                                              10000, '40', 2000, mass_solver='cg')[-1]
+    Psi_lumped = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, -10*np.array([0, 1]),
+                                                  10000, '40', 2000, 
+                                                  mass_solver='lumped')[-1]
+    assert np.allclose(Psi_cg, Psi)
+    assert np.max(abs(Psi_lumped - Psi)) < 0.2
+
+def test_implicitIntegrate():
+    
+    operator = affineOperator(loadMesh('40'))
+    M, K = operator.M, operator.stiffness(-10*np.array([0.49, 0.87]), 10000)
+    F = operator.force(gaussian_source)
+    ts = np.linspace(0, 2000, 5)
+    # exact solution of M dpsi/dt = F - K psi, psi(0) = 0
+    A = np.linalg.solve(M.toarray(), K.toarray())
+    psi_static = np.linalg.solve(K.toarray(), F)
+    exact = np.column_stack([psi_static - scipy.linalg.expm(-t*A) @ psi_static for t in ts])
+    
+    # steps land on the output times, with equal steps recognised as equal
+    hs, n_steps = stepSizes(ts, 150)
+    assert np.all(n_steps == 4) and len(np.unique(hs)) == 1
+    
+    expected_orders = {'backward_euler': 1, 'crank_nicolson': 2, 'bdf2': 2}
+    for method, order in expected_orders.items():
+        errors = [np.max(abs(implicitIntegrate(M, K, F, ts, method, dt=dt) - exact))
+                  for dt in [100, 50]]
+        assert np.log2(errors[0]/errors[1]) == pytest.approx(order, abs=0.3)
+    
+    # the theta-method with theta = 1/2 is Crank-Nicolson
+    assert np.allclose(implicitIntegrate(M, K, F, ts, 'theta', theta=0.5, dt=50),
+                       implicitIntegrate(M, K, F, ts, 'crank_nicolson', dt=50))
+    # and can restart from a previous solution
+    ys = implicitIntegrate(M, K, F, ts, 'crank_nicolson', dt=50)
+    ys_restart = implicitIntegrate(M, K, F, ts[2:], 'crank_nicolson', dt=50, psi0=ys[:,2])
+    assert np.allclose(ys_restart, ys[:,2:])
+    
+    with pytest.raises(ValueError):
+        implicitIntegrate(M, K, F, ts, 'theta')
+    with pytest.raises(ValueError):
+        implicitIntegrate(M, K, F, ts, 'leapfrog')
+    
+    # through the solver, Crank-Nicolson agrees with RK45
+    Psi = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, -10*np.array([0, 1]),
+                                           10000, '40', 2000)[-1]
+    Psi_CN = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, -10*np.array([0, 1]),
+                                              10000, '40', 2000, 
+                                              integrator='crank_nicolson',
+                                              integrator_options={'dt': 2})[-1]
+    assert Psi_CN.shape == Psi.shape
+    assert np.max(abs(Psi_CN - Psi)) < 1e-3
+
+def test_exponentialIntegrate():
+    
+    operator = affineOperator(loadMesh('40'))
+    M, K = operator.M, operator.stiffness(-10*np.array([0.49, 0.87]), 10000)
+    F = operator.force(gaussian_source)
+    ts = np.linspace(0, 2000, 11)
+    A = np.linalg.solve(M.toarray(), K.toarray())
+    psi_static = np.linalg.solve(K.toarray(), F)
+    exact = np.column_stack([psi_static - scipy.linalg.expm(-t*A) @ psi_static for t in ts])
+    
+    for strategy in ['lu', 'cg']:
+        ys = exponentialIntegrate(operator.massSolver(strategy), K, F, ts)
+        assert np.allclose(ys, exact, atol=1e-8*np.max(abs(exact)))
+    
+    # through the solver, with the same output times as RK45
+    ts_RK, Psi = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, -10*np.array([0, 1]),
+                                                  10000, '40', 2000)[3:]
+    ts_exp, Psi_exp = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, 
+                                                       -10*np.array([0, 1]), 10000,
+                                                       '40', 2000, 
+                                                       integrator='exponential')[3:]
+    assert np.array_equal(ts_exp, ts_RK)
+    assert np.max(abs(Psi_exp - Psi)) < 1e-3
+
+def test_outputSinks(tmp_path):
+    
+    u, D = -10*np.array([0, 1]), 10000
+    nodes, IEN, southern_boarder, ts, Psi = TwoDimTimeEvolvedAdvDiffFESolver(
+        gaussian_source, u, D, '40', 2000)
+    
+    # every frame written to disk
+    filename = str(tmp_path / 'Psi.npy')
+    Psi_mmap = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, u, D, '40', 2000,
+                                                sink=MemmapSink(filename))[-1]
+    assert np.array_equal(Psi_mmap, Psi)
+    assert np.array_equal(np.load(filename), Psi)
+    
+    # only the values at the receptors
+    receptors = np.array([[473993, 442365], [171625, 125483]])
+    R = loadMesh('40').pointLocator.interpolationMatrix(receptors)
+    values = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, u, D, '40', 2000,
+                                              sink=ReceptorSink(R))[-1]
+    assert values.shape == (2, 201)
+    assert np.allclose(values, R @ Psi)
+    
+    # every 10th frame
+    ts_10, Psi_10 = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, u, D, '40', 2000,
+                                                     sink=EveryKthSink(MemorySink(), 10))[3:]
+    assert np.array_equal(ts_10, ts[::10])
+    assert np.array_equal(Psi_10, Psi[:,::10])
+    
+    # the implicit integrators stream to the sinks too
+    Psi_CN = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, u, D, '40', 2000,
+                                              integrator='crank_nicolson',
+                                              sink=EveryKthSink(ReceptorSink(R), 50))[-1]
+    assert Psi_CN.shape == (2, 5)
+    
+    # and one sink per parameter set in sweeps
+    us = -10*np.array([[0, 1], [1, 0]])
+    results = TwoDimTimeEvolvedAdvDiffFESweep(gaussian_source, us, D, '40', 2000,
+                                              sink_factory=lambda i: ReceptorSink(R))[-1]
+    assert len(results) == 2
+    assert np.allclose(results[0], values)
+
+def test_TwoDimTimeEvolvedAdvDiffFEReceptors():
+    
+    u, D = -10*np.array([0.49, 0.87]), 10000
+    receptors = np.array([[473993, 442365], [171625, 125483]])
+    R = loadMesh('40').pointLocator.interpolationMatrix(receptors)
+    for integrator in ['RK45', 'crank_nicolson', 'exponential']:
+        ts, Psi = TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, u, D, '40', 2000,
+                                                   integrator=integrator)[3:]
+        ts_R, values, Psi_final = TwoDimTimeEvolvedAdvDiffFEReceptors(
+            gaussian_source, u, D, '40', 2000, receptors, keep_final=True,
+            integrator=integrator)
+        assert np.array_equal(ts_R, ts)
+        assert np.allclose(values, R @ Psi)
+        assert np.allclose(Psi_final, Psi[:,-1])
+    
+    # a single receptor
+    ts_R, values = TwoDimTimeEvolvedAdvDiffFEReceptors(gaussian_source, u, D, '40',
+                                                       2000, receptors[:,0])
+    assert values.shape == (1, 201)
+
+def test_TwoDimStaticAdvDiffFEAdjoint():
+    
+    u, D = -10*np.array([0.49, 0.87]), 10000
+    receptors = np.array([[473993, 450000], [171625, 140000]])
+    nodes, IEN, southern_boarder, adjoint = TwoDimStaticAdvDiffFEAdjoint(receptors, 
+                                                                         u, D, '20')
+    mesh = loadMesh('20')
+    operator = affineOperator(mesh)
+    R = mesh.pointLocator.interpolationMatrix(receptors)
+    
+    Lambda = adjoint.influenceMap()
+    assert Lambda.shape == (nodes.shape[1], 2)
+    assert np.all(Lambda[southern_boarder] == 0)
+    
+    # the receptor values agree with those of forward solves
+    Ss = [lambda x, x0=x0: np.exp(-1/(2*10000**2)*((x[0]-x0)**2 + (x[1]-115483)**2))
+          for x0 in [430000, 442365, 455000]]
+    values = adjoint.values(Ss)
+    assert values.shape == (2, 3)
+    for j, S in enumerate(Ss):
+        psi = mesh.scatter(sp.linalg.spsolve(operator.stiffness(u, D).tocsc(), 
+                                             operator.force(S)))
+        assert np.allclose(values[:,j], R @ psi)
+        assert np.allclose(adjoint.values(S), values[:,j])
+
+def test_sourceReceptorMatrix(tmp_path):
+    
+    u, D = -10*np.array([0.49, 0.87]), 10000
+    receptors = np.array([[473993, 450000], [171625, 140000]])
+    centres = gridCentres((430000, 455000), (105000, 125000), 12500)
+    assert centres.shape == (2, 9)
+    assert np.allclose(gaussianSource([442365, 115483])([442365, 115483]), 1)
+    
+    # chunks smaller than the number of sources give the same matrix
+    greens = sourceReceptorMatrix(centres, receptors, u, D, '20', chunk=4)
+    assert greens.G.shape == (2, 9)
+    _, _, _, adjoint = TwoDimStaticAdvDiffFEAdjoint(receptors, u, D, '20')
+    assert np.allclose(greens.G, adjoint.values([gaussianSource(c) for c in centres.T]))
+    
+    # a two-fire scenario matches a forward solve
+    mesh = loadMesh('20')
+    operator = affineOperator(mesh)
+    strengths = np.zeros(9)
+    strengths[[1, 5]] = [1, 0.5]
+    S = lambda x: gaussianSource(centres[:,1])(x) + 0.5*gaussianSource(centres[:,5])(x)
+    psi = mesh.scatter(sp.linalg.spsolve(operator.stiffness(u, D).tocsc(),
+                                         operator.force(S)))
+    R = mesh.pointLocator.interpolationMatrix(receptors)
+    assert np.allclose(greens.values(strengths), R @ psi)
+    assert greens.values(np.column_stack([strengths, strengths])).shape == (2, 2)
+    
+    greens.save(tmp_path / 'greens.npz')
+    loaded = SourceReceptorMatrix.load(tmp_path / 'greens.npz')
+    assert np.array_equal(loaded.G, greens.G)
+    assert np.array_equal(loaded.centres, centres)
+    assert (loaded.sigma, loaded.D, loaded.resolution) == (10000, D, '20')
+    assert np.array_equal(loaded.u, u)
+
+def test_sensitivities():
+    
+    u, D = -10*np.array([0.49, 0.87]), 10000
+    receptors = np.array([[473993, 450000], [171625, 140000]])
+    R = loadMesh('20').pointLocator.interpolationMatrix(receptors)
+    # central differences in u_x, u_y and D
+    steps = [np.array([1e-4, 0, 0]), np.array([0, 1e-4, 0]), np.array([0, 0, 1e-1])]
+    
+    def perturbed(step):
+        return u + step[:2], D + step[2]
+    
+    values, dvalues = TwoDimStaticAdvDiffFESensitivities(gaussian_source, u, D, '20',
+                                                         receptors)
+    assert np.allclose(values, R @ TwoDimStaticAdvDiffFESolver(gaussian_source, 
+                                                               u, D, '20')[3])
+    assert dvalues.shape == (2, 3)
+    for j, step in enumerate(steps):
+        plus = R @ TwoDimStaticAdvDiffFESolver(gaussian_source, *perturbed(step), '20')[3]
+        minus = R @ TwoDimStaticAdvDiffFESolver(gaussian_source, *perturbed(-step), '20')[3]
+        assert np.allclose(dvalues[:,j], (plus - minus)/(2*np.sum(step)), rtol=1e-4)
+    
+    ts, values, dvalues = TwoDimTimeEvolvedAdvDiffFESensitivities(
+        gaussian_source, u, D, '40', 15000, receptors)
+    _, expected = TwoDimTimeEvolvedAdvDiffFEReceptors(gaussian_source, u, D, '40', 15000,
+                                                      receptors, 
+                                                      integrator='crank_nicolson')
+    assert np.allclose(values, expected)
+    assert dvalues.shape == (2, 3, 201)
+    for j, step in enumerate(steps):
+        plus = TwoDimTimeEvolvedAdvDiffFEReceptors(gaussian_source, *perturbed(step), '40',
+                                                   15000, receptors,
+                                                   integrator='crank_nicolson')[1]
+        minus = TwoDimTimeEvolvedAdvDiffFEReceptors(gaussian_source, *perturbed(-step), '40',
+                                                    15000, receptors,
+                                                    integrator='crank_nicolson')[1]
+        assert np.allclose(dvalues[:,j], (plus - minus)/(2*np.sum(step)), 
+                           rtol=1e-4, atol=1e-8)
+    
+    # and for the exponential integrator
+    ts, values, dvalues = TwoDimTimeEvolvedAdvDiffFESensitivities(
+        gaussian_source, u, D, '40', 15000, receptors, integrator='exponential')
+    _, expected = TwoDimTimeEvolvedAdvDiffFEReceptors(gaussian_source, u, D, '40', 15000,
+                                                      receptors, integrator='exponential')
+    assert np.allclose(values, expected)
+    for j, step in enumerate(steps):
+        plus = TwoDimTimeEvolvedAdvDiffFEReceptors(gaussian_source, *perturbed(step), '40',
+                                                   15000, receptors,
+                                                   integrator='exponential')[1]
+        minus = TwoDimTimeEvolvedAdvDiffFEReceptors(gaussian_source, *perturbed(-step), '40',
+                                                    15000, receptors,
+                                                    integrator='exponential')[1]
+        assert np.allclose(dvalues[:,j], (plus - minus)/(2*np.sum(step)), 
+                           rtol=1e-4, atol=1e-8)
+    
+    with pytest.raises(ValueError):
+        TwoDimTimeEvolvedAdvDiffFESensitivities(gaussian_source, u, D, '40', 15000,
+                                                receptors, integrator='RK45')
+
+def test_solveAll(tmp_path, monkeypatch):
+    
+    u, D = -10*np.array([0.49, 0.87]), 10000
+    jobs = [(staticSolution, (gaussian_source, u, D, '40')),
+            (staticSolution, (gaussian_source, u, D, '20')),
+            (receptorTimeSeries, (gaussian_source, u, D, '40', 15000,
+                                  np.array([473993, 171625]), 'exponential'))]
+    results = solveAll(jobs, tmp_path, max_workers=2)
+    assert len(list(tmp_path.glob('*.npz'))) == 3
+    assert np.allclose(results[0], TwoDimStaticAdvDiffFESolver(gaussian_source, 
+                                                               u, D, '40')[3])
+    assert results[2].shape == (201,)
+    
+    # the second time everything comes from the cache, without a pool
+    monkeypatch.setattr(parallelConvergence, 'ProcessPoolExecutor', None)
+    for cached, result in zip(solveAll(jobs, tmp_path), results):
+        assert np.array_equal(cached, result)
+    # the key depends on every input
+    keys = {parallelConvergence.solutionKey(solve, *args) for solve, args in jobs}
+    keys.add(parallelConvergence.solutionKey(staticSolution, gaussian_source, u, 
+                                             D + 1, '40'))
+    assert len(keys) == 4
+
+def test_resultCache(tmp_path, monkeypatch):
+    
+    # sources are keyed by code and closure values, not by name
+    def bump(x0):
+        return lambda x: np.exp(-1/(2*10000**2)*((x[0]-x0)**2 + (x[1]-115483)**2))
+    assert sourceKey(bump(442365)) == sourceKey(bump(442365.0))
+    assert sourceKey(bump(442365)) != sourceKey(bump(430000))
+    assert sourceKey(gaussian_source) != sourceKey(bump(442365))
+    gaussian_source.cache_key = 'soton'
+    assert sourceKey(gaussian_source) == 'soton'
+    del gaussian_source.cache_key
+    assert resultKey([0, -10], 1) == resultKey(np.array([0., -10.]), 1.0)
+    assert resultKey('1') != resultKey(1)
+    with pytest.raises(TypeError):
+        resultKey(object())
+    
+    # count the solves behind the cache, so each lookup is known to hit or miss
+    calls = {'static': 0, 'time_evolved': 0}
+    def counted(solver, name):
+        def solve(*args):
+            calls[name] += 1
+            return solver(*args)
+        return solve
+    monkeypatch.setattr('resultCache.TwoDimStaticAdvDiffFESolver', 
+                        counted(TwoDimStaticAdvDiffFESolver, 'static'))
+    monkeypatch.setattr('resultCache.TwoDimTimeEvolvedAdvDiffFESolver',
+                        counted(TwoDimTimeEvolvedAdvDiffFESolver, 'time_evolved'))
+    
+    cache = ResultCache(tmp_path)
+    u, D = -10*np.array([0.49, 0.87]), 10000
+    expected = TwoDimStaticAdvDiffFESolver(gaussian_source, u, D, '40')
+    result = cachedStaticSolver(gaussian_source, u, D, '40', cache=cache)
+    for a, b in zip(result, expected):
+        assert np.array_equal(a, b)
+    timed = cachedTimeEvolvedSolver(gaussian_source, u, D, '40', 15000, 
+                                    integrator='exponential', cache=cache)
+    assert timed[4].shape == (expected[0].shape[1], 201)
+    assert calls == {'static': 1, 'time_evolved': 1}
+    assert len(list(tmp_path.glob('*.npz'))) == 2
+    
+    # the second time the results come from the cache, without solving
+    assert np.array_equal(cachedStaticSolver(gaussian_source, u, D, '40', 
+                                             cache=cache)[3], expected[3])
+    assert np.array_equal(cachedTimeEvolvedSolver(gaussian_source, u, D, '40', 15000,
+                                                  integrator='exponential', 
+                                                  cache=cache)[4], timed[4])
+    assert calls == {'static': 1, 'time_evolved': 1}
+    
+    # a change to the source's constants misses
+    cachedStaticSolver(bump(442365.0), u, D, '40', cache=cache)
+    cachedStaticSolver(bump(430000), u, D, '40', cache=cache)
+    assert calls['static'] == 3
+    
+    # as do changes to the solver code: to cache_version, or to the solver modules
+    old_key = resultCache.solverCodeKey()
+    monkeypatch.setattr('resultCache.cache_version', resultCache.cache_version + 1)
+    monkeypatch.setattr('resultCache._solver_code_key', None)
+    assert resultCache.solverCodeKey() != old_key
+    cachedStaticSolver(gaussian_source, u, D, '40', cache=cache)
+    assert calls['static'] == 4
+    monkeypatch.setattr('resultCache.solver_modules', 
+                        resultCache.solver_modules + ['instrumentation'])
+    monkeypatch.setattr('resultCache._solver_code_key', None)
+    cachedStaticSolver(gaussian_source, u, D, '40', cache=cache)
+    assert calls['static'] == 5
+    cachedStaticSolver(gaussian_source, u, D, '40', cache=cache)
+    assert calls['static'] == 5
+    
+    # least recently used results are evicted first
+    cache.put('a', [np.zeros(1000)])
+    cache.put('b', [np.ones(1000)])
+    os.utime(cache.path('a'), ns=(0, 0))
+    os.utime(cache.path('b'), ns=(10**9, 10**9))
+    assert cache.get('a') is not None
+    cache.max_bytes = sum(f.stat().st_size for f in tmp_path.glob('*.npz')) - 1
+    cache.evict()
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    cache.clear()
+    assert not list(tmp_path.glob('*.npz'))
+
+def test_instrumentation(tmp_path):
+    
+    import json
+    # nothing is recorded, or costs anything, unless enabled
+    assert phase('anything') is phase('else')
+    count('anything')
+    
+    u, D = -10*np.array([0.49, 0.87]), 10000
+    reading = np.array([473993, 171625])
+    with recording(track_memory=True) as recorder:
+        with phase('outer', note='test'):
+            nodes, IEN, _, psi = TwoDimStaticAdvDiffFESolver(gaussian_source, u, D, '40')
+            pollutionExtractor(psi, nodes, IEN, reading)
+        TwoDimTimeEvolvedAdvDiffFESolver(gaussian_source, u, D, '40', 1000)
+    assert instrumentation._recorder is None
+    
+    totals = recorder.totals()
+    for name in ['outer', 'static_solve', 'linear_solve', 'force', 'assembly',
+                 'pollution_extraction', 'time_evolved_solve', 'time_integration']:
+        assert totals[name]['calls'] >= 1
+    assert recorder.counters['rhs_evaluations'] > 0
+    assert recorder.counters['located_points'] >= 1
+    N_elements = IEN.shape[0]
+    assert recorder.counters['source_evaluations'] == 2*3*N_elements
+    assert recorder.peaks['frame_store_bytes'] == nodes.shape[1]*201*8
+    
+    # phases nest, and an enclosing phase's memory peak covers its contents
+    events = {event['name']: event for event in recorder.events}
+    assert events['outer']['depth'] == 0 and events['static_solve']['depth'] == 1
+    assert events['outer']['args']['note'] == 'test'
+    assert events['outer']['duration'] >= events['static_solve']['duration']
+    assert events['outer']['args']['peak_bytes'] >= events['static_solve']['args']['peak_bytes']
+    
+    recorder.save(tmp_path / 'profile.json')
+    recorder.saveChromeTrace(tmp_path / 'trace.json')
+    with open(tmp_path / 'profile.json') as file:
+        assert json.load(file)['counters'] == recorder.counters
+    with open(tmp_path / 'trace.json') as file:
+        trace = json.load(file)['traceEvents']
+    assert sum(event['ph'] == 'X' for event in trace) == len(recorder.events)
+    assert all(event['dur'] >= 0 for event in trace if event['ph'] == 'X')
+
+def test_benchmarks():
+    
+    # two triangles per square, numbered from the lower-left corner
+    nodes, IEN, tags = unitSquareGrid(1)
+    assert np.array_equal(nodes, [[0, 0], [1, 0], [0, 1], [1, 1]])
+    assert np.array_equal(IEN, [[0, 1, 2], [1, 3, 2]])
+    assert np.array_equal(tags['dirichlet'], [0, 2])
+    assert np.array_equal(tags['neumann'], [1, 3])
+    mesh = unitSquareMesh(4)
+    nodes, IEN, ID, LM = unit_square_mesh(4)
+    assert np.allclose(mesh.nodes, nodes)
+    assert np.array_equal(mesh.IEN, IEN)
+    assert np.array_equal(mesh.ID, ID)
+    assert np.all(mesh.areas > 0)
+    # benchmark meshes are never shared with the solvers' caches, but have the
+    # same Dirichlet border
+    for family, resolution in [('esw', '100'), ('las', '40')]:
+        fresh = gridMesh(family, resolution)
+        assert fresh.key is None
+        assert np.array_equal(fresh.dirichlet_nodes, 
+                              loadMesh(resolution, family).dirichlet_nodes)
+    
+    result = benchmarkMesh(lambda: gridMesh('las', '40'), repeats=1, n_receptors=5)
+    assert result['N_equations'] == loadMesh('40').N_equations
+    assert list(result['times']) == benchmark_stages
+    assert all(t > 0 for t in result['times'].values())
+    with pytest.raises(ValueError):
+        benchmarkMesh(lambda: unitSquareMesh(4), integrator='RK45')
+    
+    # exponents of made-up timings, and the slowdowns between two runs
+    def run(scale):
+        return {'results': [{'name': f'unit_square_{N}', 'family': 'synthetic', 
+                             'N_equations': N, 
+                             'times': {stage: scale*1e-6*N**(1 + i/4) 
+                                       for i, stage in enumerate(benchmark_stages)}}
+                            for N in [10**3, 10**4, 10**5]]}
+    exponents = scalingExponents(run(1))['synthetic']
+    assert np.allclose([exponents[stage] for stage in benchmark_stages], 
+                       [1, 1.25, 1.5, 1.75, 2])
+    assert compareBenchmarks(run(1), run(1.1)) == []
+    slowdowns = compareBenchmarks(run(1), run(1.5))
+    assert len(slowdowns) == 15 and np.allclose([s[4] for s in slowdowns], 1.5)
+
+def test_pollutionMesh():
+    
+    # copies of the solver's arrays still find the shared mesh
+    mesh = loadMesh('40')
+    assert pollutionMesh(mesh.nodes.copy(), mesh.IEN.copy()) is mesh
+    assert meshFromArrays(None, mesh.IEN[:].copy()) is mesh
+    psi = np.arange(mesh.N_nodes, dtype=float)
+    reading = np.array([473993, 171625])
+    assert pollutionExtractor(psi, mesh.nodes.copy(), mesh.IEN, reading) == \
+        pollutionExtractor(psi, mesh.nodes, mesh.IEN, reading)
+    
+    # arrays from elsewhere get a mesh built once
+    nodes, IEN, _, _ = unit_square_mesh(4)
+    built = pollutionMesh(nodes, IEN)
+    assert built.key is None
+    assert pollutionMesh(nodes.copy(), IEN.copy()) is built
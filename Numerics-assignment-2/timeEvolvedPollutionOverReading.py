@@ -1,7 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from TwoDimTimeEvolvedAdvDiffFESolver import TwoDimTimeEvolvedAdvDiffFESolver
-from staticPollutionOverReading import pollutionExtractor, S_sotonfire
+from TwoDimTimeEvolvedAdvDiffFESolver import (TwoDimTimeEvolvedAdvDiffFESolver,
+                                              TwoDimTimeEvolvedAdvDiffFEReceptors)
+from staticPollutionOverReading import S_sotonfire
 
 def doTimeEvolution(t_max, u, D, resolution):
     """
@@ -36,7 +37,8 @@ def doTimeEvolution(t_max, u, D, resolution):
     
     plt.show()
         
-def pollutionTimeSeries(t_max, u, D, resolution, coords, figsize=None, filename=None):
+def pollutionTimeSeries(t_max, u, D, resolution, coords, figsize=None, filename=None,
+                        integrator='RK45'):
     """
     Plots the time series of pollution concentration at the specified coordinates
     over the given time period.
@@ -50,18 +52,19 @@ def pollutionTimeSeries(t_max, u, D, resolution, coords, figsize=None, filename=
                          pollution value is to be extracted.
     figsize (tuple, optional): Figure size for the plot. Default is None.
     filename (str, optional): Filename for saving the plot. Default is None.
+    integrator (str, optional): Time integrator of the solver, 'RK45' (default)
+                                or e.g. 'exponential'. See timeIntegrators.py.
 
     Returns:
     psi_at_reading (np.ndarray): Array of pollution concentration values at the
                                  specified coordinates over time.
     """
-    nodes, IEN, southern_boarder, ts, ys = TwoDimTimeEvolvedAdvDiffFESolver(S_sotonfire, 
-                                                                            u, D, resolution, 
-                                                                            t_max)
+    # Only the values at 'coords' are kept as the solution is computed
+    ts, values = TwoDimTimeEvolvedAdvDiffFEReceptors(S_sotonfire, u, D, resolution,
+                                                     t_max, coords,
+                                                     integrator=integrator)
     # really this should say psi_at_coords if we're being completely general...
-    psi_at_reading = np.zeros_like(ts)
-    for i in range(len(ts)):
-        psi_at_reading[i] = pollutionExtractor(ys[:,i], nodes, IEN, coords)
+    psi_at_reading = values[0]
     
     if figsize != None:
         plt.figure(figsize=figsize)    
@@ -77,7 +80,7 @@ def pollutionTimeSeries(t_max, u, D, resolution, coords, figsize=None, filename=
         
     return psi_at_reading
         
-def convergence(t_max, u, D, coords):
+def convergence(t_max, u, D, coords, integrator='RK45'):
     """
     Analyzes the convergence of the time-evolved finite element solution for 
     different grid resolutions.
@@ -88,6 +91,8 @@ def convergence(t_max, u, D, coords):
     D (float): Diffusion coefficient [m^2s^-1].
     coords (array-like): A 2-element array containing the coordinates where the
                          pollution value is to be extracted.
+    integrator (str, optional): Time integrator of the solver, 'RK45' (default)
+                                or e.g. 'exponential'.
 
     Returns:
     None.
@@ -96,10 +101,26 @@ def convergence(t_max, u, D, coords):
     the 40k one is useless and any higher than 5k would take hours.
     """
     
-    soln_N = pollutionTimeSeries(t_max, u, D, '20', coords)
-    soln_2N = pollutionTimeSeries(t_max, u, D, '10', coords)
-    soln_4N = pollutionTimeSeries(t_max, u, D, '5', coords)
+    soln_N = pollutionTimeSeries(t_max, u, D, '20', coords, integrator=integrator)
+    soln_2N = pollutionTimeSeries(t_max, u, D, '10', coords, integrator=integrator)
+    soln_4N = pollutionTimeSeries(t_max, u, D, '5', coords, integrator=integrator)
     
+    writeConvergenceResults(soln_N, soln_2N, soln_4N, u)
+
+def writeConvergenceResults(soln_N, soln_2N, soln_4N, u):
+    """
+    Writes the Richardson extrapolation estimates from the time series at three
+    resolutions to time_dep_convergence_results_for_u=[...].txt.
+
+    Parameters:
+    soln_N (np.ndarray): Time series at the coarsest resolution.
+    soln_2N (np.ndarray): Time series at twice the resolution.
+    soln_4N (np.ndarray): Time series at four times the resolution.
+    u (array-like): Advection velocity vector [ms^-1].
+
+    Returns:
+    None.
+    """
     y_2N_N = np.linalg.norm(soln_2N - soln_N, 2)
     y_4N_2N = np.linalg.norm(soln_4N - soln_2N, 2)
     
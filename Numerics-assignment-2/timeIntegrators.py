@@ -0,0 +1,387 @@
+import numpy as np
+from scipy import sparse as sp
+from scipy import integrate
+import scipy.sparse.linalg
+from instrumentation import phase, count
+
+'''
+Time integrators for the semi-discrete system
+
+    M dpsi/dt = F - K psi
+
+    theta-method    (M + theta h K) psi_{n+1} = (M - (1-theta) h K) psi_n + h F
+                    theta = 1 is backward Euler, theta = 1/2 Crank-Nicolson
+    BDF2            ((1+2w)/(1+w) M + h K) psi_{n+1}
+                        = M ((1+w) psi_n - w^2/(1+w) psi_{n-1}) + h F
+                    with w = h_n/h_{n-1} the step ratio (1 for a fixed step),
+                    started with a backward Euler step
+
+Each output interval is split into equal steps no longer than dt, so steps land
+exactly on the output times. The matrix on the left only depends on the step
+(and ratio), so it is factorised once per distinct step and reused for every
+step of that size. Unlike RK45, none of these has a stability limit on h.
+
+With zero initial data and constant F and K, the system also has the closed form
+
+    psi(t) = psi_static - exp(-t M^-1 K) psi_static,    K psi_static = F
+
+so exponentialIntegrate() computes the output times from the action of the
+matrix exponential (sp.linalg.expm_multiply), without any timestepping.
+
+Every integrator is a generator (...Frames) yielding the solution at one output
+time after another, so the caller can pass each on (e.g. to an output sink, see
+outputSinks.py) without all of them being held at once. rk45Frames() does the
+same for RK45 by stepping it manually.
+
+thetaTangentFrames() also integrates the tangent-linear system for the
+derivatives of psi with respect to parameters p of K,
+
+    M ddpsi/dt = -K dpsi - (dK/dp) psi
+
+with the same theta-method, so its steps reuse the factorisation of the solution
+steps and give the exact derivatives of the discrete solution.
+exponentialTangentFrames() does the same for the closed form, from the 
+exponential of the solution and tangent-linear systems together.
+'''
+
+# theta of the named theta-methods
+integrator_thetas = {'backward_euler': 1, 'crank_nicolson': 0.5}
+
+def stepSizes(ts, dt):
+    """
+    Splits each interval between output times into equal steps.
+
+    Parameters:
+    ts (np.ndarray): The output times.
+    dt (float or array-like): Largest step, or one per interval (so the step
+                              can vary through the run).
+
+    Returns:
+    tuple: A tuple containing the following elements:
+           - hs (np.ndarray): The step of each interval.
+           - n_steps (np.ndarray): The number of steps in each interval.
+    """
+    intervals = np.diff(ts)
+    n_steps = np.maximum(np.ceil(intervals/dt - 1e-9), 1).astype(int)
+    hs = intervals/n_steps
+    # steps that only differ by rounding in ts share a factorisation
+    hs = np.round(hs, 12 - int(np.floor(np.log10(np.max(hs)))))
+    return hs, n_steps
+
+def thetaFrames(M, K, F, ts, theta=0.5, dt=None, psi0=None):
+    """
+    Integrates M dpsi/dt = F - K psi with the theta-method, yielding the 
+    solution at each output time as soon as it is reached.
+
+    Parameters:
+    M (sp.spmatrix): The mass matrix.
+    K (sp.spmatrix): The stiffness matrix.
+    F (np.ndarray): The force vector.
+    ts (np.ndarray): Times at which the solution is output, starting with the
+                     time of the initial data.
+    theta (float, optional): Implicitness, 1 for backward Euler or 0.5 (default)
+                             for Crank-Nicolson.
+    dt (float or array-like, optional): Largest step, or one per output
+                                        interval. Default is None, meaning one
+                                        step per output interval.
+    psi0 (np.ndarray, optional): Initial data. Default is None, meaning zero.
+
+    Yields:
+    np.ndarray: The solution at ts[0], ts[1], ...
+    """
+    hs, n_steps = stepSizes(ts, np.diff(ts) if dt is None else dt)
+    psi = np.zeros(M.shape[0]) if psi0 is None else np.array(psi0, dtype=float)
+    yield psi
+    # factorisations of M + theta h K, and the explicit part, for each step
+    steps = dict()
+    for h, n in zip(hs, n_steps):
+        if h not in steps:
+            with phase('factorise'):
+                steps[h] = (sp.linalg.splu(sp.csc_matrix(M + theta*h*K)),
+                            sp.csr_matrix(M - (1 - theta)*h*K))
+        lu, explicit = steps[h]
+        for _ in range(n):
+            psi = lu.solve(explicit @ psi + h*F)
+        count('time_steps', n)
+        yield psi
+
+def thetaTangentFrames(M, K, F, dKs, ts, theta=0.5, dt=None):
+    """
+    Integrates M dpsi/dt = F - K psi, psi(0) = 0, with the theta-method together
+    with its tangent-linear system for each parameter derivative of K, yielding
+    both at each output time.
+
+    Parameters:
+    M (sp.spmatrix): The mass matrix.
+    K (sp.spmatrix): The stiffness matrix.
+    F (np.ndarray): The force vector.
+    dKs (list): The derivatives of K with respect to each parameter.
+    ts (np.ndarray): Times at which the solution is output.
+    theta (float, optional): Implicitness, 1 for backward Euler or 0.5 (default)
+                             for Crank-Nicolson.
+    dt (float or array-like, optional): Largest step, see thetaFrames.
+
+    Yields:
+    tuple: The solution at ts[0], ts[1], ... and an (N_equations, len(dKs)) array
+           of its derivatives with respect to each parameter.
+    """
+    hs, n_steps = stepSizes(ts, np.diff(ts) if dt is None else dt)
+    psi = np.zeros(M.shape[0])
+    dpsi = np.zeros((M.shape[0], len(dKs)))
+    yield psi, dpsi
+    steps = dict()
+    for h, n in zip(hs, n_steps):
+        if h not in steps:
+            with phase('factorise'):
+                steps[h] = (sp.linalg.splu(sp.csc_matrix(M + theta*h*K)),
+                            sp.csr_matrix(M - (1 - theta)*h*K))
+        lu, explicit = steps[h]
+        count('time_steps', n)
+        for _ in range(n):
+            psi_new = lu.solve(explicit @ psi + h*F)
+            # (dK/dp) psi at the same theta-weighting as K psi
+            psi_theta = theta*psi_new + (1 - theta)*psi
+            dF = np.column_stack([dK @ psi_theta for dK in dKs])
+            psi, dpsi = psi_new, lu.solve(explicit @ dpsi - h*dF)
+        yield psi, dpsi
+
+def bdf2Frames(M, K, F, ts, dt=None, psi0=None):
+    """
+    Integrates M dpsi/dt = F - K psi with the (variable-step) BDF2 method, 
+    yielding the solution at each output time as soon as it is reached.
+
+    Parameters:
+    M (sp.spmatrix): The mass matrix.
+    K (sp.spmatrix): The stiffness matrix.
+    F (np.ndarray): The force vector.
+    ts (np.ndarray): Times at which the solution is output, starting with the
+                     time of the initial data.
+    dt (float or array-like, optional): Largest step, or one per output
+                                        interval. Default is None, meaning one
+                                        step per output interval.
+    psi0 (np.ndarray, optional): Initial data. Default is None, meaning zero.
+
+    Yields:
+    np.ndarray: The solution at ts[0], ts[1], ...
+    """
+    hs, n_steps = stepSizes(ts, np.diff(ts) if dt is None else dt)
+    psi = np.zeros(M.shape[0]) if psi0 is None else np.array(psi0, dtype=float)
+    psi_old = None
+    h_old = None
+    yield psi
+    M = sp.csr_matrix(M)
+    # factorisations of the left-hand side for each (step, step ratio)
+    lus = dict()
+    for h, n in zip(hs, n_steps):
+        for _ in range(n):
+            if psi_old is None:
+                # backward Euler start
+                key, a, rhs = (h, None), 1, M @ psi
+            else:
+                w = h/h_old
+                key, a = (h, w), (1 + 2*w)/(1 + w)
+                rhs = M @ ((1 + w)*psi - w**2/(1 + w)*psi_old)
+            if key not in lus:
+                with phase('factorise'):
+                    lus[key] = sp.linalg.splu(sp.csc_matrix(a*M + h*K))
+            psi_old, psi, h_old = psi, lus[key].solve(rhs + h*F), h
+        count('time_steps', n)
+        yield psi
+
+def implicitFrames(M, K, F, ts, method, dt=None, theta=None, psi0=None):
+    """
+    Integrates M dpsi/dt = F - K psi with a named implicit method, yielding the
+    solution at each output time as soon as it is reached.
+
+    Parameters:
+    M (sp.spmatrix): The mass matrix.
+    K (sp.spmatrix): The stiffness matrix.
+    F (np.ndarray): The force vector.
+    ts (np.ndarray): Times at which the solution is output.
+    method (str): 'backward_euler', 'crank_nicolson', 'theta' or 'bdf2'.
+    dt (float or array-like, optional): Largest step, see thetaFrames.
+    theta (float, optional): Implicitness, for method 'theta' only.
+    psi0 (np.ndarray, optional): Initial data. Default is None, meaning zero.
+
+    Returns:
+    generator: Yields the solution at ts[0], ts[1], ...
+    """
+    if method == 'bdf2':
+        return bdf2Frames(M, K, F, ts, dt, psi0)
+    if method == 'theta':
+        if theta is None:
+            raise ValueError("The 'theta' method needs a value of theta")
+        return thetaFrames(M, K, F, ts, theta, dt, psi0)
+    if method in integrator_thetas:
+        return thetaFrames(M, K, F, ts, integrator_thetas[method], dt, psi0)
+    raise ValueError(f"Unknown time integrator {method!r}, choose from "
+                     "['backward_euler', 'crank_nicolson', 'theta', 'bdf2']")
+
+def implicitIntegrate(M, K, F, ts, method, dt=None, theta=None, psi0=None):
+    """
+    Integrates M dpsi/dt = F - K psi with a named implicit method.
+
+    Parameters:
+    As for implicitFrames.
+
+    Returns:
+    np.ndarray: An (N_equations, len(ts)) array of solutions at the output times.
+    """
+    return np.column_stack(list(implicitFrames(M, K, F, ts, method, dt, theta, psi0)))
+
+def exponentialFrames(mass_solve, K, F, ts, chunk=20):
+    """
+    Solves M dpsi/dt = F - K psi, psi(0) = 0, at equally spaced times from the
+    closed form psi(t) = psi_static - exp(-t M^-1 K) psi_static, yielding the
+    solution at each output time.
+    
+    The times are worked through in chunks: each chunk's decaying part is the
+    exponential applied to the last one of the previous chunk, so only chunk+1
+    vectors are held at once.
+
+    Parameters:
+    mass_solve (MassSolver): Solver for the mass matrix, see massSolvers.py.
+    K (sp.spmatrix): The stiffness matrix.
+    F (np.ndarray): The force vector.
+    ts (np.ndarray): Equally spaced output times.
+    chunk (int, optional): Number of output times per call of expm_multiply.
+                           Default is 20.
+
+    Yields:
+    np.ndarray: The solution at ts[0], ts[1], ...
+    """
+    K = sp.csc_matrix(K)
+    with phase('factorise'):
+        psi_static = sp.linalg.splu(K).solve(F)
+    
+    def matvec(x):
+        count('expm_matvecs')
+        return -mass_solve.solve(K @ x)
+    
+    # -M^-1 K as an operator, applied with a mass solve rather than forming
+    # M^-1 (M is symmetric, so the adjoint is -K^T M^-1)
+    A = sp.linalg.LinearOperator(K.shape, matvec=matvec,
+                                 rmatvec=lambda x: -K.T @ mass_solve.solve(x),
+                                 dtype=float)
+    # the trace only shifts the exponent, so the diagonal estimate is enough
+    traceA = -np.sum(K.diagonal()/mass_solve.matrix.diagonal())
+    
+    def decay(v, t, num):
+        return sp.linalg.expm_multiply(A, v, start=0, stop=t, num=num,
+                                       endpoint=True, traceA=traceA)
+    
+    decaying = psi_static if ts[0] == 0 else decay(psi_static, ts[0], 2)[-1]
+    yield psi_static - decaying
+    for start in range(0, len(ts) - 1, chunk):
+        stop = min(start + chunk, len(ts) - 1)
+        decays = decay(decaying, ts[stop] - ts[start], stop - start + 1)
+        for decaying in decays[1:]:
+            yield psi_static - decaying
+
+def exponentialTangentFrames(mass_solve, K, F, dKs, ts, chunk=20):
+    """
+    Solves M dpsi/dt = F - K psi, psi(0) = 0, from the closed form together with
+    the derivatives of the solution with respect to each parameter of K, 
+    yielding both at each output time.
+    
+    With A = -M^-1 K, the decaying part e = exp(tA) psi_static and its 
+    derivatives de/dp solve the block triangular system
+
+        d/dt [e; de/dp] = [A, 0; -M^-1 dK/dp, A] [e; de/dp]
+
+    whose exponential is applied with expm_multiply as in exponentialFrames, and
+    dpsi/dp = dpsi_static/dp - de/dp with K dpsi_static/dp = -(dK/dp) psi_static.
+
+    Parameters:
+    mass_solve (MassSolver): Solver for the mass matrix, see massSolvers.py.
+    K (sp.spmatrix): The stiffness matrix.
+    F (np.ndarray): The force vector.
+    dKs (list): The derivatives of K with respect to each parameter.
+    ts (np.ndarray): Equally spaced output times.
+    chunk (int, optional): Number of output times per call of expm_multiply.
+                           Default is 20.
+
+    Yields:
+    tuple: The solution at ts[0], ts[1], ... and an (N_equations, len(dKs)) array
+           of its derivatives with respect to each parameter.
+    """
+    K = sp.csc_matrix(K)
+    N, p = K.shape[0], len(dKs)
+    with phase('factorise'):
+        lu = sp.linalg.splu(K)
+    psi_static = lu.solve(F)
+    dpsi_static = lu.solve(-np.column_stack([dK @ psi_static for dK in dKs]))
+    
+    def matvec(x):
+        count('expm_matvecs')
+        x = np.ravel(x)
+        e, de = x[:N], x[N:].reshape(p, N)
+        return np.concatenate([-mass_solve.solve(K @ e)] + 
+                              [-mass_solve.solve(dK @ e + K @ de_p) 
+                               for dK, de_p in zip(dKs, de)])
+    
+    def rmatvec(x):
+        Minv_x = [mass_solve.solve(x_p) for x_p in np.reshape(x, (p + 1, N))]
+        return -np.concatenate([K.T @ Minv_x[0] + sum(dK.T @ Minv_x_p for dK, Minv_x_p
+                                                      in zip(dKs, Minv_x[1:]))] +
+                               [K.T @ Minv_x_p for Minv_x_p in Minv_x[1:]])
+    
+    A = sp.linalg.LinearOperator(((p + 1)*N,)*2, matvec=matvec, rmatvec=rmatvec,
+                                 dtype=float)
+    traceA = -(p + 1)*np.sum(K.diagonal()/mass_solve.matrix.diagonal())
+    
+    def decay(v, t, num):
+        return sp.linalg.expm_multiply(A, v, start=0, stop=t, num=num,
+                                       endpoint=True, traceA=traceA)
+    
+    def frame(decaying):
+        return (psi_static - decaying[:N], 
+                dpsi_static - decaying[N:].reshape(p, N).T)
+    
+    decaying = np.concatenate([psi_static, dpsi_static.T.ravel()])
+    if ts[0] != 0:
+        decaying = decay(decaying, ts[0], 2)[-1]
+    yield frame(decaying)
+    for start in range(0, len(ts) - 1, chunk):
+        stop = min(start + chunk, len(ts) - 1)
+        decays = decay(decaying, ts[stop] - ts[start], stop - start + 1)
+        for decaying in decays[1:]:
+            yield frame(decaying)
+
+def exponentialIntegrate(mass_solve, K, F, ts, chunk=20):
+    """
+    Solves M dpsi/dt = F - K psi, psi(0) = 0, at equally spaced times from the
+    closed form, see exponentialFrames.
+
+    Returns:
+    np.ndarray: An (N_equations, len(ts)) array of solutions at the output times.
+    """
+    return np.column_stack(list(exponentialFrames(mass_solve, K, F, ts, chunk)))
+
+def rk45Frames(rhs, y0, ts, max_step=np.inf):
+    """
+    Integrates dy/dt = rhs(t, y) with RK45, stepping manually, and yields the
+    solution at each output time as soon as a step passes it, from that step's
+    dense output. This gives the same values as solve_ivp(..., dense_output=True)
+    without keeping every step's interpolant.
+
+    Parameters:
+    rhs (function): The right-hand side rhs(t, y).
+    y0 (np.ndarray): Initial data at ts[0].
+    ts (np.ndarray): Increasing output times.
+    max_step (float, optional): Largest step. Default is no limit.
+
+    Yields:
+    np.ndarray: The solution at ts[0], ts[1], ...
+    """
+    solver = integrate.RK45(rhs, ts[0], y0, ts[-1], max_step=max_step)
+    yield np.array(y0, dtype=float)
+    i = 1
+    while i < len(ts):
+        message = solver.step()
+        if solver.status == 'failed':
+            raise RuntimeError(f'RK45 failed: {message}')
+        dense = solver.dense_output()
+        while i < len(ts) and (ts[i] <= solver.t or solver.status == 'finished'):
+            yield dense(ts[i])
+            i += 1
@@ -373,29 +373,17 @@ def generate_2d_grid(Nx):
     nodes = np.zeros((Nnodes**2,2))
     nodes[:,0] = X.ravel()
     nodes[:,1] = Y.ravel()
-    ID = np.zeros(len(nodes), dtype=np.int64)
-    boundaries = dict()  # Will hold the boundary values
-    n_eq = 0
-    for nID in range(len(nodes)):
-        if np.allclose(nodes[nID, 0], 0):
-            ID[nID] = -1
-            boundaries[nID] = 0  # Dirichlet BC
-        else:
-            ID[nID] = n_eq
-            n_eq += 1
-            if ( (np.allclose(nodes[nID, 1], 0)) or 
-                 (np.allclose(nodes[nID, 0], 1)) or 
-                 (np.allclose(nodes[nID, 1], 1)) ):
-                boundaries[nID] = 0 # Neumann BC
+    # Dirichlet BC on the left edge, Neumann on the other three
+    dirichlet = np.isclose(nodes[:,0], 0)
+    neumann = np.isclose(nodes[:,1], 0) | np.isclose(nodes[:,0], 1) | np.isclose(nodes[:,1], 1)
+    ID = np.where(dirichlet, -1, np.cumsum(~dirichlet) - 1)
+    boundaries = dict.fromkeys(np.flatnonzero(dirichlet | neumann).tolist(), 0)
+    # two triangles per square, lower-left corner node (i, j)
+    i, j = np.meshgrid(np.arange(Nx), np.arange(Nx))
+    corner = (i + j*Nnodes).ravel()
     IEN = np.zeros((2*Nx**2, 3), dtype=np.int64)
-    for i in range(Nx):
-        for j in range(Nx):
-            IEN[2*i+2*j*Nx  , :] = (i+j*Nnodes, 
-                                    i+1+j*Nnodes, 
-                                    i+(j+1)*Nnodes)
-            IEN[2*i+1+2*j*Nx, :] = (i+1+j*Nnodes, 
-                                    i+1+(j+1)*Nnodes, 
-                                    i+(j+1)*Nnodes)
+    IEN[0::2, :] = np.column_stack((corner, corner+1, corner+Nnodes))
+    IEN[1::2, :] = np.column_stack((corner+1, corner+1+Nnodes, corner+Nnodes))
     return nodes, IEN, ID, boundaries
 
 def TwoDimStaticDiffusionFESolver(Ne, S):
@@ -413,34 +401,26 @@ def TwoDimStaticDiffusionFESolver(Ne, S):
     nodes = nodes.T
     
     # Location matrix
-    LM = np.zeros_like(IEN.T)
-    for e in range(N_elements):
-        for a in range(3):
-            LM[a,e] = ID[IEN[e,a]]
+    LM = ID[IEN].T
             
-    # Global stiffness matrix and force vector
-    K = sp.lil_matrix((N_equations, N_equations))
-    F = np.zeros((N_equations,))
-    # Loop over elements
-    for e in range(N_elements):
-        k_e = stiffness(nodes[:,IEN[e,:]])
-        f_e = force(nodes[:,IEN[e,:]], S)
-        for a in range(3):
-            A = LM[a, e]
-            for b in range(3):
-                B = LM[b, e]
-                if (A >= 0) and (B >= 0):
-                    K[A, B] += k_e[a, b]
-            if (A >= 0):
-                F[A] += f_e[a]
+    # Element contributions
+    k_es = np.array([stiffness(nodes[:,IEN[e,:]]) for e in range(N_elements)])
+    f_es = np.array([force(nodes[:,IEN[e,:]], S) for e in range(N_elements)])
+    
+    # Global stiffness matrix and force vector from (row, col, value) triplets,
+    # dropping the Dirichlet rows and columns
+    rows = np.broadcast_to(LM.T[:, :, None], k_es.shape)
+    cols = np.broadcast_to(LM.T[:, None, :], k_es.shape)
+    keep = (rows >= 0) & (cols >= 0)
+    K = sp.csr_matrix((k_es[keep], (rows[keep], cols[keep])), 
+                      shape=(N_equations, N_equations))
+    F = np.bincount(LM.T[LM.T >= 0], weights=f_es[LM.T >= 0], minlength=N_equations)
     
     # Solve
-    K = sp.csr_matrix(K)
     Psi_interior = sp.linalg.spsolve(K, F)
+    # homogeneous Dirichlet, so zero on the left edge
     Psi_A = np.zeros(N_nodes)
-    for n in range(N_nodes):
-        if ID[n] >= 0: # Otherwise, need to update Psi_A with dirichlet info - TODO
-            Psi_A[n] = Psi_interior[ID[n]]
+    Psi_A[ID >= 0] = Psi_interior[ID[ID >= 0]]
     return nodes, IEN, Psi_A
         
 def S1(x):